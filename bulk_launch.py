@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Launch a container pipeline across thousands of sessions, paced and tracked.
+
+BatchProcessingModal (and bulkLaunch in src/services/xnat-api.ts) posts
+every selected session in one bulklaunch request and forgets about it.
+This orchestrator drives the same endpoint from a ledger:
+
+    targets     sessions from an export_catalog.py catalog query (or a file
+                of experiment IDs), recorded once in a SQLite ledger
+    submit      size-limited bulklaunch batches, only while the number of
+                running containers for the wrapper is below a budget
+    record      container and workflow IDs from each launch report
+    reconcile   /xapi/containers is polled, with backoff while nothing
+                changes, until every launched container is terminal (or,
+                if it never appears there, until the grace period is over)
+
+A batch is marked 'submitting' in the ledger before its request is sent.
+If the run is interrupted between sending and recording, resuming looks
+for containers already created for those sessions before submitting them
+again, so nothing is launched twice. A batch the server refuses outright
+(a 4xx) is marked launch_failed with the response text instead; rerun
+with --retry-failed once the cause is fixed.
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+from container_logs import container_key, is_terminal
+from find_small_scan import login, password, username, xnat_server
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS run (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS targets (
+    experiment TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    batch INTEGER,
+    submitted_at REAL,
+    container_id TEXT,
+    workflow_id TEXT,
+    status TEXT,
+    message TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS targets_state ON targets (state, project);
+CREATE INDEX IF NOT EXISTS targets_container ON targets (container_id);
+CREATE INDEX IF NOT EXISTS targets_workflow ON targets (workflow_id);
+"""
+
+# Ledger states: pending -> submitting -> launched -> finished, or launch_failed
+STATES = ('pending', 'submitting', 'launched', 'finished', 'launch_failed')
+# Status of a launched target whose container never appeared in /xapi/containers
+UNLISTED_STATUS = 'Unknown (never listed)'
+
+
+def open_ledger(db_path: Path, wrapper_id: int, root_element: str, params: dict) -> sqlite3.Connection:
+    """
+    Open (creating if needed) a launch ledger.
+
+    A ledger belongs to one wrapper, root element and parameter set;
+    reopening it with different settings is refused rather than mixing two
+    runs' containers.
+    """
+    conn = sqlite3.connect(str(db_path))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    settings = {'wrapper_id': str(wrapper_id), 'root_element': root_element,
+                'params': json.dumps(params, sort_keys=True)}
+    stored = dict(conn.execute('SELECT key, value FROM run'))
+    if stored and stored != settings:
+        conn.close()
+        raise ValueError(f"{db_path} belongs to another launch ({stored}); use a new ledger")
+    with conn:
+        conn.executemany('INSERT OR IGNORE INTO run VALUES (?, ?)', settings.items())
+    return conn
+
+
+def add_targets(conn: sqlite3.Connection, targets) -> int:
+    """Record (project, experiment) targets; ones already in the ledger keep their state."""
+    before = conn.total_changes
+    with conn:
+        conn.executemany('INSERT OR IGNORE INTO targets (experiment, project) VALUES (?, ?)',
+                         ((experiment, project) for project, experiment in targets))
+    return conn.total_changes - before
+
+
+def iter_catalog_sessions(catalog_dir: Path, projects: list = None, modality: str = None,
+                          scan_type: str = None, since=None):
+    """
+    Yield (project, experiment) for sessions in an export_catalog.py catalog.
+
+    Args:
+        catalog_dir: Catalog root (project=<ID>/part-*.parquet or .arrow)
+        projects: Only these projects
+        modality: Only sessions of this modality (MR, CT, PET...)
+        scan_type: Only sessions with at least one scan of this type
+        since: Only sessions inserted at or after this time
+    """
+    import pyarrow.compute as pc
+
+    from export_catalog import open_catalog
+
+    dataset = open_catalog(catalog_dir)
+
+    condition = None
+    for clause in (
+        pc.field('project').isin(projects) if projects else None,
+        pc.field('modality') == modality.upper() if modality else None,
+        pc.field('scan_type') == scan_type if scan_type else None,
+        pc.field('insert_date') >= since if since is not None else None,
+    ):
+        if clause is not None:
+            condition = clause if condition is None else condition & clause
+
+    table = dataset.to_table(columns=['project', 'experiment'], filter=condition)
+    pairs = table.group_by(['project', 'experiment']).aggregate([])
+    yield from zip(pairs.column('project').to_pylist(), pairs.column('experiment').to_pylist())
+
+
+def session_uri(experiment: str) -> str:
+    return f'/archive/experiments/{experiment}'
+
+
+def experiment_from_params(params: dict) -> str:
+    """Find the experiment a launch report or container input refers to."""
+    for value in (params or {}).values():
+        text = str(value)
+        if '/experiments/' in text:
+            return text.split('/experiments/', 1)[1].split('/', 1)[0].strip('"[]')
+    return None
+
+
+def rejected(response) -> bool:
+    """Whether a failed launch request was refused outright (4xx other than timeouts and rate limiting)."""
+    return response is not None and 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+
+def container_experiment(container: dict) -> str:
+    """Experiment a container was launched on, from its inputs."""
+    inputs = container.get('inputs') or []
+    return experiment_from_params({i.get('name', n): i.get('value') for n, i in enumerate(inputs)
+                                   if isinstance(i, dict)})
+
+
+class BulkLauncher:
+    """
+    Submits ledger targets in batches and reconciles their containers.
+
+    Args:
+        session: Authenticated XNAT session
+        server: Base URL of the XNAT server
+        conn: Ledger opened with open_ledger
+        wrapper_id: Command wrapper to launch
+        root_element: Root element of the bulk launch ('session')
+        params: Extra launch inputs shared by every target
+        batch_size: Sessions per bulklaunch request
+        max_running: Running containers of this wrapper allowed at once
+        grace: Seconds an unconfirmed submission waits for its container
+            before it is treated as never launched, and a launched one
+            before it is finished with an unknown status
+    """
+
+    def __init__(self, session, server: str, conn: sqlite3.Connection, wrapper_id: int,
+                 root_element: str = 'session', params: dict = None, batch_size: int = 50, max_running: int = 100,
+                 min_poll: float = 10.0, max_poll: float = 120.0, grace: float = 600.0):
+        self.session = session
+        self.server = server
+        self.conn = conn
+        self.wrapper_id = wrapper_id
+        self.root_element = root_element
+        self.params = params or {}
+        self.batch_size = batch_size
+        self.max_running = max_running
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.grace = grace
+
+    # Server ----------------------------------------------------------------
+
+    def list_containers(self) -> list:
+        """This wrapper's containers, from one /xapi/containers listing."""
+        response = self.session.get(f'{self.server}/xapi/containers', params={'format': 'json'}, timeout=120)
+        response.raise_for_status()
+        data = response.json()
+        containers = data.get('items', []) if isinstance(data, dict) else data
+        # A container without a wrapper ID was not launched through any wrapper, so it is never this one's
+        return [c for c in containers
+                if c.get('wrapper-id') is not None and str(c['wrapper-id']) == str(self.wrapper_id)]
+
+    def submit(self, project: str, experiments: list) -> dict:
+        """Send one bulklaunch request; returns the XnatBulkLaunchReport-shaped response."""
+        url = (f'{self.server}/xapi/projects/{project}/wrappers/{self.wrapper_id}'
+               f'/root/{self.root_element}/bulklaunch')
+        payload = {self.root_element: json.dumps([session_uri(e) for e in experiments]),
+                   **{k: str(v) for k, v in self.params.items()}}
+        response = self.session.post(url, json=payload, timeout=300)
+        response.raise_for_status()
+        try:
+            return response.json() or {}
+        except ValueError:
+            return {}
+
+    # Ledger ----------------------------------------------------------------
+
+    def _update(self, experiment: str, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        self.conn.execute(f'UPDATE targets SET {assignments} WHERE experiment = ?', (*fields.values(), experiment))
+
+    def counts(self) -> dict:
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(self.conn.execute('SELECT state, COUNT(*) FROM targets GROUP BY state'))
+        counts['failed'] = self.conn.execute(
+            "SELECT COUNT(*) FROM targets WHERE state = 'finished' AND status NOT LIKE 'Complete%'").fetchone()[0]
+        return counts
+
+    def record_report(self, experiments: list, report: dict):
+        """Store container/workflow IDs and failures from a launch report; unmatched targets stay 'submitting'."""
+        single = experiments[0] if len(experiments) == 1 else None
+        with self.conn:
+            for success in report.get('successes') or []:
+                experiment = experiment_from_params(success.get('params')) or single
+                container_id = success.get('container-id') or success.get('containerId')
+                workflow_id = str(success.get('workflow-id') or success.get('workflowId') or '') or None
+                if experiment not in experiments or not (container_id or workflow_id):
+                    continue  # left 'submitting' for recover() to match from the listing
+                self._update(experiment, state='launched', container_id=container_id, workflow_id=workflow_id)
+            for failure in report.get('failures') or []:
+                experiment = experiment_from_params(failure.get('params')) or single
+                if experiment not in experiments:
+                    continue
+                self._update(experiment, state='launch_failed', message=failure.get('message'))
+
+    def recover(self, containers: list) -> int:
+        """
+        Resolve targets left 'submitting' by an interrupted run.
+
+        A target whose container exists (created after the batch was sent) is
+        marked launched. Targets without one go back to pending only after
+        the grace period, since queued launches can take a while to show
+        up in the container listing.
+        """
+        stuck = dict(self.conn.execute("SELECT experiment, submitted_at FROM targets WHERE state = 'submitting'"))
+        if not stuck:
+            return 0
+        claimed = {row[0] for row in self.conn.execute('SELECT container_id FROM targets WHERE container_id IS NOT NULL')}
+        adopted = 0
+        with self.conn:
+            for container in containers:
+                experiment = container_experiment(container)
+                key = container_key(container)
+                if experiment not in stuck or key in claimed:
+                    continue
+                created = _epoch(container.get('created'))
+                if created is not None and created < stuck[experiment] - 300:
+                    continue  # an earlier run's container on the same session
+                self._update(experiment, state='launched', container_id=key,
+                             workflow_id=str(container.get('workflow-id') or '') or None,
+                             status=container.get('status'))
+                claimed.add(key)
+                stuck.pop(experiment)
+                adopted += 1
+            expired = time.time() - self.grace
+            for experiment, submitted_at in stuck.items():
+                if submitted_at is None or submitted_at < expired:
+                    self._update(experiment, state='pending', batch=None, submitted_at=None)
+        return adopted
+
+    def reconcile(self, containers: list) -> int:
+        """Copy container statuses into the ledger; returns the number of rows that changed."""
+        by_container = {str(c.get('id')): c for c in containers if c.get('id') is not None}
+        by_container.update({c['container-id']: c for c in containers if c.get('container-id')})
+        by_workflow = {str(c['workflow-id']): c for c in containers if c.get('workflow-id')}
+
+        changed = 0
+        rows = self.conn.execute("SELECT experiment, container_id, workflow_id, status FROM targets "
+                                 "WHERE state = 'launched'").fetchall()
+        with self.conn:
+            for experiment, container_id, workflow_id, status in rows:
+                container = by_container.get(container_id) or by_workflow.get(workflow_id)
+                if container is None:
+                    continue
+                new_status = container.get('status')
+                key = container_key(container)
+                if new_status == status and key == container_id:
+                    continue
+                terminal = is_terminal(new_status)
+                self._update(experiment, container_id=key, status=new_status,
+                             state='finished' if terminal else 'launched')
+                changed += 1
+                if terminal and not str(new_status).lower().startswith('complete'):
+                    print(f"✗ {experiment}: {new_status}")
+
+            # A reported launch whose container never showed up in the listing would keep run(wait=True) polling
+            expired = time.time() - self.grace
+            for experiment, in self.conn.execute(
+                    "SELECT experiment FROM targets WHERE state = 'launched' AND status IS NULL "
+                    "AND submitted_at < ?", (expired,)).fetchall():
+                self._update(experiment, state='finished', status=UNLISTED_STATUS,
+                             message=f'container not listed within {self.grace:.0f}s of launch')
+                changed += 1
+                print(f"✗ {experiment}: {UNLISTED_STATUS}")
+        return changed
+
+    # Driver ----------------------------------------------------------------
+
+    def _next_batch(self, limit: int):
+        row = self.conn.execute("SELECT project FROM targets WHERE state = 'pending' LIMIT 1").fetchone()
+        if row is None:
+            return None, []
+        experiments = [e for e, in self.conn.execute(
+            "SELECT experiment FROM targets WHERE state = 'pending' AND project = ? ORDER BY experiment LIMIT ?",
+            (row[0], limit))]
+        return row[0], experiments
+
+    def run(self, wait: bool = True) -> dict:
+        """
+        Submit every pending target and (with wait) follow them to completion.
+
+        Returns:
+            Ledger counts by state, plus 'failed' for finished non-Complete containers
+        """
+        poll = self.min_poll
+        batch_number = (self.conn.execute('SELECT MAX(batch) FROM targets').fetchone()[0] or 0)
+        while True:
+            try:
+                containers = self.list_containers()
+            except (requests.RequestException, ValueError) as e:
+                print(f"⚠ Container listing failed: {e}")
+                time.sleep(poll)
+                poll = min(self.max_poll, poll * 2)
+                continue
+
+            adopted = self.recover(containers)
+            if adopted:
+                print(f"  Matched {adopted:,} unconfirmed submissions to their containers")
+            changed = self.reconcile(containers) + adopted
+            running = sum(not is_terminal(c.get('status')) for c in containers)
+            # Launched targets may not be listed yet; count whichever view is larger
+            in_flight = self.conn.execute(
+                "SELECT COUNT(*) FROM targets WHERE state IN ('submitting', 'launched')").fetchone()[0]
+            budget = self.max_running - max(running, in_flight)
+
+            submitted = 0
+            while budget > 0:
+                project, experiments = self._next_batch(min(self.batch_size, budget))
+                if not experiments:
+                    break
+                batch_number += 1
+                now = time.time()
+                with self.conn:
+                    self.conn.executemany(
+                        "UPDATE targets SET state = 'submitting', batch = ?, submitted_at = ?, updated_at = ? "
+                        "WHERE experiment = ?", [(batch_number, now, now, e) for e in experiments])
+                try:
+                    report = self.submit(project, experiments)
+                except requests.HTTPError as e:
+                    if not rejected(e.response):
+                        print(f"⚠ Batch {batch_number} ({project}, {len(experiments)} sessions) failed: {e}")
+                        break
+                    # Nothing was launched and resending the same request would be refused again
+                    message = f'HTTP {e.response.status_code}: {e.response.text[:500]}'
+                    with self.conn:
+                        for experiment in experiments:
+                            self._update(experiment, state='launch_failed', message=message)
+                    print(f"✗ Batch {batch_number} ({project}, {len(experiments)} sessions) rejected: {message}")
+                    continue
+                except requests.RequestException as e:
+                    # The server may still have accepted it; recover() decides once the grace period is over
+                    print(f"⚠ Batch {batch_number} ({project}, {len(experiments)} sessions) failed: {e}")
+                    break
+                self.record_report(experiments, report)
+                submitted += len(experiments)
+                budget -= len(experiments)
+
+            counts = self.counts()
+            print(f"  {running:,} running, {counts['pending']:,} pending, {counts['launched'] + counts['submitting']:,} "
+                  f"in flight, {counts['finished']:,} finished ({counts['failed']:,} failed), "
+                  f"{counts['launch_failed']:,} launch failures")
+
+            if not counts['pending'] and (not wait or not (counts['submitting'] or counts['launched'])):
+                return counts
+            # Poll quickly while things are moving, back off while they are not
+            poll = self.min_poll if (changed or submitted) else min(self.max_poll, poll * 1.5)
+            time.sleep(poll)
+
+
+def _epoch(value):
+    """Container timestamps arrive as epoch milliseconds or ISO strings."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else value
+    from export_catalog import parse_timestamp
+    parsed = parse_timestamp(str(value))
+    return parsed.timestamp() if parsed else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Launch a container wrapper across many sessions, paced and tracked.')
+    parser.add_argument('--wrapper', type=int, required=True, help='Command wrapper ID')
+    parser.add_argument('--ledger', required=True, help='SQLite ledger (reuse it to resume)')
+    parser.add_argument('--catalog', help='export_catalog.py catalog to select sessions from')
+    parser.add_argument('--targets', help='File of "PROJECT EXPERIMENT_ID" lines')
+    parser.add_argument('--project', action='append', dest='projects', help='Catalog filter (repeatable)')
+    parser.add_argument('--modality', help='Catalog filter, e.g. MR')
+    parser.add_argument('--scan-type', help='Catalog filter: sessions with a scan of this type')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE', help='Launch input (repeatable)')
+    parser.add_argument('--root-element', default='session')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--max-running', type=int, default=100, help='Running containers allowed at once')
+    parser.add_argument('--retry-failed', action='store_true', help='Resubmit targets whose launch was rejected')
+    parser.add_argument('--no-wait', action='store_true', help='Exit once everything is submitted')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    args = parser.parse_args(argv)
+
+    params = dict(item.split('=', 1) for item in args.param)
+    try:
+        conn = open_ledger(Path(args.ledger), args.wrapper, args.root_element, params)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if args.catalog:
+        added = add_targets(conn, iter_catalog_sessions(Path(args.catalog), args.projects, args.modality,
+                                                        args.scan_type))
+        print(f"  {added:,} new targets from {args.catalog}")
+    if args.targets:
+        with open(args.targets) as f:
+            added = add_targets(conn, (line.split()[:2] for line in f if len(line.split()) >= 2))
+        print(f"  {added:,} new targets from {args.targets}")
+    if args.retry_failed:
+        with conn:
+            conn.execute("UPDATE targets SET state = 'pending', message = NULL WHERE state = 'launch_failed'")
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    launcher = BulkLauncher(session, args.server, conn, args.wrapper, args.root_element, params,
+                            args.batch_size, args.max_running)
+    try:
+        counts = launcher.run(wait=not args.no_wait)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with the same --ledger to resume")
+        sys.exit(130)
+    print(f"✓ {counts['finished'] - counts['failed']:,} complete, {counts['failed']:,} failed, "
+          f"{counts['launch_failed']:,} not launched, {counts['launched']:,} still running")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Follow stdout/stderr of many XNAT containers at once.
+
+ContainerLogViewer and WorkflowContainerLogs poll one container every few
+seconds; watching a 500-container bulk run that way means 1000 full log
+fetches per interval. This tailer multiplexes every stream on one asyncio
+loop instead:
+
+    - each stream keeps its own `since` cursor and asks
+      /xapi/containers/{id}/logSince/{type} only for the delta, falling back
+      to the full /logs/{type} (diffed by offset) on servers without it
+    - a stream that produced output is polled again at the minimum
+      interval; idle streams back off towards the maximum
+    - containers are discovered and their status refreshed with one
+      /xapi/containers listing, not one request per container
+    - finished containers get a final fetch and are dropped
+    - output goes to <out-dir>/<container>/<type>.log, rotated by size,
+      with the stream's cursor saved beside it in <type>.cursor so a
+      restarted tailer resumes where it stopped instead of logging the
+      same output twice
+
+Requests go through the shared ThrottledSession, so the xapi class limit
+still backs off when the server is under load.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from find_small_scan import format_bytes, login, password, username, xnat_server
+
+LOG_TYPES = ('stdout', 'stderr')
+TERMINAL_PREFIXES = ('complete', 'failed', 'killed', 'done')
+
+
+def is_terminal(status) -> bool:
+    """True for container statuses that will not produce more output ('Failed (staging)' included)."""
+    return str(status or '').strip().lower().startswith(TERMINAL_PREFIXES)
+
+
+def container_key(container: dict) -> str:
+    """Identifier used in log URLs: the service's numeric id, else the Docker container id."""
+    key = container.get('id')
+    if key is None or key == '':
+        key = container.get('container-id') or ''
+    return str(key)
+
+
+def parse_log_payload(payload, since: str = None):
+    """
+    Read a logSince or logs response the way getContainerLogs does.
+
+    Returns:
+        (content, timestamp) where timestamp is the next cursor, or the
+        previous one if the server did not send one
+    """
+    content, timestamp = '', None
+    if isinstance(payload, str):
+        content = payload
+    elif isinstance(payload, dict):
+        raw = payload.get('content', payload.get('log', payload.get('message')))
+        if isinstance(raw, str):
+            content = raw
+        elif isinstance(raw, list):
+            content = '\n'.join(line for line in raw if isinstance(line, str))
+        if not content and isinstance(payload.get('lines'), list):
+            content = '\n'.join(line for line in payload['lines'] if isinstance(line, str))
+        if isinstance(payload.get('timestamp'), (str, int, float)) and not isinstance(payload['timestamp'], bool):
+            timestamp = str(payload['timestamp'])
+    return content, timestamp if timestamp is not None else since
+
+
+class RotatingLog:
+    """
+    Append-only log file rotated to .1 ... .N once it reaches max_bytes.
+
+    The file is opened per write so that following thousands of streams
+    does not hold thousands of descriptors.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 10 * 1024 ** 2, backups: int = 3):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.size = self.path.stat().st_size if self.path.exists() else 0
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f'{self.path.name}.{i}')
+            if older.exists():
+                os.replace(older, self.path.with_name(f'{self.path.name}.{i + 1}'))
+        if self.backups:
+            os.replace(self.path, self.path.with_name(f'{self.path.name}.1'))
+        else:
+            self.path.unlink()
+        self.size = 0
+
+    def truncate(self):
+        """Remove the log and its rotated copies."""
+        for i in range(self.backups, 0, -1):
+            self.path.with_name(f'{self.path.name}.{i}').unlink(missing_ok=True)
+        self.path.unlink(missing_ok=True)
+        self.size = 0
+
+    def write(self, text: str):
+        data = text.encode('utf-8', 'replace')
+        if self.size and self.size + len(data) > self.max_bytes:
+            self._rotate()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(data)
+        self.size += len(data)
+
+
+class LogStream:
+    """Cursor and polling state for one container's stdout or stderr."""
+
+    def __init__(self, container_id: str, log_type: str, log: RotatingLog, interval: float):
+        self.container_id = container_id
+        self.log_type = log_type
+        self.log = log
+        self.cursor = '-1'  # what WorkflowContainerLogs sends for "from the beginning"
+        self.offset = 0  # characters already written, for the full-log fallback
+        self.since_supported = True
+        self.interval = interval
+        self.ends_with_newline = True
+
+    @property
+    def state_path(self) -> Path:
+        return self.log.path.with_suffix('.cursor')
+
+    def load_state(self) -> bool:
+        """Resume from the cursor a previous run saved beside the log; False if there is none."""
+        try:
+            state = json.loads(self.state_path.read_text())
+            self.cursor, self.offset = str(state['cursor']), int(state['offset'])
+            self.since_supported = bool(state['since_supported'])
+            self.ends_with_newline = bool(state['ends_with_newline'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def save_state(self):
+        state = {'cursor': self.cursor, 'offset': self.offset, 'since_supported': self.since_supported,
+                 'ends_with_newline': self.ends_with_newline}
+        temp = self.state_path.with_name(self.state_path.name + '.tmp')
+        temp.write_text(json.dumps(state))
+        os.replace(temp, self.state_path)
+
+
+class LogTailer:
+    """
+    Tails every running container's logs on one event loop.
+
+    Blocking requests run on a small thread pool; the event loop only
+    schedules them, so idle streams cost a sleeping task rather than a
+    thread.
+    """
+
+    def __init__(self, session, server: str, out_dir: Path, project: str = None, min_interval: float = 2.0,
+                 max_interval: float = 60.0, backoff: float = 1.5, discover_interval: float = 15.0,
+                 concurrency: int = 16, max_bytes: int = 10 * 1024 ** 2, backups: int = 3):
+        self.session = session
+        self.server = server
+        self.out_dir = Path(out_dir)
+        self.project = project
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.discover_interval = discover_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='logs')
+        self.status = {}
+        self.tasks = {}
+        self.done = set()
+        self.stats = {'requests': 0, 'deltas': 0, 'bytes': 0, 'errors': 0, 'finished': 0}
+
+    async def _call(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        self.stats['requests'] += 1
+        return await loop.run_in_executor(self.executor, lambda: method(*args, **kwargs))
+
+    # Discovery -----------------------------------------------------------
+
+    async def refresh(self, container_ids=None) -> list:
+        """Refresh container statuses from one listing; return keys of containers not yet followed."""
+        try:
+            response = await self._call(self.session.get, f'{self.server}/xapi/containers',
+                                        params={'format': 'json'}, timeout=30)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            self.stats['errors'] += 1
+            print(f"⚠ Container listing failed: {e}")
+            return []
+
+        containers = data.get('items', []) if isinstance(data, dict) else data
+        new = []
+        for container in containers:
+            key = container_key(container)
+            if not key or (container_ids and key not in container_ids
+                           and container.get('container-id') not in container_ids):
+                continue
+            if self.project and self.project not in (container.get('project-id'), container.get('project')):
+                continue
+            self.status[key] = container.get('status')
+            if key in self.tasks or key in self.done:
+                continue
+            # Explicitly named containers are fetched even if already finished
+            if container_ids or not is_terminal(container.get('status')):
+                new.append(key)
+        return new
+
+    # Streams -------------------------------------------------------------
+
+    async def fetch(self, stream: LogStream) -> str:
+        """Fetch what the stream has produced since its cursor."""
+        base = f'{self.server}/xapi/containers/{stream.container_id}'
+        if stream.since_supported:
+            response = await self._call(self.session.get, f'{base}/logSince/{stream.log_type}',
+                                        params={'format': 'json', 'timestamp': stream.cursor}, timeout=60)
+            if response.status_code in (404, 410):
+                stream.since_supported = False
+            else:
+                response.raise_for_status()
+                try:
+                    payload = response.json()
+                except ValueError:
+                    payload = response.text
+                content, stream.cursor = parse_log_payload(payload, stream.cursor)
+                return content
+
+        response = await self._call(self.session.get, f'{base}/logs/{stream.log_type}', timeout=60)
+        if response.status_code == 404:
+            return ''
+        response.raise_for_status()
+        content, _ = parse_log_payload(response.text)
+        if len(content) < stream.offset:
+            stream.offset = 0  # log was truncated or restarted
+        delta = content[stream.offset:]
+        stream.offset = len(content)
+        return delta
+
+    def _write(self, stream: LogStream, content: str):
+        # Deltas are line batches without a guaranteed trailing newline, as the viewer assumes
+        if not stream.ends_with_newline and not content.startswith('\n'):
+            content = '\n' + content
+        stream.log.write(content)
+        stream.ends_with_newline = content.endswith('\n')
+        stream.save_state()
+        self.stats['deltas'] += 1
+        self.stats['bytes'] += len(content)
+
+    async def follow(self, stream: LogStream):
+        """Poll one stream until its container has finished and a final fetch came back empty."""
+        await asyncio.sleep(random.uniform(0, self.min_interval))  # spread the first wave
+        while True:
+            finished = is_terminal(self.status.get(stream.container_id))
+            position = stream.cursor, stream.offset
+            try:
+                content = await self.fetch(stream)
+            except (requests.RequestException, ValueError) as e:
+                self.stats['errors'] += 1
+                content = ''
+                if finished:
+                    print(f"⚠ {stream.container_id}/{stream.log_type}: final fetch failed: {e}")
+                    return
+            if content:
+                try:
+                    self._write(stream, content)
+                except OSError as e:
+                    # Fetch the same delta again next time; one full disk must not stop the other containers
+                    self.stats['errors'] += 1
+                    stream.cursor, stream.offset = position
+                    print(f"⚠ {stream.container_id}/{stream.log_type}: writing the log failed: {e}")
+                    if finished:
+                        return
+                    stream.interval = self.max_interval
+                    await asyncio.sleep(stream.interval)
+                    continue
+                stream.interval = self.min_interval
+            else:
+                if finished:
+                    return
+                stream.interval = min(self.max_interval, stream.interval * self.backoff)
+            await asyncio.sleep(stream.interval * random.uniform(0.8, 1.2))
+
+    async def _follow_container(self, key: str):
+        streams = [LogStream(key, log_type, RotatingLog(self.out_dir / key / f'{log_type}.log', self.max_bytes,
+                                                        self.backups), self.min_interval)
+                   for log_type in LOG_TYPES]
+        for stream in streams:
+            if not stream.load_state():
+                # No saved cursor: the stream is read from the beginning, so whatever was logged before goes
+                try:
+                    stream.log.truncate()
+                except OSError as e:
+                    print(f"⚠ {key}/{stream.log_type}: clearing the previous log failed: {e}")
+        await asyncio.gather(*(self.follow(stream) for stream in streams))
+        self.stats['finished'] += 1
+        print(f"✓ {key} {self.status.get(key) or ''}".rstrip())
+
+    async def run(self, container_ids=None, until_done: bool = False, report_interval: float = 60.0):
+        """
+        Follow containers until interrupted (or, with until_done, until all have finished).
+
+        Args:
+            container_ids: Only these containers (default: every running container)
+            until_done: Return once no followed or newly listed container is still running
+            report_interval: Seconds between progress lines
+        """
+        container_ids = set(container_ids or ())
+        last_report = time.monotonic()
+        try:
+            while True:
+                for key in await self.refresh(container_ids):
+                    self.tasks[key] = asyncio.create_task(self._follow_container(key))
+                for key in [k for k, task in self.tasks.items() if task.done()]:
+                    self.tasks.pop(key).result()
+                    self.done.add(key)
+
+                if time.monotonic() - last_report >= report_interval:
+                    last_report = time.monotonic()
+                    print(f"  {len(self.tasks):,} containers followed, {self.stats['requests']:,} requests, "
+                          f"{format_bytes(self.stats['bytes'])} logged, {self.stats['errors']:,} errors")
+                if until_done and not self.tasks:
+                    return self.stats
+                await asyncio.sleep(self.discover_interval)
+        finally:
+            for task in self.tasks.values():
+                task.cancel()
+            self.executor.shutdown(wait=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tail stdout/stderr of many XNAT containers into local files.')
+    parser.add_argument('containers', nargs='*', help='Container ids (default: every running container)')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    parser.add_argument('--project', help='Only containers launched in this project')
+    parser.add_argument('--out-dir', default='container-logs')
+    parser.add_argument('--min-interval', type=float, default=2.0, help='Poll interval for active streams (s)')
+    parser.add_argument('--max-interval', type=float, default=60.0, help='Poll interval idle streams back off to (s)')
+    parser.add_argument('--discover-interval', type=float, default=15.0, help='Container listing refresh (s)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Log requests in flight')
+    parser.add_argument('--max-mb', type=float, default=10, help='Rotate a log file at this size')
+    parser.add_argument('--backups', type=int, default=3, help='Rotated files kept per log')
+    parser.add_argument('--until-done', action='store_true', help='Exit when every followed container has finished')
+    args = parser.parse_args(argv)
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    tailer = LogTailer(session, args.server, Path(args.out_dir), args.project, args.min_interval,
+                       args.max_interval, discover_interval=args.discover_interval, concurrency=args.concurrency,
+                       max_bytes=int(args.max_mb * 1024 ** 2), backups=args.backups)
+    print(f"Following container logs into {args.out_dir}/ (Ctrl-C to stop)")
+    try:
+        stats = asyncio.run(tailer.run(args.containers, args.until_done))
+    except KeyboardInterrupt:
+        stats = tailer.stats
+    print(f"✓ {stats['finished']:,} containers finished, {stats['requests']:,} requests, "
+          f"{format_bytes(stats['bytes'])} logged")
+
+
+if __name__ == '__main__':
+    main()
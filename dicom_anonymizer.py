@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Batch DICOM anonymizer for bulk migrations.
+
+Server-side counterpart of DicomAnonymizer.anonymizeFiles in
+src/services/dicom-anonymizer.ts: the same default script and Basic
+Profile tag list, compiled once per worker by dicomedit.py and applied
+with pydicom across a process pool.
+
+Each file is parsed once, and only up to its pixel data: rules are applied
+to the header, each change is recorded as it is made (no re-parse of the
+output to diff it), the header is written, and the pixel data and anything
+after it are copied through unparsed. Per-file results stream to a JSON
+Lines manifest whose records use the AnonymizationChange field names.
+
+Requires pydicom.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from dicomedit import RulePlan, compile_script, element_text
+
+DEFAULT_ANONYMIZATION_SCRIPT = '''
+version "6.3"
+
+// Patient Module - Remove identifying information
+(0010,0030) := ""                    // Patient Birth Date
+(0010,0032) := ""                    // Patient Birth Time
+(0010,1000) := ""                    // Other Patient IDs
+(0010,1001) := ""                    // Other Patient Names
+(0010,1040) := ""                    // Patient Address
+(0010,1060) := ""                    // Patient Mother's Birth Name
+(0010,2154) := ""                    // Patient Telephone Numbers
+(0010,2160) := ""                    // Patient Ethnic Group
+(0010,21B0) := ""                    // Additional Patient History
+
+// Institution Module - Remove identifying information
+(0008,0080) := ""                    // Institution Name
+(0008,0081) := ""                    // Institution Address
+(0008,1040) := ""                    // Institutional Department Name
+(0008,1070) := ""                    // Operators Name
+
+// Physician Module - Remove identifying information
+(0008,0090) := ""                    // Referring Physician Name
+(0008,1048) := ""                    // Physician(s) of Record
+(0008,1050) := ""                    // Performing Physician's Name
+(0008,1060) := ""                    // Name of Physician(s) Reading Study
+'''
+
+# DICOM PS3.15 Annex E Basic Application Level Confidentiality Profile: (tag, name, action)
+BASIC_PROFILE_TAGS = [
+    ('00080012', 'Instance Creation Date', 'REMOVE'),
+    ('00080013', 'Instance Creation Time', 'REMOVE'),
+    ('00080050', 'Accession Number', 'REMOVE'),
+    ('00080080', 'Institution Name', 'REMOVE'),
+    ('00080081', 'Institution Address', 'REMOVE'),
+    ('00080090', 'Referring Physician Name', 'REMOVE'),
+    ('00081010', 'Station Name', 'REMOVE'),
+    ('00081030', 'Study Description', 'REMOVE'),
+    ('00081040', 'Institutional Department Name', 'REMOVE'),
+    ('00081048', 'Physician(s) of Record', 'REMOVE'),
+    ('00081050', 'Performing Physician Name', 'REMOVE'),
+    ('00081060', 'Name of Physician(s) Reading Study', 'REMOVE'),
+    ('00081070', 'Operators Name', 'REMOVE'),
+    ('00100010', 'Patient Name', 'REMOVE'),
+    ('00100020', 'Patient ID', 'REMOVE'),
+    ('00100030', 'Patient Birth Date', 'REMOVE'),
+    ('00100032', 'Patient Birth Time', 'REMOVE'),
+    ('00101000', 'Other Patient IDs', 'REMOVE'),
+    ('00101001', 'Other Patient Names', 'REMOVE'),
+    ('00101010', 'Patient Age', 'REMOVE'),
+    ('00101020', 'Patient Size', 'REMOVE'),
+    ('00101030', 'Patient Weight', 'REMOVE'),
+    ('00101040', 'Patient Address', 'REMOVE'),
+    ('00102154', 'Patient Telephone Numbers', 'REMOVE'),
+    ('00104000', 'Patient Comments', 'REMOVE'),
+    ('00181000', 'Device Serial Number', 'REMOVE'),
+    ('00181030', 'Protocol Name', 'REMOVE'),
+    ('00204000', 'Image Comments', 'REMOVE'),
+    ('00321032', 'Requesting Physician', 'REMOVE'),
+    ('00324000', 'Study Comments', 'REMOVE'),
+    ('00080020', 'Study Date', 'MODIFY'),
+    ('00080021', 'Series Date', 'MODIFY'),
+    ('00080022', 'Acquisition Date', 'MODIFY'),
+    ('00080023', 'Content Date', 'MODIFY'),
+    ('00080030', 'Study Time', 'MODIFY'),
+    ('00080031', 'Series Time', 'MODIFY'),
+    ('00080032', 'Acquisition Time', 'MODIFY'),
+    ('00080033', 'Content Time', 'MODIFY'),
+]
+
+DEFLATED_TRANSFER_SYNTAX = '1.2.840.10008.1.2.1.99'
+
+
+def customize_script(script: str, patient_name: str = None, patient_id: str = None) -> str:
+    """Substitute a patient name/ID into the placeholder assignments, as the web anonymizer does."""
+    if patient_name:
+        script = script.replace('(0010,0010) := "ANONYMOUS"', f'(0010,0010) := "{patient_name}"')
+    if patient_id:
+        script = script.replace('(0010,0020) := "ANON_ID"', f'(0010,0020) := "{patient_id}"')
+    return script
+
+
+def basic_profile_values(ds, file_name: str) -> list:
+    """Values present for the Basic Profile tags, read before anonymization."""
+    values = []
+    for hex_tag, name, _ in BASIC_PROFILE_TAGS:
+        value = element_text(ds.get(int(hex_tag, 16)))
+        if value:
+            values.append({'tag': f'({hex_tag[:4]},{hex_tag[4:]})', 'tagName': name, 'value': value,
+                           'fileName': file_name})
+    return values
+
+
+def anonymize_file(source: Path, destination: Path, plan: RulePlan, file_name: str,
+                   extract_basic_profile: bool = False, variables: dict = None) -> dict:
+    """
+    Anonymize one file.
+
+    The header is parsed up to the pixel data and the remainder of the file
+    is copied byte for byte. Deflated transfer syntaxes and plans that can
+    touch elements after the pixel data fall back to a full parse.
+
+    Returns:
+        A manifest record: fileName, changes, warnings and (optionally)
+        basicProfileTagValues
+    """
+    import pydicom
+
+    record = {'fileName': file_name, 'changes': [], 'warnings': []}
+    header_only = plan.header_only
+
+    with open(source, 'rb') as src:
+        ds = pydicom.dcmread(src, stop_before_pixels=header_only)
+        if header_only and str(ds.file_meta.get('TransferSyntaxUID', '')) == DEFLATED_TRANSFER_SYNTAX:
+            src.seek(0)
+            ds = pydicom.dcmread(src)
+            header_only = False
+        tail = src.tell()
+
+        if extract_basic_profile:
+            record['basicProfileTagValues'] = basic_profile_values(ds, file_name)
+        record['changes'] = plan.apply(ds, file_name, variables)
+
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        with open(destination, 'wb') as dst:
+            ds.save_as(dst)
+            if header_only:
+                src.seek(tail)
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+    return record
+
+
+_worker_plan = None
+_worker_variables = None
+
+
+def _init_worker(script: str, variables: dict):
+    # Plans hold closures and are not picklable; each worker compiles the script once
+    global _worker_plan, _worker_variables
+    _worker_plan = compile_script(script)
+    _worker_variables = variables
+
+
+def _anonymize_job(job):
+    source, destination, file_name, extract_basic_profile = job
+    try:
+        return anonymize_file(Path(source), Path(destination), _worker_plan, file_name, extract_basic_profile,
+                              _worker_variables)
+    except Exception as e:
+        return {'fileName': file_name, 'changes': [], 'warnings': [f'Failed to anonymize {file_name}: {e}'],
+                'failed': True}
+
+
+def _anonymize_batch(jobs: list) -> list:
+    return [_anonymize_job(job) for job in jobs]
+
+
+def iter_files(root: Path):
+    """Walk a directory tree lazily, yielding file paths (hidden files skipped)."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    yield Path(entry.path)
+
+
+def anonymize_tree(source: Path, destination: Path, script: str = DEFAULT_ANONYMIZATION_SCRIPT,
+                   manifest_path: Path = None, workers: int = None, extract_basic_profile: bool = False,
+                   variables: dict = None, chunksize: int = 64, window: int = None) -> dict:
+    """
+    Anonymize every file under source into the same layout under destination.
+
+    Args:
+        source: Input directory
+        destination: Output directory
+        script: DicomEdit script (the subset compiled by dicomedit.py)
+        manifest_path: JSON Lines manifest, one record per file (None to skip)
+        workers: Worker processes (default: CPU count)
+        extract_basic_profile: Record Basic Profile tag values found in each file
+        variables: Script variables such as project, subject and session
+        chunksize: Files handed to a worker at a time
+        window: Batches in flight at once (default: two per worker)
+
+    Returns:
+        Counts of files, failures and changes
+    """
+    compile_script(script)  # fail fast on syntax errors before starting workers
+    jobs = ((str(path), str(destination / path.relative_to(source)), str(path.relative_to(source)),
+             extract_basic_profile) for path in iter_files(source))
+    batches = iter(lambda: list(islice(jobs, chunksize)), [])
+    window = window or 2 * (workers or os.cpu_count() or 1)
+    counts = {'files': 0, 'failed': 0, 'changes': 0}
+    started = time.monotonic()
+
+    manifest = open(manifest_path, 'w') if manifest_path else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(script, variables or {})) as pool:
+            # The tree is walked only as far as the window reaches, so a huge tree is never queued up front
+            pending = deque()
+
+            def fill():
+                for batch in batches:
+                    pending.append(pool.submit(_anonymize_batch, batch))
+                    if len(pending) >= window:
+                        break
+
+            fill()
+            while pending:
+                records = pending.popleft().result()
+                fill()
+                for record in records:
+                    counts['files'] += 1
+                    counts['failed'] += record.pop('failed', False)
+                    counts['changes'] += len(record['changes'])
+                    if manifest:
+                        manifest.write(json.dumps(record) + '\n')
+                    if counts['files'] % 10000 == 0:
+                        rate = counts['files'] / (time.monotonic() - started)
+                        print(f"  {counts['files']:,} files ({rate:,.0f}/s)")
+    finally:
+        if manifest:
+            manifest.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Anonymize a tree of DICOM files with a DicomEdit script.')
+    parser.add_argument('source', help='Input directory')
+    parser.add_argument('destination', help='Output directory (same layout)')
+    parser.add_argument('--script', help='DicomEdit script file (default: built-in profile script)')
+    parser.add_argument('--patient-name', help='Value for a (0010,0010) := "ANONYMOUS" placeholder')
+    parser.add_argument('--patient-id', help='Value for a (0010,0020) := "ANON_ID" placeholder')
+    parser.add_argument('--manifest', default='anonymization-manifest.jsonl')
+    parser.add_argument('--var', action='append', default=[], metavar='NAME=VALUE',
+                        help='Script variable, e.g. project=P1 (repeatable)')
+    parser.add_argument('--basic-profile', action='store_true', help='Record Basic Profile tag values per file')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    source, destination = Path(args.source), Path(args.destination)
+    if not source.is_dir():
+        print(f"Error: Directory {source} does not exist")
+        sys.exit(1)
+
+    script = Path(args.script).read_text() if args.script else DEFAULT_ANONYMIZATION_SCRIPT
+    script = customize_script(script, args.patient_name, args.patient_id)
+    try:
+        compile_script(script)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    variables = dict(item.split('=', 1) for item in args.var)
+    started = time.monotonic()
+    counts = anonymize_tree(source, destination, script, Path(args.manifest), args.workers, args.basic_profile,
+                            variables)
+    elapsed = time.monotonic() - started
+    print(f"✓ {counts['files'] - counts['failed']:,}/{counts['files']:,} files anonymized, "
+          f"{counts['changes']:,} changes in {elapsed:.1f}s; manifest: {args.manifest}")
+
+
+if __name__ == '__main__':
+    main()
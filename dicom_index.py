@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Index an unsorted DICOM drop into a study/series/instance hierarchy in SQLite.
+
+Headers are read in a process pool, up to the pixel data and only for the
+tags we keep, and written to one SQLite database by a single writer in
+batched transactions. Sorting a drop into studies and series, finding
+duplicate SOP instances and cutting per-series upload batches then become
+queries instead of re-reads:
+
+    -- series with their instance counts and bytes
+    SELECT series_uid, COUNT(*), SUM(size) FROM instances WHERE error IS NULL GROUP BY series_uid;
+
+Re-running on the same directory only reads files whose size or mtime
+changed; rows for files that disappeared are dropped.
+
+Requires pydicom.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    study_uid TEXT PRIMARY KEY,
+    patient_id TEXT,
+    patient_name TEXT,
+    study_date TEXT,
+    study_description TEXT,
+    accession_number TEXT
+);
+CREATE TABLE IF NOT EXISTS series (
+    series_uid TEXT PRIMARY KEY,
+    study_uid TEXT,
+    modality TEXT,
+    series_number INTEGER,
+    series_description TEXT
+);
+CREATE TABLE IF NOT EXISTS instances (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sop_uid TEXT,
+    sop_class_uid TEXT,
+    series_uid TEXT,
+    study_uid TEXT,
+    instance_number INTEGER,
+    transfer_syntax TEXT,
+    rows INTEGER,
+    columns INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS studies_patient ON studies (patient_id);
+CREATE INDEX IF NOT EXISTS series_study ON series (study_uid);
+CREATE INDEX IF NOT EXISTS instances_series ON instances (series_uid, instance_number);
+CREATE INDEX IF NOT EXISTS instances_sop ON instances (sop_uid);
+"""
+
+HEADER_TAGS = [
+    'PatientID', 'PatientName', 'StudyInstanceUID', 'StudyDate', 'StudyDescription', 'AccessionNumber',
+    'SeriesInstanceUID', 'Modality', 'SeriesNumber', 'SeriesDescription',
+    'SOPInstanceUID', 'SOPClassUID', 'InstanceNumber', 'Rows', 'Columns',
+]
+
+BATCH = 1000
+
+
+def open_index(db_path: Path) -> sqlite3.Connection:
+    """Open (creating if needed) an index database."""
+    conn = sqlite3.connect(str(db_path))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_header(job):
+    """
+    Read the indexed attributes of one file (runs in a worker process).
+
+    Returns:
+        (path, size, mtime_ns, attributes dict or None, error or None)
+    """
+    import pydicom
+
+    path, size, mtime_ns = job
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=HEADER_TAGS)
+    except Exception as e:
+        return path, size, mtime_ns, None, str(e)[:200]
+
+    sop_uid = ds.get('SOPInstanceUID')
+    if not sop_uid:
+        return path, size, mtime_ns, None, 'No SOPInstanceUID'
+
+    attributes = {name: (str(ds[name].value) if name in ds and ds[name].value is not None else None)
+                  for name in HEADER_TAGS}
+    file_meta = getattr(ds, 'file_meta', None) or {}
+    attributes['TransferSyntaxUID'] = str(file_meta.get('TransferSyntaxUID', '')) or None
+    return path, size, mtime_ns, attributes, None
+
+
+def _read_headers(jobs: list) -> list:
+    return [read_header(job) for job in jobs]
+
+
+def scan_tree(root: Path):
+    """Yield (path, size, mtime_ns) for every regular file under root, hidden entries skipped."""
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime_ns
+
+
+def _write_batch(conn: sqlite3.Connection, results: list):
+    studies, series, instances = [], [], []
+    for path, size, mtime_ns, a, error in results:
+        if a is None:
+            instances.append((path, size, mtime_ns, None, None, None, None, None, None, None, None, error))
+            continue
+        studies.append((a['StudyInstanceUID'], a['PatientID'], a['PatientName'], a['StudyDate'],
+                        a['StudyDescription'], a['AccessionNumber']))
+        series.append((a['SeriesInstanceUID'], a['StudyInstanceUID'], a['Modality'], _int(a['SeriesNumber']),
+                       a['SeriesDescription']))
+        instances.append((path, size, mtime_ns, a['SOPInstanceUID'], a['SOPClassUID'], a['SeriesInstanceUID'],
+                          a['StudyInstanceUID'], _int(a['InstanceNumber']), a['TransferSyntaxUID'],
+                          _int(a['Rows']), _int(a['Columns']), None))
+
+    with conn:
+        conn.executemany(
+            'INSERT INTO studies VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (study_uid) DO UPDATE SET '
+            'patient_id = COALESCE(excluded.patient_id, patient_id), '
+            'patient_name = COALESCE(excluded.patient_name, patient_name), '
+            'study_date = COALESCE(excluded.study_date, study_date), '
+            'study_description = COALESCE(excluded.study_description, study_description), '
+            'accession_number = COALESCE(excluded.accession_number, accession_number)',
+            [s for s in studies if s[0]])
+        conn.executemany(
+            'INSERT INTO series VALUES (?, ?, ?, ?, ?) ON CONFLICT (series_uid) DO UPDATE SET '
+            'study_uid = COALESCE(excluded.study_uid, study_uid), '
+            'modality = COALESCE(excluded.modality, modality), '
+            'series_number = COALESCE(excluded.series_number, series_number), '
+            'series_description = COALESCE(excluded.series_description, series_description)',
+            [s for s in series if s[0]])
+        conn.executemany('INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', instances)
+
+
+def index_tree(root: Path, conn: sqlite3.Connection, workers: int = None, prune: bool = True) -> dict:
+    """
+    Index every file under root, skipping files unchanged since the last run.
+
+    Args:
+        root: Directory to index
+        conn: Open index database
+        workers: Header-reading processes (default: CPU count)
+        prune: Drop rows for files under root that no longer exist
+
+    Returns:
+        Counts of seen, read, unchanged, unreadable and removed files
+    """
+    root = Path(root).resolve()
+    prefix = str(root) + os.sep
+    known = {path: (size, mtime_ns) for path, size, mtime_ns in conn.execute(
+        'SELECT path, size, mtime_ns FROM instances WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))}
+
+    counts = {'seen': 0, 'read': 0, 'unchanged': 0, 'unreadable': 0, 'removed': 0}
+    seen = set()
+
+    def changed():
+        for path, size, mtime_ns in scan_tree(root):
+            counts['seen'] += 1
+            seen.add(path)
+            if known.get(path) == (size, mtime_ns):
+                counts['unchanged'] += 1
+                continue
+            yield path, size, mtime_ns
+
+    started = time.monotonic()
+    files = changed()
+    chunks = iter(lambda: list(islice(files, 256)), [])
+    window = 2 * (workers or os.cpu_count() or 1)
+    batch = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # The tree is walked only as far as the window of submitted chunks reaches
+        pending = deque()
+
+        def fill():
+            for chunk in chunks:
+                pending.append(pool.submit(_read_headers, chunk))
+                if len(pending) >= window:
+                    break
+
+        fill()
+        while pending:
+            results = pending.popleft().result()
+            fill()
+            for result in results:
+                counts['read'] += 1
+                counts['unreadable'] += result[3] is None
+                batch.append(result)
+                if len(batch) >= BATCH:
+                    _write_batch(conn, batch)
+                    batch = []
+                    if counts['read'] % 50000 == 0:
+                        print(f"  {counts['read']:,} headers "
+                              f"({counts['read'] / (time.monotonic() - started):,.0f}/s)")
+    if batch:
+        _write_batch(conn, batch)
+
+    if prune:
+        gone = [(path,) for path in known if path not in seen]
+        with conn:
+            conn.executemany('DELETE FROM instances WHERE path = ?', gone)
+            conn.execute('DELETE FROM series WHERE series_uid NOT IN (SELECT series_uid FROM instances '
+                         'WHERE series_uid IS NOT NULL)')
+            conn.execute('DELETE FROM studies WHERE study_uid NOT IN (SELECT study_uid FROM series '
+                         'WHERE study_uid IS NOT NULL)')
+        counts['removed'] = len(gone)
+    return counts
+
+
+def duplicate_instances(conn: sqlite3.Connection):
+    """Yield (sop_uid, [paths]) for SOP Instance UIDs stored in more than one file."""
+    rows = conn.execute(
+        'SELECT sop_uid, path FROM instances WHERE sop_uid IN '
+        '(SELECT sop_uid FROM instances WHERE sop_uid IS NOT NULL GROUP BY sop_uid HAVING COUNT(*) > 1) '
+        'ORDER BY sop_uid, path')
+    current, paths = None, []
+    for sop_uid, path in rows:
+        if sop_uid != current and paths:
+            yield current, paths
+            paths = []
+        current = sop_uid
+        paths.append(path)
+    if paths:
+        yield current, paths
+
+
+def iter_series(conn: sqlite3.Connection, study_uid: str = None):
+    """
+    Yield one dict per series with its study keys and instance paths in instance order.
+
+    Duplicate SOP instances contribute only their first path.
+    """
+    query = ('SELECT se.series_uid, se.study_uid, st.patient_id, st.patient_name, st.study_date, se.modality, '
+             'se.series_number, se.series_description FROM series se JOIN studies st USING (study_uid)')
+    params = ()
+    if study_uid:
+        query += ' WHERE se.study_uid = ?'
+        params = (study_uid,)
+    for row in conn.execute(query + ' ORDER BY st.patient_id, se.study_uid, se.series_number', params).fetchall():
+        keys = ('series_uid', 'study_uid', 'patient_id', 'patient_name', 'study_date', 'modality',
+                'series_number', 'series_description')
+        series = dict(zip(keys, row))
+        # Size and path come from the same (first) copy; files without a SOP UID are stored as errors
+        files = conn.execute(
+            'SELECT path, size FROM (SELECT path, size, instance_number, '
+            'ROW_NUMBER() OVER (PARTITION BY sop_uid ORDER BY path) AS copy '
+            'FROM instances WHERE series_uid = ? AND error IS NULL) '
+            'WHERE copy = 1 ORDER BY instance_number, path', (series['series_uid'],)).fetchall()
+        series['paths'] = [path for path, _ in files]
+        series['bytes'] = sum(size for _, size in files)
+        yield series
+
+
+def summary(conn: sqlite3.Connection) -> dict:
+    def one(sql):
+        return conn.execute(sql).fetchone()[0]
+
+    return {
+        'patients': one('SELECT COUNT(DISTINCT patient_id) FROM studies'),
+        'studies': one('SELECT COUNT(*) FROM studies'),
+        'series': one('SELECT COUNT(*) FROM series'),
+        'instances': one('SELECT COUNT(*) FROM instances WHERE error IS NULL'),
+        'unreadable': one('SELECT COUNT(*) FROM instances WHERE error IS NOT NULL'),
+        'duplicate_sops': one('SELECT COUNT(*) FROM (SELECT sop_uid FROM instances WHERE sop_uid IS NOT NULL '
+                              'GROUP BY sop_uid HAVING COUNT(*) > 1)'),
+        'bytes': one('SELECT COALESCE(SUM(size), 0) FROM instances WHERE error IS NULL'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index the DICOM headers of a directory tree into SQLite.')
+    parser.add_argument('root', help='Directory to index')
+    parser.add_argument('--db', default='dicom-index.sqlite', help='Index database')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-prune', action='store_true', help='Keep rows for files that no longer exist')
+    args = parser.parse_args(argv)
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print(f"Error: Directory {root} does not exist")
+        sys.exit(1)
+
+    conn = open_index(Path(args.db))
+    started = time.monotonic()
+    counts = index_tree(root, conn, args.workers, prune=not args.no_prune)
+    print(f"✓ {counts['seen']:,} files: {counts['read']:,} read, {counts['unchanged']:,} unchanged, "
+          f"{counts['unreadable']:,} not DICOM, {counts['removed']:,} removed in {time.monotonic() - started:.1f}s")
+
+    stats = summary(conn)
+    print(f"  {stats['patients']:,} patients, {stats['studies']:,} studies, {stats['series']:,} series, "
+          f"{stats['instances']:,} instances ({stats['bytes'] / 1024 ** 3:.2f} GB)")
+    if stats['duplicate_sops']:
+        print(f"  ⚠ {stats['duplicate_sops']:,} SOP Instance UIDs appear in more than one file")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+"""
+Compiler for the DicomEdit (.das) subset used by our anonymization scripts.
+
+A script is parsed once into an immutable RulePlan and cached by the
+SHA-256 of its text, so public/lib/*.das and project/site scripts fetched
+from /xapi/anonymize cost one parse per process rather than one per file.
+
+Supported statements (one per line; // and # start comments):
+
+    version "6.3"                          ignored
+    describe name "Label"                  ignored
+    (0010,0010) := "ANON"                  assign a literal
+    (0010,0020) := subject                 assign a variable supplied at apply time
+    (0008,1030) := (0008,103E)             copy another element
+    (0010,0010) := uppercase[(0010,0010)]  lowercase, uppercase, replace, substring, format
+    name := "value"                        set a variable for later statements
+    -(0008,0050)                           delete an element
+    -(0019,XXXX)                           delete every element matching the pattern
+    (0008,0060) = "MR" ? <statement>       conditional: =, !=, ~ (regex), !~
+
+Applying a plan touches only the elements its rules name: each rule is a
+direct lookup by tag, and wildcard deletions share a single pass over the
+dataset's top-level tags (taken again after an assignment adds an element).
+"""
+import hashlib
+import re
+import threading
+from collections.abc import Sequence
+from types import MappingProxyType
+from typing import Callable, NamedTuple, Optional
+
+PIXEL_DATA = 0x7FE00010
+INTEGER_VRS = {'US', 'SS', 'UL', 'SL', 'UV', 'SV', 'AT'}
+FLOAT_VRS = {'FL', 'FD'}
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*")
+      | (?P<tag>\(\s*[0-9A-Fa-fXx]{4}\s*,\s*[0-9A-Fa-fXx]{4}\s*\))
+      | (?P<number>-?\d+)
+      | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>:=|!=|!~|=|~|\?|\[|\]|,|-)
+    )''', re.VERBOSE)
+
+
+class Rule(NamedTuple):
+    action: str                     # 'set', 'delete' or 'let'
+    target: object                  # tag (int), (mask, value) pattern, or variable name
+    value: Optional[Callable]       # (dataset, variables) -> str for set/let
+    condition: Optional[Callable]   # (dataset, variables) -> bool
+    line: int
+
+
+def strip_comment(line: str) -> str:
+    """Drop a // or # comment that is not inside a quoted string."""
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"' and (i == 0 or line[i - 1] != '\\'):
+            quoted = not quoted
+        elif not quoted and (char == '#' or line.startswith('//', i)):
+            return line[:i]
+    return line
+
+
+def format_tag(tag: int) -> str:
+    return f'({tag >> 16:04X},{tag & 0xFFFF:04X})'
+
+
+def tag_name(tag: int) -> str:
+    from pydicom.datadict import dictionary_description
+
+    try:
+        return dictionary_description(tag)
+    except KeyError:
+        return 'Private Tag' if (tag >> 16) % 2 else 'Unknown Tag'
+
+
+def element_text(element) -> str:
+    """Render an element's value the way the web manifest does (multi-values joined by ', ')."""
+    if element is None or element.VR == 'SQ' or element.value is None:
+        return ''
+    value = element.value
+    if isinstance(value, bytes):
+        return f'<{len(value)} bytes>'
+    if isinstance(value, Sequence) and not isinstance(value, str):
+        return ', '.join(str(v) for v in value)
+    return str(value)
+
+
+def coerce_value(vr: str, value: str):
+    """Convert a script string to the Python type pydicom expects for the VR."""
+    if value == '':
+        return None if vr in INTEGER_VRS | FLOAT_VRS else ''
+    if vr in INTEGER_VRS:
+        return [int(v) for v in value.split('\\')] if '\\' in value else int(value)
+    if vr in FLOAT_VRS:
+        return [float(v) for v in value.split('\\')] if '\\' in value else float(value)
+    return value
+
+
+def tokenize(statement: str) -> list:
+    tokens, position = [], 0
+    statement = statement.rstrip()
+    while position < len(statement):
+        match = _TOKEN.match(statement, position)
+        if not match:
+            raise ValueError(f'unexpected input at: {statement[position:]}')
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'string':
+            text = re.sub(r'\\(.)', r'\1', text[1:-1])
+        elif kind == 'tag':
+            text = re.sub(r'[\s()]', '', text).upper()
+        tokens.append((kind, text))
+        position = match.end()
+    return tokens
+
+
+def _parse_tag(text: str):
+    """'0010,0010' -> int; patterns with X -> (mask, value)."""
+    digits = text.replace(',', '')
+    if 'X' not in digits:
+        return int(digits, 16)
+    mask = int(''.join('0' if d == 'X' else 'F' for d in digits), 16)
+    return mask, int(digits.replace('X', '0'), 16)
+
+
+def _text_of(dataset, tag: int) -> str:
+    return element_text(dataset.get(tag))
+
+
+def _substring(value, start, end=None):
+    return value[int(start):int(end) if end is not None else None]
+
+
+def _format(pattern, *args):
+    return re.sub(r'\{(\d+)\}', lambda m: args[int(m.group(1))] if int(m.group(1)) < len(args) else m.group(0),
+                  pattern)
+
+
+FUNCTIONS = {
+    'lowercase': lambda value: value.lower(),
+    'uppercase': lambda value: value.upper(),
+    'replace': lambda value, old, new: value.replace(old, new),
+    'substring': _substring,
+    'format': _format,
+}
+
+
+class _Parser:
+    """Recursive-descent parser over one statement's tokens, producing closures."""
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset: int = 0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, kind: str = None, text: str = None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (text and token[1] != text):
+            raise ValueError(f'expected {text or kind}, found {token[1] or "end of line"}')
+        self.position += 1
+        return token
+
+    def at_end(self) -> bool:
+        return self.position >= len(self.tokens)
+
+    def expression(self):
+        kind, text = self.take()
+        if kind == 'string' or kind == 'number':
+            return lambda ds, env, value=text: value
+        if kind == 'tag':
+            tag = _parse_tag(text)
+            if isinstance(tag, tuple):
+                raise ValueError('wildcard tags can only be deleted')
+            return lambda ds, env, tag=tag: _text_of(ds, tag)
+        if kind == 'ident' and self.peek()[1] == '[':
+            function = FUNCTIONS.get(text)
+            if function is None:
+                raise ValueError(f'unsupported function: {text}')
+            self.take('op', '[')
+            args = [self.expression()]
+            while self.peek()[1] == ',':
+                self.take('op', ',')
+                args.append(self.expression())
+            self.take('op', ']')
+            return lambda ds, env, f=function, a=tuple(args): f(*(arg(ds, env) for arg in a))
+        if kind == 'ident':
+            return lambda ds, env, name=text: env.get(name, '')
+        raise ValueError(f'unexpected {text}')
+
+    def condition(self):
+        left = self.expression()
+        _, op = self.take('op')
+        if op in ('~', '!~'):
+            pattern = re.compile(self.take('string')[1])  # compiled once, at script compile time
+            negate = op == '!~'
+            return lambda ds, env: (pattern.fullmatch(left(ds, env)) is None) == negate
+        right = self.expression()
+        if op == '=':
+            return lambda ds, env: left(ds, env) == right(ds, env)
+        if op == '!=':
+            return lambda ds, env: left(ds, env) != right(ds, env)
+        raise ValueError(f'unsupported operator: {op}')
+
+
+def _compile_statement(tokens: list, line: int):
+    question = next((i for i, token in enumerate(tokens) if token == ('op', '?')), None)
+    condition = None
+    if question is not None:
+        parser = _Parser(tokens[:question])
+        condition = parser.condition()
+        if not parser.at_end():
+            raise ValueError('unexpected input in condition')
+        tokens = tokens[question + 1:]
+
+    parser = _Parser(tokens)
+    if parser.peek() == ('op', '-'):
+        parser.take()
+        rule = Rule('delete', _parse_tag(parser.take('tag')[1]), None, condition, line)
+    elif parser.peek()[0] == 'tag':
+        tag = _parse_tag(parser.take()[1])
+        if isinstance(tag, tuple):
+            raise ValueError('wildcard tags can only be deleted')
+        parser.take('op', ':=')
+        rule = Rule('set', tag, parser.expression(), condition, line)
+    elif parser.peek()[0] == 'ident' and parser.peek(1) == ('op', ':='):
+        name = parser.take()[1]
+        parser.take('op', ':=')
+        rule = Rule('let', name, parser.expression(), condition, line)
+    else:
+        raise ValueError('expected an assignment or deletion')
+    if not parser.at_end():
+        raise ValueError(f'unexpected {parser.peek()[1]}')
+    return rule
+
+
+class RulePlan:
+    """
+    An immutable, compiled DicomEdit script.
+
+    Attributes:
+        digest: SHA-256 of the normalized script text
+        rules: Rules in script order
+        by_tag: Exact tag -> rules that write or delete it
+        patterns: (mask, value) wildcard deletions
+        header_only: True if no rule can touch an element at or after the pixel data
+    """
+
+    __slots__ = ('digest', 'rules', 'by_tag', 'patterns', 'header_only')
+
+    def __init__(self, digest: str, rules: tuple):
+        by_tag = {}
+        for rule in rules:
+            if rule.action != 'let' and not isinstance(rule.target, tuple):
+                by_tag.setdefault(rule.target, []).append(rule)
+        patterns = tuple(rule.target for rule in rules if isinstance(rule.target, tuple))
+        highest = max([*by_tag, *((value | ~mask & 0xFFFFFFFF) for mask, value in patterns)], default=0)
+
+        object.__setattr__(self, 'digest', digest)
+        object.__setattr__(self, 'rules', rules)
+        object.__setattr__(self, 'by_tag', MappingProxyType({t: tuple(r) for t, r in by_tag.items()}))
+        object.__setattr__(self, 'patterns', patterns)
+        object.__setattr__(self, 'header_only', highest < PIXEL_DATA)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('RulePlan is immutable')
+
+    def apply(self, ds, file_name: str = '', variables: dict = None) -> list:
+        """
+        Apply the plan to a dataset in place, recording each change as it is made.
+
+        Assignments create missing elements with their dictionary VR, as
+        DicomEdit's ':=' does.
+
+        Args:
+            ds: pydicom Dataset
+            file_name: Name recorded in each change
+            variables: Values for identifiers such as project, subject, session
+
+        Returns:
+            Changes as dicts with fileName, tag, tagName, originalValue, newValue
+        """
+        from pydicom.datadict import dictionary_VR
+
+        env = dict(variables or {})
+        changes = []
+
+        def record(tag, original, new):
+            if original != new:
+                changes.append({'fileName': file_name, 'tag': format_tag(tag), 'tagName': tag_name(tag),
+                                'originalValue': original, 'newValue': new})
+
+        matched = None
+        for rule in self.rules:
+            if rule.condition is not None and not rule.condition(ds, env):
+                continue
+
+            if rule.action == 'let':
+                env[rule.target] = rule.value(ds, env)
+            elif rule.action == 'delete' and isinstance(rule.target, tuple):
+                if matched is None:
+                    # One pass over the top-level tags serves every wildcard deletion
+                    matched = {p: [int(t) for t in ds.keys() if t & p[0] == p[1]] for p in self.patterns}
+                for tag in matched[rule.target]:
+                    if tag in ds:
+                        record(tag, _text_of(ds, tag), '')
+                        del ds[tag]
+            elif rule.action == 'delete':
+                if rule.target in ds:
+                    record(rule.target, _text_of(ds, rule.target), '')
+                    del ds[rule.target]
+            else:
+                tag = rule.target
+                value = rule.value(ds, env)
+                element = ds.get(tag)
+                original = element_text(element)
+                if element is None:
+                    try:
+                        vr = dictionary_VR(tag)
+                    except KeyError:
+                        vr = 'LO'
+                    ds.add_new(tag, vr, coerce_value(vr, value))
+                    # A later wildcard deletion must see the new element; deletions alone only shrink the matches
+                    matched = None
+                else:
+                    element.value = coerce_value(element.VR, value)
+                record(tag, original, element_text(ds[tag]))
+        return changes
+
+
+def parse_script(script: str, digest: str = None) -> RulePlan:
+    """
+    Compile a script without consulting the cache.
+
+    Raises:
+        ValueError: on a statement outside the supported subset (with its line number)
+    """
+    script = script.replace('\r\n', '\n')
+    rules = []
+    for number, line in enumerate(script.split('\n'), start=1):
+        statement = strip_comment(line).strip()
+        if not statement:
+            continue
+        try:
+            tokens = tokenize(statement)
+            if tokens[0] in (('ident', 'version'), ('ident', 'describe')):
+                continue
+            rules.append(_compile_statement(tokens, number))
+        except ValueError as e:
+            raise ValueError(f'Line {number}: {e}: {statement}') from None
+    return RulePlan(digest or script_digest(script), tuple(rules))
+
+
+def script_digest(script: str) -> str:
+    return hashlib.sha256(script.replace('\r\n', '\n').encode()).hexdigest()
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def compile_script(script: str) -> RulePlan:
+    """Return the cached plan for a script, compiling it on first use."""
+    digest = script_digest(script)
+    with _plans_lock:
+        plan = _plans.get(digest)
+    if plan is None:
+        plan = parse_script(script, digest)
+        with _plans_lock:
+            plan = _plans.setdefault(digest, plan)
+    return plan
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Download scan or session data from XNAT.
+
+Files are fetched concurrently and streamed to disk in fixed-size chunks, so
+memory stays bounded at roughly workers x chunk size regardless of file or
+archive size. Partial downloads are kept as `.part` files and resumed with
+HTTP Range requests; completed files are checked against the size and MD5
+digest reported by the XNAT file listing. Zip archives are generated on the
+fly, so they have neither: a partial archive is discarded and fetched
+again, and a finished one must pass a zip integrity check.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from requests.adapters import HTTPAdapter
+
+from find_small_scan import (
+    file_size, format_bytes, get_results, iter_scans, list_dicom_files, login, password, username, xnat_server,
+)
+from xnat_stream import iter_results
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 8
+
+
+class DownloadError(Exception):
+    """Raised when a download fails or does not verify."""
+
+
+def configure_pool(session, workers: int):
+    """Size the session's connection pool so every worker keeps a warm connection."""
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+def hash_existing(path: Path, digest, chunk_size: int = CHUNK_SIZE):
+    """Feed an existing partial file into a running digest."""
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+
+def verify_existing(path: Path, expected_size: int, expected_md5: str, chunk_size: int = CHUNK_SIZE) -> bool:
+    """Return True if a completed file matches the expected size and digest."""
+    if expected_size and path.stat().st_size != expected_size:
+        return False
+    if expected_md5:
+        md5 = hashlib.md5()
+        hash_existing(path, md5, chunk_size)
+        return md5.hexdigest().lower() == expected_md5.lower()
+    return True
+
+
+def download_file(session, url: str, dest: Path, expected_size: int = 0, expected_md5: str = None,
+                  chunk_size: int = CHUNK_SIZE, params: dict = None) -> int:
+    """
+    Stream a URL to disk, resuming a previous partial download if present.
+
+    Args:
+        session: Authenticated session
+        url: File URL
+        dest: Destination path
+        expected_size: Size reported by XNAT (0 if unknown)
+        expected_md5: MD5 digest reported by XNAT (None if unknown)
+        chunk_size: Bytes read and written per chunk
+        params: Extra query parameters
+
+    Returns:
+        Number of bytes transferred over the network
+    """
+    if dest.exists() and verify_existing(dest, expected_size, expected_md5, chunk_size):
+        return 0
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + '.part')
+    offset = part.stat().st_size if part.exists() else 0
+    # Without a size or digest a resumed file cannot be checked, and a regenerated archive need not match the bytes
+    # already on disk
+    verifiable = bool(expected_size or expected_md5)
+
+    if offset and (not verifiable or (expected_size and offset > expected_size)):
+        part.unlink()
+        offset = 0
+
+    md5 = hashlib.md5()
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    transferred = 0
+
+    with session.get(url, headers=headers, params=params, stream=True) as response:
+        if response.status_code == 416 and offset:
+            # Nothing left to fetch: the .part file already holds every byte
+            mode = None
+        elif response.status_code == 206 and offset:
+            mode = 'ab'
+        elif response.status_code == 200:
+            # Server ignored the Range header; start over
+            mode = 'wb'
+            offset = 0
+        else:
+            raise DownloadError(f"HTTP {response.status_code} for {url}")
+
+        if mode == 'ab':
+            hash_existing(part, md5, chunk_size)
+
+        if mode:
+            with open(part, mode) as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    md5.update(chunk)
+                    transferred += len(chunk)
+        else:
+            hash_existing(part, md5, chunk_size)
+
+    actual_size = part.stat().st_size
+    if expected_size and actual_size != expected_size:
+        raise DownloadError(f"Size mismatch for {dest.name}: expected {expected_size}, got {actual_size}")
+
+    if expected_md5 and md5.hexdigest().lower() != expected_md5.lower():
+        part.unlink()
+        raise DownloadError(f"Digest mismatch for {dest.name}")
+
+    if not verifiable and dest.suffix == '.zip':
+        try:
+            with zipfile.ZipFile(part) as archive:
+                bad_member = archive.testzip()
+        except zipfile.BadZipFile as e:
+            bad_member = str(e)
+        if bad_member is not None:
+            part.unlink()
+            raise DownloadError(f"Corrupt archive {dest.name}: {bad_member}")
+
+    os.replace(part, dest)
+    return transferred
+
+
+def relative_file_path(file_row: dict) -> Path:
+    """Return a file's path inside its resource, taken from the listing URI."""
+    uri = file_row.get('URI', '')
+    relative = uri.split('/files/', 1)[1] if '/files/' in uri else file_row.get('Name', '')
+    parts = [p for p in relative.split('/') if p not in ('', '.', '..')]
+    return Path(*parts)
+
+
+def file_jobs(server: str, out_dir: Path, scan: dict):
+    """Yield (url, dest, size, md5) for every DICOM file of a scan."""
+    scan_dir = out_dir / scan['project'] / scan['experiment'] / str(scan['scan'])
+    for row in scan['dicom_files']:
+        yield (f"{server}{row['URI']}", scan_dir / relative_file_path(row), file_size(row), row.get('digest') or None)
+
+
+def zip_jobs(server: str, out_dir: Path, scans: list):
+    """Yield one (url, dest) archive job per experiment, covering the selected scans."""
+    by_experiment = {}
+    for scan in scans:
+        by_experiment.setdefault((scan['project'], scan['experiment']), []).append(str(scan['scan']))
+
+    for (project, experiment), scan_ids in by_experiment.items():
+        url = f"{server}/data/archive/experiments/{experiment}/scans/{','.join(scan_ids)}/resources/DICOM/files"
+        yield url, out_dir / project / f"{experiment}.zip"
+
+
+def select_scans(session, server: str, experiment: str = None, scan_ids: list = None, project: str = None,
+                 max_projects: int = 15, max_experiments: int = 3):
+    """
+    Resolve the scans to download.
+
+    An experiment (optionally narrowed to scan IDs) or a project can be given;
+    otherwise the find_small_scan.py traversal is used.
+    """
+    if experiment:
+        exp_rows = get_results(session, f'{server}/data/archive/experiments', ID=experiment)
+        project_id = exp_rows[0].get('project', 'unknown') if exp_rows else 'unknown'
+        wanted = scan_ids or [s.get('ID') for s in get_results(session, f'{server}/data/archive/experiments/{experiment}/scans')]
+        for scan_id in wanted:
+            files = list_dicom_files(session, server, experiment, scan_id)
+            if files:
+                yield {'project': project_id, 'experiment': experiment, 'scan': scan_id, 'dicom_files': files}
+    elif project:
+        for exp in iter_results(session, f'{server}/data/archive/projects/{project}/experiments'):
+            exp_id = exp.get('ID')
+            for scan in iter_results(session, f'{server}/data/archive/experiments/{exp_id}/scans'):
+                files = list_dicom_files(session, server, exp_id, scan.get('ID'))
+                if files:
+                    yield {'project': project, 'experiment': exp_id, 'scan': scan.get('ID'), 'dicom_files': files}
+    else:
+        yield from iter_scans(session, server, max_projects, max_experiments)
+
+
+def run_downloads(session, jobs: list, workers: int, chunk_size: int = CHUNK_SIZE, params: dict = None):
+    """
+    Run download jobs concurrently.
+
+    Args:
+        session: Authenticated session
+        jobs: List of (url, dest, size, md5) tuples
+        workers: Number of concurrent downloads
+        chunk_size: Bytes per streamed chunk
+        params: Extra query parameters for every request
+
+    Returns:
+        Tuple of (bytes transferred, list of failures)
+    """
+    total = 0
+    failures = []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(download_file, session, url, dest, size, md5, chunk_size, params): dest
+            for url, dest, size, md5 in jobs
+        }
+        for future in as_completed(futures):
+            dest = futures[future]
+            try:
+                total += future.result()
+            except Exception as e:
+                failures.append((dest, str(e)))
+                print(f"✗ {dest}: {e}")
+
+    return total, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Download scan data from XNAT.')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    parser.add_argument('--experiment', help='Experiment ID to download')
+    parser.add_argument('--scan', action='append', dest='scans', help='Scan ID (repeatable; default: all scans)')
+    parser.add_argument('--project', help='Download every scan in a project')
+    parser.add_argument('--out', default='downloads', help='Output directory')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--zip', action='store_true', help='Fetch one format=zip archive per experiment')
+    args = parser.parse_args(argv)
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    configure_pool(session, args.workers)
+    out_dir = Path(args.out)
+
+    scans = list(select_scans(session, args.server, args.experiment, args.scans, args.project))
+    if not scans:
+        print("No scans with DICOM files found")
+        sys.exit(1)
+
+    if args.zip:
+        # Archives are generated on the fly, so their size and digest are unknown up front
+        jobs = [(url, dest, 0, None) for url, dest in zip_jobs(args.server, out_dir, scans)]
+        params = {'format': 'zip'}
+    else:
+        jobs = [job for scan in scans for job in file_jobs(args.server, out_dir, scan)]
+        params = None
+
+    print(f"Downloading {len(jobs)} {'archives' if args.zip else 'files'} from {len(scans)} scans "
+          f"with {args.workers} workers...")
+
+    total, failures = run_downloads(session, jobs, args.workers, args.chunk_size, params)
+
+    print("-" * 50)
+    print(f"✓ Transferred {format_bytes(total)} ({len(jobs) - len(failures)}/{len(jobs)} complete)")
+    if failures:
+        print(f"✗ {len(failures)} failed; re-run to resume")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Export the archive hierarchy to a partitioned columnar catalog.
+
+Walks projects -> experiments -> scans -> files with streamed listings and
+writes one row per file to Parquet (or Arrow IPC) files partitioned by
+project: <out>/project=<ID>/part-00000.parquet. The project comes from the
+directory name (hive partitioning), not from a column in the files; read
+the catalog with open_catalog() or any reader that understands hive
+partitions. Rows are flushed in record batches as the crawl proceeds, so
+memory stays flat no matter how many files the site holds. Modality and
+other low-cardinality columns are dictionary-encoded, which keeps "bytes
+per modality" style queries in DuckDB/pandas/Polars to a vectorized scan.
+Each project is written to a hidden staging directory and swapped in
+once its crawl finishes, so re-running an export replaces a project's
+partition instead of adding a second copy of its rows, and readers never
+see a half-written project.
+
+Requires pyarrow.
+"""
+import argparse
+import re
+import shutil
+import sys
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from find_small_scan import file_size, login, password, username, xnat_server
+from xnat_stream import iter_results
+
+BATCH_ROWS = 50_000
+
+MODALITY_PATTERN = re.compile(r':(\w+?)(?:Session|Scan)Data$')
+
+
+def catalog_schema():
+    """Return the Arrow schema of the catalog files (project is the partition key, see catalog_partitioning)."""
+    import pyarrow as pa
+
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('subject', pa.string()),
+        ('experiment', pa.string()),
+        ('experiment_label', pa.string()),
+        ('experiment_date', pa.date32()),
+        ('insert_date', pa.timestamp('ms')),
+        ('xsi_type', category),
+        ('modality', category),
+        ('scan', pa.string()),
+        ('scan_type', category),
+        ('series_description', pa.string()),
+        ('resource', category),
+        ('file_name', pa.string()),
+        ('file_size', pa.int64()),
+        ('file_format', category),
+        ('digest', pa.string()),
+        ('crawled_at', pa.timestamp('ms', tz='UTC')),
+    ])
+
+
+def catalog_partitioning():
+    """Return the hive partitioning of the catalog: project=<ID> directories."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(pa.schema([('project', pa.string())]), flavor='hive')
+
+
+def open_catalog(catalog_dir: Path):
+    """
+    Open an export_catalog.py catalog as a pyarrow dataset.
+
+    Args:
+        catalog_dir: Catalog root (project=<ID>/part-*.parquet or .arrow)
+
+    Returns:
+        A pyarrow.dataset.Dataset with the file columns plus project
+    """
+    import pyarrow.dataset as ds
+
+    catalog_dir = Path(catalog_dir)
+    file_format = 'ipc' if next(catalog_dir.glob('*/*.arrow'), None) else 'parquet'
+    return ds.dataset(str(catalog_dir), format=file_format, partitioning=catalog_partitioning())
+
+
+def modality_from_xsi_type(xsi_type: str) -> str:
+    """Derive a modality (MR, CT, PET...) from an XNAT session/scan data type."""
+    match = MODALITY_PATTERN.search(xsi_type or '')
+    return match.group(1).upper() if match else None
+
+
+def parse_date(value: str):
+    """Parse an XNAT date (YYYY-MM-DD), returning None when absent or malformed."""
+    try:
+        return date.fromisoformat((value or '')[:10])
+    except ValueError:
+        return None
+
+
+def parse_timestamp(value: str):
+    """Parse an XNAT timestamp such as '2024-03-01 12:30:45.0'."""
+    try:
+        return datetime.strptime((value or '')[:19], '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def iter_file_rows(session, server: str, projects: list = None):
+    """
+    Walk the archive and yield one catalog row per file.
+
+    Args:
+        session: Authenticated session
+        server: Base URL of the XNAT server
+        projects: Project IDs to crawl (default: every visible project)
+
+    Yields:
+        Dicts keyed by the catalog schema's column names plus project
+    """
+    crawled_at = datetime.now(timezone.utc)
+
+    if projects is None:
+        projects = (p.get('ID') for p in iter_results(session, f'{server}/data/archive/projects'))
+
+    for proj_id in projects:
+        for exp in iter_results(session, f'{server}/data/archive/projects/{proj_id}/experiments'):
+            exp_id = exp.get('ID')
+            exp_xsi_type = exp.get('xsiType', '')
+            experiment = {
+                'project': proj_id,
+                'subject': exp.get('subject_ID'),
+                'experiment': exp_id,
+                'experiment_label': exp.get('label'),
+                'experiment_date': parse_date(exp.get('date')),
+                'insert_date': parse_timestamp(exp.get('insert_date')),
+                'xsi_type': exp_xsi_type,
+                'modality': modality_from_xsi_type(exp_xsi_type),
+            }
+
+            for scan in iter_results(session, f'{server}/data/archive/experiments/{exp_id}/scans'):
+                scan_id = scan.get('ID')
+                files_url = f'{server}/data/archive/experiments/{exp_id}/scans/{scan_id}/files'
+
+                for row in iter_results(session, files_url):
+                    yield {
+                        **experiment,
+                        'scan': scan_id,
+                        'scan_type': scan.get('type'),
+                        'series_description': scan.get('series_description'),
+                        'resource': row.get('collection'),
+                        'file_name': row.get('Name'),
+                        'file_size': file_size(row),
+                        'file_format': row.get('file_format') or None,
+                        'digest': row.get('digest') or None,
+                        'crawled_at': crawled_at,
+                    }
+
+
+class PartitionedWriter:
+    """
+    Writes rows into per-project Parquet or Arrow IPC files in record batches.
+
+    The crawl visits one project at a time, so only the current project's
+    file is kept open; it is closed as soon as rows for the next project
+    arrive and then replaces the project's previous partition (abort()
+    discards it instead). Dictionary columns keep one growing dictionary per file, so
+    every batch after the first only adds a delta (the Arrow IPC file
+    format cannot replace a dictionary mid-file).
+    """
+
+    def __init__(self, out_dir: Path, file_format: str = 'parquet', batch_rows: int = BATCH_ROWS):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.schema = catalog_schema()
+        self.out_dir = out_dir
+        self.file_format = file_format
+        self.batch_rows = batch_rows
+        self.partition = None
+        self.writer = None
+        self.columns = {name: [] for name in self.schema.names}
+        self.dictionaries = {}
+        self.pending = 0
+        self.rows_written = 0
+
+    def _staging(self, project: str) -> Path:
+        # Dataset readers skip names starting with '.', so a crawl in progress is invisible to them
+        return self.out_dir / f'.project={project}.tmp'
+
+    def _open(self, project: str):
+        directory = self._staging(project)
+        shutil.rmtree(directory, ignore_errors=True)  # left by an interrupted run
+        directory.mkdir(parents=True)
+        self.dictionaries = {field.name: {} for field in self.schema if self.pa.types.is_dictionary(field.type)}
+
+        if self.file_format == 'arrow':
+            path = directory / 'part-00000.arrow'
+            options = self.pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = self.pa.ipc.new_file(str(path), self.schema, options=options)
+        else:
+            import pyarrow.parquet as pq
+            path = directory / 'part-00000.parquet'
+            self.writer = pq.ParquetWriter(str(path), self.schema, compression='zstd', use_dictionary=True)
+
+        self.partition = project
+
+    def write(self, row: dict):
+        """Buffer a row, flushing a record batch when the buffer is full or the project changes."""
+        if row['project'] != self.partition:
+            self.flush()
+            self._close()
+            self._open(row['project'])
+
+        for name in self.schema.names:
+            self.columns[name].append(row.get(name))
+        self.pending += 1
+
+        if self.pending >= self.batch_rows:
+            self.flush()
+
+    def _encode(self, name: str, values: list):
+        """Dictionary-encode values against the open file's dictionary, extending it with new values."""
+        codes = self.dictionaries[name]
+        indices = [None if value is None else codes.setdefault(value, len(codes)) for value in values]
+        return self.pa.DictionaryArray.from_arrays(self.pa.array(indices, self.pa.int32()),
+                                                   self.pa.array(list(codes), self.pa.string()))
+
+    def flush(self):
+        """Write buffered rows as one record batch."""
+        if not self.pending:
+            return
+        arrays = [self._encode(field.name, self.columns[field.name]) if field.name in self.dictionaries
+                  else self.pa.array(self.columns[field.name], field.type)
+                  for field in self.schema]
+        batch = self.pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        self.writer.write_batch(batch)
+        self.rows_written += self.pending
+        self.columns = {name: [] for name in self.schema.names}
+        self.pending = 0
+
+    def _close(self, publish: bool = True):
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+        staging = self._staging(self.partition)
+        if not publish:
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        final = self.out_dir / f'project={self.partition}'
+        previous = self.out_dir / f'.project={self.partition}.old'
+        shutil.rmtree(previous, ignore_errors=True)
+        if final.exists():
+            final.rename(previous)
+        staging.rename(final)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    def close(self):
+        """Write the last batch and publish the current project's partition."""
+        self.flush()
+        self._close()
+
+    def abort(self):
+        """Discard the current project's unfinished partition, keeping the one from the previous run."""
+        self._close(publish=False)
+
+
+def export_catalog(session, server: str, out_dir: Path, projects: list = None,
+                   file_format: str = 'parquet', batch_rows: int = BATCH_ROWS) -> int:
+    """
+    Crawl the archive and write the catalog.
+
+    Args:
+        session: Authenticated session
+        server: Base URL of the XNAT server
+        out_dir: Catalog root directory
+        projects: Project IDs to crawl (default: all)
+        file_format: 'parquet' or 'arrow'
+        batch_rows: Rows per record batch
+
+    Returns:
+        Number of rows written
+    """
+    writer = PartitionedWriter(out_dir, file_format, batch_rows)
+    try:
+        for row in iter_file_rows(session, server, projects):
+            writer.write(row)
+            if writer.pending == 0:
+                print(f"✓ {writer.rows_written:,} rows written (project {writer.partition})")
+    except BaseException:
+        writer.abort()  # projects finished before the failure stay published
+        raise
+    writer.close()
+    return writer.rows_written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the XNAT archive hierarchy to Parquet/Arrow.')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    parser.add_argument('--project', action='append', dest='projects', help='Project ID (repeatable; default: all)')
+    parser.add_argument('--out', default='catalog', help='Catalog root directory')
+    parser.add_argument('--format', choices=('parquet', 'arrow'), default='parquet')
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS)
+    args = parser.parse_args(argv)
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    rows = export_catalog(session, args.server, Path(args.out), args.projects, args.format, args.batch_rows)
+    print(f"✓ Catalog complete: {rows:,} file rows in {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,96 +1,307 @@
 #!/usr/bin/env python3
 """
 Find a scan with fewer DICOM files for faster testing
+
+Scans are ranked by total resource bytes taken from the XNAT file listing.
+With --sample-headers, the first few KB of one file per scan are fetched with
+an HTTP Range request and parsed with pydicom to estimate the decoded pixel
+bytes the viewer will actually have to hold in memory.
 """
+import argparse
+import io
+import sys
+from itertools import islice
+
 import requests
 
+from xnat_metrics import default_metrics, instrument
+from xnat_stream import iter_results
+from xnat_throttle import ThrottledSession
+
 xnat_server = 'http://demo02.xnatworks.io'
 username = 'admin'
 password = 'admin'
 
-print("Finding a smaller scan for testing...\n")
+# Bytes read per header sample; doubled up to HEADER_SAMPLE_MAX when the
+# attributes we need sit behind large private or sequence elements.
+HEADER_SAMPLE_BYTES = 16 * 1024
+HEADER_SAMPLE_MAX = 256 * 1024
+
+HEADER_KEYWORDS = ('Rows', 'Columns', 'NumberOfFrames', 'BitsAllocated', 'SamplesPerPixel')
+
+
+def login(server: str, user: str, passwd: str) -> requests.Session:
+    """
+    Open an authenticated XNAT session.
 
-# Login
-session = requests.Session()
-login_url = f'{xnat_server}/data/JSESSION'
-response = session.post(login_url, auth=(username, password))
+    Args:
+        server: Base URL of the XNAT server
+        user: XNAT username
+        passwd: XNAT password
 
-if response.status_code != 200:
-    print(f"Login failed: {response.status_code}")
-    exit(1)
+    Returns:
+        A throttled, instrumented session carrying the JSESSIONID cookie
+    """
+    session = instrument(ThrottledSession())
+    response = session.post(f'{server}/data/JSESSION', auth=(user, passwd))
 
-jsessionid = response.text.strip()
-print(f"✓ Logged in (JSESSIONID: {jsessionid[:20]}...)\n")
+    if response.status_code != 200:
+        raise RuntimeError(f"Login failed: {response.status_code}")
 
-# Get projects
-projects_url = f'{xnat_server}/data/archive/projects'
-response = session.get(projects_url, params={'format': 'json'})
-projects = response.json().get('ResultSet', {}).get('Result', [])
+    return session
 
-print(f"Searching {len(projects)} projects for small scans...\n")
 
-scans_found = []
+def get_results(session: requests.Session, url: str, **params) -> list:
+    """
+    Fetch an XNAT listing and return its ResultSet rows.
 
-for proj in projects[:15]:  # Check first 15 projects
-    proj_id = proj.get('ID')
+    Prefer iter_results for large listings; this materializes every row.
 
-    # Get experiments
-    experiments_url = f'{xnat_server}/data/archive/projects/{proj_id}/experiments'
-    exp_response = session.get(experiments_url, params={'format': 'json'})
+    Args:
+        session: Authenticated session
+        url: Listing URL
+        **params: Extra query parameters
 
-    if exp_response.status_code != 200:
-        continue
+    Returns:
+        List of result rows, or an empty list if the request failed
+    """
+    return list(iter_results(session, url, **params))
 
-    experiments = exp_response.json().get('ResultSet', {}).get('Result', [])
 
-    for exp in experiments[:3]:  # Check first 3 experiments per project
-        exp_id = exp.get('ID')
+def list_dicom_files(session: requests.Session, server: str, exp_id: str, scan_id: str) -> list:
+    """Return the .dcm rows of a scan's DICOM resource listing."""
+    files_url = f'{server}/data/archive/experiments/{exp_id}/scans/{scan_id}/resources/DICOM/files'
+    return [f for f in iter_results(session, files_url) if f.get('Name', '').lower().endswith('.dcm')]
 
-        # Get scans
-        scans_url = f'{xnat_server}/data/archive/experiments/{exp_id}/scans'
-        scans_response = session.get(scans_url, params={'format': 'json'})
 
-        if scans_response.status_code != 200:
-            continue
+def iter_scans(session: requests.Session, server: str, max_projects: int = 15, max_experiments: int = 3):
+    """
+    Walk projects -> experiments -> scans and yield each scan with its DICOM files.
 
-        scans = scans_response.json().get('ResultSet', {}).get('Result', [])
+    Args:
+        session: Authenticated session
+        server: Base URL of the XNAT server
+        max_projects: Number of projects to visit
+        max_experiments: Number of experiments to visit per project
 
-        for scan in scans:
-            scan_id = scan.get('ID')
+    Yields:
+        Dicts with project, experiment, scan and the scan's DICOM file rows
+    """
+    print(f"Searching up to {max_projects} projects for small scans...\n")
 
-            # Get files for this scan
-            files_url = f'{xnat_server}/data/archive/experiments/{exp_id}/scans/{scan_id}/resources/DICOM/files'
-            files_response = session.get(files_url, params={'format': 'json'})
+    for proj in islice(iter_results(session, f'{server}/data/archive/projects'), max_projects):
+        proj_id = proj.get('ID')
+        experiments = iter_results(session, f'{server}/data/archive/projects/{proj_id}/experiments')
 
-            if files_response.status_code == 200:
-                files_data = files_response.json()
-                files = files_data.get('ResultSet', {}).get('Result', [])
-                dicom_files = [f for f in files if f.get('Name', '').lower().endswith('.dcm')]
+        for exp in islice(experiments, max_experiments):
+            exp_id = exp.get('ID')
+            scans = iter_results(session, f'{server}/data/archive/experiments/{exp_id}/scans')
 
-                if len(dicom_files) > 0:
-                    scans_found.append({
+            for scan in scans:
+                scan_id = scan.get('ID')
+                dicom_files = list_dicom_files(session, server, exp_id, scan_id)
+
+                if dicom_files:
+                    yield {
                         'project': proj_id,
                         'experiment': exp_id,
                         'scan': scan_id,
-                        'files': len(dicom_files)
-                    })
+                        'xsi_type': scan.get('xsiType', ''),
+                        'dicom_files': dicom_files,
+                    }
+
+
+def file_size(file_row: dict) -> int:
+    """Return the byte size XNAT reports for a file listing row (0 if unknown)."""
+    try:
+        return int(file_row.get('Size') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def read_prefix(session: requests.Session, url: str, length: int) -> bytes:
+    """
+    Read the first `length` bytes of a file.
+
+    Sends a Range request; if the server ignores it and answers 200 with the
+    whole body, only `length` bytes are read off the socket before closing.
+    """
+    headers = {'Range': f'bytes=0-{length - 1}'}
+    with session.get(url, headers=headers, stream=True) as response:
+        if response.status_code not in (200, 206):
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response.raw.read(length, decode_content=True)
+
+
+def sample_header(session: requests.Session, server: str, file_row: dict) -> dict:
+    """
+    Parse the image attributes of a DICOM file from a Range-read prefix.
+
+    Args:
+        session: Authenticated session
+        server: Base URL of the XNAT server
+        file_row: File listing row (must carry a URI)
+
+    Returns:
+        Dict of header attributes; empty if the prefix could not be parsed
+    """
+    import pydicom
+
+    url = f"{server}{file_row['URI']}"
+    length = HEADER_SAMPLE_BYTES
+
+    while True:
+        prefix = read_prefix(session, url, length)
+        truncated = len(prefix) >= length
+
+        try:
+            ds = pydicom.dcmread(io.BytesIO(prefix), stop_before_pixels=True, force=True)
+            header = {kw: getattr(ds, kw, None) for kw in HEADER_KEYWORDS}
+            transfer_syntax = getattr(getattr(ds, 'file_meta', None), 'TransferSyntaxUID', None)
+            header['TransferSyntaxUID'] = str(transfer_syntax) if transfer_syntax else None
+        except Exception:
+            header = {}
+
+        if (header.get('Rows') and header.get('Columns')) or not truncated or length >= HEADER_SAMPLE_MAX:
+            return header
+
+        length *= 2
+
+
+def estimate_decoded_bytes(header: dict, file_count: int) -> int:
+    """
+    Estimate the decoded pixel bytes of a scan, assuming every file matches the sample.
+
+    Args:
+        header: Attributes returned by sample_header
+        file_count: Number of DICOM files in the scan
 
-# Sort by number of files
-scans_found.sort(key=lambda x: x['files'])
+    Returns:
+        Estimated decoded bytes, or 0 if the header lacks image dimensions
+    """
+    rows = int(header.get('Rows') or 0)
+    columns = int(header.get('Columns') or 0)
+    frames = int(header.get('NumberOfFrames') or 1)
+    samples = int(header.get('SamplesPerPixel') or 1)
+    bytes_per_sample = (int(header.get('BitsAllocated') or 16) + 7) // 8
 
-print("=" * 70)
-print("FOUND SCANS (sorted by size)")
-print("=" * 70)
+    return rows * columns * frames * samples * bytes_per_sample * file_count
 
-for i, scan_info in enumerate(scans_found[:10], 1):
-    url = f"http://localhost:5173/experiments/{scan_info['experiment']}/scans/{scan_info['scan']}/cornerstone"
-    print(f"{i}. {scan_info['files']} files - Project: {scan_info['project']}")
-    print(f"   Experiment: {scan_info['experiment']}, Scan: {scan_info['scan']}")
-    print(f"   URL: {url}\n")
 
-if scans_found:
-    smallest = scans_found[0]
+def format_bytes(num_bytes: int) -> str:
+    """Format a byte count for display."""
+    size = float(num_bytes)
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def find_scans(session: requests.Session, server: str, sample_headers: bool = False,
+               max_projects: int = 15, max_experiments: int = 3) -> list:
+    """
+    Collect sizing information for every scan visited by iter_scans.
+
+    Args:
+        session: Authenticated session
+        server: Base URL of the XNAT server
+        sample_headers: Range-read one file per scan to estimate decoded bytes
+        max_projects: Number of projects to visit
+        max_experiments: Number of experiments to visit per project
+
+    Returns:
+        List of scan summary dicts
+    """
+    scans_found = []
+
+    for scan in iter_scans(session, server, max_projects, max_experiments):
+        dicom_files = scan.pop('dicom_files')
+        scan['files'] = len(dicom_files)
+        scan['bytes'] = sum(file_size(f) for f in dicom_files)
+        scan['decoded_bytes'] = None
+
+        if sample_headers and dicom_files[0].get('URI'):
+            try:
+                header = sample_header(session, server, dicom_files[0])
+            except Exception as e:
+                print(f"✗ Header sample failed for {scan['experiment']}/{scan['scan']}: {e}")
+                header = {}
+
+            scan['header'] = header
+            scan['decoded_bytes'] = estimate_decoded_bytes(header, len(dicom_files)) or None
+
+        scans_found.append(scan)
+
+    return scans_found
+
+
+def sort_key(metric: str):
+    """Return a sort key for the given ranking metric."""
+    if metric == 'files':
+        return lambda s: s['files']
+    if metric == 'decoded':
+        # Scans whose header could not be sampled fall back to stored bytes
+        return lambda s: s['decoded_bytes'] if s['decoded_bytes'] is not None else s['bytes']
+    return lambda s: s['bytes']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find a small scan for viewer testing.')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    parser.add_argument('--sort-by', choices=('bytes', 'decoded', 'files'), default=None,
+                        help='Ranking metric (default: decoded with --sample-headers, else bytes)')
+    parser.add_argument('--sample-headers', action='store_true',
+                        help='Range-read one file per scan to estimate decoded pixel bytes')
+    parser.add_argument('--max-projects', type=int, default=15)
+    parser.add_argument('--max-experiments', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    metric = args.sort_by or ('decoded' if args.sample_headers else 'bytes')
+
+    print("Finding a smaller scan for testing...\n")
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    print("✓ Logged in\n")
+
+    scans_found = find_scans(session, args.server, args.sample_headers,
+                             args.max_projects, args.max_experiments)
+    scans_found.sort(key=sort_key(metric))
+
     print("=" * 70)
-    print(f"RECOMMENDED: Use scan with {smallest['files']} files")
-    print(f"URL: http://localhost:5173/experiments/{smallest['experiment']}/scans/{smallest['scan']}/cornerstone")
+    print(f"FOUND SCANS (sorted by {metric})")
     print("=" * 70)
+
+    for i, scan_info in enumerate(scans_found[:10], 1):
+        url = f"http://localhost:5173/experiments/{scan_info['experiment']}/scans/{scan_info['scan']}/cornerstone"
+        size_line = f"{scan_info['files']} files, {format_bytes(scan_info['bytes'])} stored"
+        if scan_info['decoded_bytes']:
+            size_line += f", ~{format_bytes(scan_info['decoded_bytes'])} decoded"
+        print(f"{i}. {size_line} - Project: {scan_info['project']}")
+        print(f"   Experiment: {scan_info['experiment']}, Scan: {scan_info['scan']}")
+        header = scan_info.get('header')
+        if header:
+            print(f"   {header.get('Rows')}x{header.get('Columns')}, "
+                  f"{header.get('NumberOfFrames') or 1} frame(s), "
+                  f"{header.get('BitsAllocated')} bits, {header.get('TransferSyntaxUID')}")
+        print(f"   URL: {url}\n")
+
+    if scans_found:
+        smallest = scans_found[0]
+        print("=" * 70)
+        print(f"RECOMMENDED: Use scan with {smallest['files']} files ({format_bytes(smallest['bytes'])})")
+        print(f"URL: http://localhost:5173/experiments/{smallest['experiment']}/scans/{smallest['scan']}/cornerstone")
+        print("=" * 70)
+
+    print()
+    default_metrics().print_summary()
+
+
+if __name__ == '__main__':
+    main()
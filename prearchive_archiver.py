@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Clear a prearchive backlog: validate, archive and report, in parallel.
+
+Prearchive.tsx validates and archives one session at a time through
+validateArchive and archivePrearchiveSession. After a scanner backlog that
+means thousands of clicks. This job does the same work in one supervised
+run:
+
+    list       /data/prearchive/projects, optionally for one project
+    rebuild    (optional) sessions in ERROR are rebuilt and waited on
+    validate   /REST/services/validate-archive on a thread pool
+    archive    /REST/services/archive for sessions that passed, through a
+               separate adaptive limiter whose concurrency is cut whenever
+               archive latency or 5xx responses show the server struggling
+    report     one CSV row per session, written as each finishes
+
+Transient failures (connection errors, 429, 5xx) are retried with backoff.
+Before an archive is retried, the session is looked up again: if it has
+left the prearchive, the earlier attempt succeeded and is not repeated, and
+while it is in any state other than READY (e.g. still ARCHIVING after a
+timed-out request) it is polled until it settles instead of being posted
+again. If that lookup keeps failing, the session is reported as failed
+rather than posted blind.
+"""
+import argparse
+import csv
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import requests
+
+from download_scans import configure_pool
+from find_small_scan import login, password, username, xnat_server
+from xnat_throttle import DISTRESS_STATUSES, AdaptiveLimiter, ThrottledSession, TransientError, with_retries
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+BUILDING_STATES = ('BUILDING', 'QUEUED_BUILDING', 'RECEIVING')
+# Prearchive states in which no operation is running on the session (None: it has left the prearchive)
+SETTLED_STATES = (None, 'READY', 'ERROR')
+REPORT_FIELDS = ['project', 'timestamp', 'subject', 'name', 'prearchive_status', 'outcome', 'validation',
+                 'attempts', 'seconds', 'archived_to', 'message']
+
+
+def session_src(entry: dict) -> str:
+    return f"/prearchive/projects/{entry['project']}/{entry['timestamp']}/{entry['subject']}"
+
+
+def list_prearchive(session, server: str, project: str = None) -> list:
+    """Prearchive entries (ResultSet rows), for one project or all of them."""
+    url = f'{server}/data/prearchive/projects/{project}' if project else f'{server}/data/prearchive/projects'
+    response = session.get(url, params={'format': 'json'}, timeout=120)
+    response.raise_for_status()
+    return response.json().get('ResultSet', {}).get('Result', [])
+
+
+def prearchive_status(session, server: str, entry: dict):
+    """Current status of one prearchive entry, or None once it is gone."""
+    response = session.get(f"{server}/data{session_src(entry)}", params={'format': 'json'}, timeout=60)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    rows = response.json().get('ResultSet', {}).get('Result', [])
+    return rows[0].get('status') if rows else None
+
+
+def _post(session, url: str, data: dict, params: dict = None):
+    try:
+        response = session.post(url, data=data, params=params, headers=FORM, timeout=600)
+    except requests.RequestException as e:
+        raise TransientError(str(e)) from e
+    if response.status_code in DISTRESS_STATUSES:
+        raise TransientError(f'HTTP {response.status_code}')
+    return response
+
+
+def parse_validation(data) -> tuple:
+    """
+    Split a validate-archive response into (problems, warnings).
+
+    FAIL entries are problems; WARN and CONFLICT entries come back as
+    (type, text) warnings, and the caller decides whether a conflict
+    blocks archiving.
+    """
+    rows = data.get('ResultSet', {}).get('Result', []) if isinstance(data, dict) else data or []
+    problems, warnings = [], []
+    for row in rows if isinstance(rows, list) else []:
+        kind = str(row.get('type', '')).upper()
+        text = f"{row.get('code', '')} {row.get('message', '')}".strip()
+        if kind == 'FAIL':
+            problems.append(text)
+        elif kind in ('WARN', 'CONFLICT'):
+            warnings.append((kind, text))
+    return problems, warnings
+
+
+class PrearchiveArchiver:
+    """
+    Validates and archives prearchive sessions concurrently.
+
+    Args:
+        session: Authenticated session used for listing and validation
+        server: Base URL of the XNAT server
+        validators: Concurrent validate-archive calls
+        max_archives: Upper bound on concurrent archive calls; the adaptive
+            limiter keeps the actual number lower while the server is slow
+        archive_p95: Archive latency (seconds) above which concurrency is cut
+        overwrite: 'none', 'append' or 'delete', as in the Archive dialog
+        retries: Attempts per request for transient failures
+        rebuild_errors: Rebuild sessions in ERROR before validating them
+        dry_run: Validate only; sessions that would be archived are reported as 'valid'
+    """
+
+    def __init__(self, session, server: str, validators: int = 8, max_archives: int = 4,
+                 archive_p95: float = 120.0, overwrite: str = 'none', retries: int = 4,
+                 rebuild_errors: bool = False, rebuild_timeout: float = 600.0, settle_timeout: float = 1800.0,
+                 dry_run: bool = False):
+        self.session = session
+        self.server = server
+        self.validators = validators
+        self.overwrite = overwrite
+        self.retries = retries
+        self.rebuild_errors = rebuild_errors
+        self.rebuild_timeout = rebuild_timeout
+        self.settle_timeout = settle_timeout
+        self.dry_run = dry_run
+        # Archive calls get their own limiter: they are slow by nature and must
+        # not drag down the limit that listings and validation share.
+        self.archive_session = ThrottledSession(AdaptiveLimiter(target_p95=archive_p95, max_limit=max_archives,
+                                                                initial_limit=max(1, max_archives // 2)))
+        self.archive_session.cookies.update(session.cookies)
+        configure_pool(session, validators + 2)
+        configure_pool(self.archive_session, max_archives + 2)
+        self.archive_pool = ThreadPoolExecutor(max_workers=max_archives, thread_name_prefix='archive')
+
+    def _poll_status(self, entry: dict, busy, timeout: float):
+        """Poll one entry's status, with backoff, until busy(status) is false or timeout passes; returns it."""
+        deadline = time.monotonic() + timeout
+        delay = 2.0
+        while True:
+            time.sleep(delay)
+            status = prearchive_status(self.session, self.server, entry)
+            if not busy(status) or time.monotonic() >= deadline:
+                return status
+            delay = min(30.0, delay * 1.5)
+
+    def rebuild(self, entry: dict) -> str:
+        """Rebuild one session and wait until it leaves the building states; returns its final status."""
+        _post(self.session, f'{self.server}/REST/services/prearchive/rebuild', {'src': session_src(entry)})
+        return self._poll_status(entry, lambda status: status in BUILDING_STATES, self.rebuild_timeout)
+
+    def validate(self, entry: dict):
+        data = {'src': session_src(entry)}
+        if self.overwrite != 'none':
+            data['overwrite'] = self.overwrite
+
+        def call():
+            response = _post(self.session, f'{self.server}/REST/services/validate-archive', data, {'format': 'json'})
+            response.raise_for_status()
+            return response.json()
+
+        result, attempts = with_retries(call, self.retries)
+        problems, warnings = parse_validation(result)
+        if self.overwrite == 'none':
+            problems += [text for kind, text in warnings if kind == 'CONFLICT']
+        return problems, [text for _, text in warnings], attempts
+
+    def archive(self, entry: dict):
+        data = {'src': session_src(entry)}
+        if self.overwrite != 'none':
+            data['overwrite'] = self.overwrite
+
+        def call():
+            response = _post(self.archive_session, f'{self.server}/REST/services/archive', data, {'format': 'csv'})
+            response.raise_for_status()
+            return response.text.strip()
+
+        def settled_status():
+            status = prearchive_status(self.session, self.server, entry)
+            if status not in SETTLED_STATES:
+                status = self._poll_status(entry, lambda status: status not in SETTLED_STATES, self.settle_timeout)
+            return status
+
+        def lookup():
+            try:
+                return settled_status()
+            except (requests.RequestException, ValueError) as e:
+                raise TransientError(f'prearchive status lookup failed: {e}') from e
+
+        def already_archived():
+            # A timed-out archive request may still be running; posting again would archive twice,
+            # so the archive is only retried once the session is known to be back in READY
+            try:
+                status, _ = with_retries(lookup, self.retries)
+            except TransientError as e:
+                raise TransientError(f'{e}; not archiving again') from e
+            if status is None:
+                return '(archived by an earlier attempt)'
+            if status not in SETTLED_STATES:
+                raise TransientError(f'prearchive status still {status} after {self.settle_timeout:.0f}s; '
+                                     f'not archiving again')
+            return None
+
+        return with_retries(call, self.retries, before_retry=already_archived)
+
+    def _prepare(self, entry: dict) -> dict:
+        """Rebuild (if asked) and validate one entry; returns a partial report row."""
+        row = {'project': entry.get('project'), 'timestamp': entry.get('timestamp'), 'subject': entry.get('subject'),
+               'name': entry.get('name'), 'prearchive_status': entry.get('status'), 'attempts': 0}
+        status = entry.get('status')
+        try:
+            if status == 'ERROR' and self.rebuild_errors:
+                status = row['prearchive_status'] = self.rebuild(entry)
+            if status != 'READY':
+                return {**row, 'outcome': 'skipped', 'message': f'prearchive status {status}'}
+            problems, warnings, attempts = self.validate(entry)
+        except (TransientError, requests.RequestException, ValueError) as e:
+            return {**row, 'outcome': 'error', 'validation': 'error', 'message': str(e)}
+        row['attempts'] = attempts
+        if problems:
+            return {**row, 'outcome': 'invalid', 'validation': 'fail', 'message': '; '.join(problems)}
+        return {**row, 'validation': 'warn' if warnings else 'pass', 'message': '; '.join(warnings)}
+
+    def _archive(self, entry: dict, row: dict) -> dict:
+        if self.dry_run:
+            return {**row, 'outcome': 'valid'}
+        try:
+            archived_to, attempts = self.archive(entry)
+        except (TransientError, requests.RequestException) as e:
+            response = getattr(e, 'response', None)
+            detail = response.text.strip()[:500] if response is not None else str(e)
+            return {**row, 'outcome': 'failed', 'message': detail}
+        return {**row, 'outcome': 'archived', 'attempts': row['attempts'] + attempts, 'archived_to': archived_to}
+
+    def run(self, entries: list, report_path: Path) -> dict:
+        """
+        Process every entry, writing one report row per session as it finishes.
+
+        Returns:
+            Counts by outcome
+        """
+        counts = {}
+        lock = threading.Lock()
+        started = time.monotonic()
+
+        with open(report_path, 'w', newline='') as report:
+            writer = csv.DictWriter(report, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+
+            def record(row: dict, began: float):
+                row['seconds'] = f'{time.monotonic() - began:.1f}'
+                with lock:
+                    writer.writerow(row)
+                    report.flush()
+                    counts[row['outcome']] = counts.get(row['outcome'], 0) + 1
+                    done = sum(counts.values())
+                    if done % 100 == 0:
+                        print(f"  {done:,}/{len(entries):,} sessions ({counts.get('archived', 0):,} archived, "
+                              f"{done / (time.monotonic() - started):.1f}/s)")
+
+            def archive_and_record(entry, row, began):
+                record(self._archive(entry, row), began)
+
+            archives = []
+            with ThreadPoolExecutor(max_workers=self.validators, thread_name_prefix='validate') as validators:
+                pending = {validators.submit(self._prepare, entry): (entry, time.monotonic()) for entry in entries}
+                for future in as_completed(pending):
+                    entry, began = pending[future]
+                    row = future.result()
+                    if 'outcome' in row:
+                        record(row, began)
+                    else:
+                        archives.append(self.archive_pool.submit(archive_and_record, entry, row, began))
+            for future in archives:
+                future.result()
+        self.archive_pool.shutdown()
+        return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate and archive prearchive sessions in bulk.')
+    parser.add_argument('--project', help='Only this project\'s prearchive (default: all)')
+    parser.add_argument('--status', action='append', help='Only entries with this status (repeatable; default READY, '
+                                                          'plus ERROR with --rebuild-errors)')
+    parser.add_argument('--rebuild-errors', action='store_true', help='Rebuild sessions in ERROR before validating')
+    parser.add_argument('--overwrite', choices=('none', 'append', 'delete'), default='none')
+    parser.add_argument('--validators', type=int, default=8, help='Concurrent validations')
+    parser.add_argument('--max-archives', type=int, default=4, help='Most archive operations at once')
+    parser.add_argument('--archive-p95', type=float, default=120.0,
+                        help='Archive latency (s) above which archive concurrency is reduced')
+    parser.add_argument('--retries', type=int, default=4)
+    parser.add_argument('--limit', type=int, help='Process at most this many sessions (oldest first)')
+    parser.add_argument('--dry-run', action='store_true', help='Validate only')
+    parser.add_argument('--report', default='prearchive-report.csv')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    args = parser.parse_args(argv)
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    statuses = set(args.status or ['READY'] + (['ERROR'] if args.rebuild_errors else []))
+    entries = [e for e in list_prearchive(session, args.server, args.project) if e.get('status') in statuses]
+    entries.sort(key=lambda e: e.get('uploaded') or e.get('timestamp') or '')
+    if args.limit:
+        entries = entries[:args.limit]
+    print(f"Processing {len(entries):,} prearchive sessions")
+
+    archiver = PrearchiveArchiver(session, args.server, args.validators, args.max_archives, args.archive_p95,
+                                  args.overwrite, args.retries, args.rebuild_errors, dry_run=args.dry_run)
+    started = time.monotonic()
+    counts = archiver.run(entries, Path(args.report))
+    print(f"✓ {counts.get('archived', 0):,} archived, {counts.get('invalid', 0):,} invalid, "
+          f"{counts.get('failed', 0) + counts.get('error', 0):,} failed, {counts.get('skipped', 0):,} skipped "
+          f"in {time.monotonic() - started:.1f}s; report: {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Server-side rendering of scan snapshots (list-page thumbnails).
+
+A snapshot is the middle slice of a scan's DICOM resource, windowed with
+the series' own VOI window (or a robust percentile window when it has
+none), downsampled by area averaging and encoded as WebP or PNG. Results
+are kept in a byte-bounded disk cache keyed by experiment, scan, size and
+format, so a list page costs a few kilobytes per scan instead of a full
+DICOM instance.
+
+Used by xnat_proxy.py to answer the XAPI snapshot URL the app already
+requests; run directly, it pre-generates snapshots for recently archived
+sessions so the first visit to a list page is already a cache hit.
+
+Requires pydicom, NumPy and Pillow.
+"""
+import argparse
+import io
+import re
+import sys
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import requests
+
+from export_catalog import parse_timestamp
+from find_small_scan import login, password, username, xnat_server
+from xnat_proxy import DiskCache, ExpiringMap
+from xnat_stream import iter_result_rows, iter_results
+
+SIZES = (64, 128, 256, 512)
+DEFAULT_SIZE = 256
+FORMATS = {'webp': 'image/webp', 'png': 'image/png'}
+DEFAULT_CACHE_BYTES = 1024 ** 3
+CHUNK_SIZE = 256 * 1024
+
+
+def snap_size(size) -> int:
+    """Round a requested edge length up to one of SIZES so the cache stays small."""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return DEFAULT_SIZE
+    return next((s for s in SIZES if s >= size), SIZES[-1])
+
+
+def snapshot_key(experiment: str, scan: str, size: int, fmt: str) -> str:
+    return f'snapshot/{experiment}/{scan}/{size}.{fmt}'
+
+
+def natural_key(name: str):
+    """Sort key that orders 'IM2' before 'IM10'."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name or '')]
+
+
+def middle_file(rows: list):
+    """Pick the middle instance of a series listing by (natural) file name."""
+    dicom = [r for r in rows if r.get('Name', '').lower().endswith('.dcm')] or rows
+    if not dicom:
+        return None
+    dicom.sort(key=lambda r: natural_key(r.get('Name')))
+    return dicom[len(dicom) // 2]
+
+
+def first_value(value):
+    """First number of a possibly multi-valued DICOM element (WindowCenter may hold several)."""
+    if isinstance(value, Sequence) and not isinstance(value, str):
+        value = value[0] if len(value) else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def window_pixels(ds):
+    """
+    Convert a dataset's pixel data to an 8-bit display image.
+
+    Multi-frame instances use their middle frame. Grayscale data is run
+    through the modality LUT (RescaleSlope/Intercept) and the first VOI
+    window (WindowCenter/Width, DICOM linear function); without a window
+    the 0.5th-99.5th percentile range is used. MONOCHROME1 is inverted.
+
+    Returns:
+        A uint8 array, (rows, columns) or (rows, columns, 3)
+    """
+    import numpy as np
+
+    pixels = ds.pixel_array
+    frames = int(getattr(ds, 'NumberOfFrames', 1) or 1)
+    if frames > 1:
+        pixels = pixels[frames // 2]
+
+    photometric = str(getattr(ds, 'PhotometricInterpretation', 'MONOCHROME2'))
+    if pixels.ndim == 3:
+        if photometric.startswith('YBR'):
+            from pydicom.pixels import convert_color_space
+            pixels = convert_color_space(pixels, photometric, 'RGB')
+        if pixels.dtype != np.uint8:
+            pixels = (pixels / max(float(pixels.max()), 1.0) * 255).astype(np.uint8)
+        return pixels
+
+    values = pixels.astype(np.float32)
+    slope = first_value(getattr(ds, 'RescaleSlope', None))
+    intercept = first_value(getattr(ds, 'RescaleIntercept', None))
+    values = values * (slope if slope is not None else 1.0) + (intercept or 0.0)
+
+    center = first_value(getattr(ds, 'WindowCenter', None))
+    width = first_value(getattr(ds, 'WindowWidth', None))
+    if center is None or width is None or width < 1:
+        low, high = (float(v) for v in np.percentile(values, (0.5, 99.5)))
+    else:
+        low = center - 0.5 - (width - 1) / 2
+        high = center - 0.5 + (width - 1) / 2
+
+    scaled = np.clip((values - low) / max(high - low, 1e-6), 0.0, 1.0) * 255.0
+    if photometric == 'MONOCHROME1':
+        scaled = 255.0 - scaled
+    return scaled.astype(np.uint8)
+
+
+def area_downsample(image, size: int):
+    """Fit an image within size x size, averaging source pixels per output pixel; never upscales."""
+    from PIL import Image
+
+    scale = min(size / image.width, size / image.height)
+    if scale >= 1:
+        return image
+    target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(target, Image.Resampling.BOX)
+
+
+def render_snapshot(data: bytes, size: int = DEFAULT_SIZE, fmt: str = 'webp') -> bytes:
+    """
+    Render one DICOM instance as a thumbnail.
+
+    Args:
+        data: DICOM file bytes
+        size: Maximum edge length in pixels
+        fmt: 'webp' or 'png'
+
+    Returns:
+        Encoded image bytes
+    """
+    import pydicom
+    from PIL import Image
+
+    ds = pydicom.dcmread(io.BytesIO(data))
+    pixels = window_pixels(ds)
+    image = Image.fromarray(pixels, mode='L' if pixels.ndim == 2 else 'RGB')
+    image = area_downsample(image, size)
+
+    out = io.BytesIO()
+    if fmt == 'png':
+        image.save(out, format='PNG', optimize=True)
+    else:
+        image.save(out, format='WEBP', quality=80, method=4)
+    return out.getvalue()
+
+
+class SnapshotRenderer:
+    """
+    Renders and caches snapshots.
+
+    Concurrent requests for the same snapshot render it once. When the
+    proxy's archived-file cache is given, the middle instance is read from
+    it instead of upstream if present. A scan found to have nothing
+    renderable is remembered for failure_ttl seconds and answered with
+    None without downloading its instance again.
+    """
+
+    def __init__(self, cache: DiskCache, file_cache: DiskCache = None, failure_ttl: float = 300.0):
+        self.cache = cache
+        self.file_cache = file_cache
+        self.rendered = 0
+        self.failed = 0
+        # Scans with nothing renderable, so list pages do not re-download their middle instance every visit
+        self._unrenderable = ExpiringMap(failure_ttl)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, server: str, experiment: str, scan: str, size: int = DEFAULT_SIZE,
+            fmt: str = 'webp', headers: dict = None):
+        """
+        Return a cached snapshot, rendering it first if needed.
+
+        Args:
+            session: requests session used for upstream calls
+            server: XNAT base URL
+            experiment: Experiment ID
+            scan: Scan ID
+            size: Edge length (rounded up to one of SIZES)
+            fmt: 'webp' or 'png'
+            headers: Upstream request headers (a proxied user's credentials)
+
+        Returns:
+            (body path, metadata, rendered) or None if the scan has no renderable instance
+        """
+        size = snap_size(size)
+        key = snapshot_key(experiment, scan, size, fmt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return (*cached, False)
+        if self._unrenderable.get((experiment, scan)):
+            return None
+
+        with self._lock:
+            lock = self._pending.setdefault(key, threading.Lock())
+        with lock:
+            try:
+                return self._render(session, server, experiment, scan, size, fmt, headers, key)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+
+    def _render(self, session, server, experiment, scan, size, fmt, headers, key):
+        cached = self.cache.get(key)
+        if cached is not None:
+            return (*cached, False)
+        if self._unrenderable.get((experiment, scan)):
+            return None
+        try:
+            data = self._fetch_middle(session, server, experiment, scan, headers)
+            body = render_snapshot(data, size, fmt) if data else None
+        except requests.RequestException:
+            raise
+        except Exception:
+            # Unsupported transfer syntax, truncated file, etc.
+            body = None
+
+        if body is None:
+            self._unrenderable.put((experiment, scan), True)
+            with self._lock:
+                self.failed += 1
+            return None
+
+        temp = self.cache.begin()
+        with temp:
+            temp.write(body)
+        path = self.cache.commit(key, temp.name, FORMATS[fmt])
+        if path is None:
+            self.cache.discard(temp.name)
+            return None
+        with self._lock:
+            self.rendered += 1
+        return path, {'key': key, 'content_type': FORMATS[fmt], 'size': len(body)}, True
+
+    def _fetch_middle(self, session, server: str, experiment: str, scan: str, headers: dict = None):
+        listing = f'{server}/data/archive/experiments/{experiment}/scans/{scan}/resources/DICOM/files'
+        with session.get(listing, params={'format': 'json'}, headers=headers, stream=True) as response:
+            if response.status_code == 404:
+                return None  # no DICOM resource
+            # Other failures (auth, server errors) say nothing about the scan and are not remembered
+            response.raise_for_status()
+            row = middle_file(list(iter_result_rows(response.iter_content(CHUNK_SIZE))))
+        if row is None:
+            return None
+
+        if self.file_cache is not None:
+            name = row.get('URI', '').split('/files/', 1)[-1] or row.get('Name')
+            cached = self.file_cache.get(f'{experiment}/{scan}/DICOM/{name}')
+            if cached is not None:
+                return cached[0].read_bytes()
+
+        response = session.get(f"{server}{row['URI']}", headers=headers)
+        response.raise_for_status()
+        return response.content
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.cache.stats(), 'rendered': self.rendered, 'failed': self.failed}
+
+
+def iter_new_scans(session, server: str, since: datetime = None, projects: list = None):
+    """
+    Yield (experiment, scan) pairs for imaging sessions archived since a time.
+
+    Args:
+        session: Authenticated session
+        server: Base URL of the XNAT server
+        since: Only sessions inserted at or after this time (None for all)
+        projects: Restrict to these project IDs
+
+    Yields:
+        (experiment ID, scan ID) tuples
+    """
+    urls = ([f'{server}/data/archive/projects/{p}/experiments' for p in projects] if projects
+            else [f'{server}/data/experiments'])
+    for url in urls:
+        for exp in iter_results(session, url, columns='ID,project,xsiType,insert_date'):
+            if 'SessionData' not in exp.get('xsiType', ''):
+                continue
+            if since is not None:
+                inserted = parse_timestamp(exp.get('insert_date'))
+                if inserted is None or inserted < since:
+                    continue
+            exp_id = exp.get('ID')
+            for scan in iter_results(session, f'{server}/data/archive/experiments/{exp_id}/scans'):
+                yield exp_id, scan.get('ID')
+
+
+def pregenerate(session, server: str, renderer: SnapshotRenderer, scans, sizes=(DEFAULT_SIZE,),
+                formats=('webp',), workers: int = 8) -> dict:
+    """
+    Render snapshots for many scans on a thread pool.
+
+    Returns:
+        Counts of rendered, cached and failed snapshots
+    """
+    counts = {'rendered': 0, 'cached': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(renderer.get, session, server, exp_id, scan_id, size, fmt)
+                   for exp_id, scan_id in scans for size in sizes for fmt in formats]
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except requests.RequestException:
+                result = None
+            if result is None:
+                counts['failed'] += 1
+            else:
+                counts['rendered' if result[2] else 'cached'] += 1
+            done = sum(counts.values())
+            if done % 100 == 0:
+                print(f"  {done:,}/{len(futures):,} snapshots")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-generate scan snapshots for recently archived sessions.')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    parser.add_argument('--project', action='append', dest='projects', help='Project ID (repeatable; default: all)')
+    parser.add_argument('--since-hours', type=float, default=24.0,
+                        help='Sessions archived within this many hours (0 = every session)')
+    parser.add_argument('--size', type=int, action='append', dest='sizes', help=f'Edge length (repeatable; default {DEFAULT_SIZE})')
+    parser.add_argument('--format', action='append', dest='formats', choices=sorted(FORMATS))
+    parser.add_argument('--cache-dir', default='.xnat-cache/snapshots', help="Same directory as the proxy's snapshot cache")
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_CACHE_BYTES / 1024 ** 2)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    since = datetime.now() - timedelta(hours=args.since_hours) if args.since_hours else None
+    sizes = sorted({snap_size(s) for s in args.sizes or [DEFAULT_SIZE]})
+    formats = args.formats or ['webp']
+    renderer = SnapshotRenderer(DiskCache(Path(args.cache_dir), int(args.cache_mb * 1024 ** 2)))
+
+    started = time.monotonic()
+    scans = list(iter_new_scans(session, args.server, since, args.projects))
+    print(f"Rendering {len(scans):,} scans x {len(sizes)} sizes x {len(formats)} formats...")
+    counts = pregenerate(session, args.server, renderer, scans, sizes, formats, args.workers)
+    print(f"✓ {counts['rendered']:,} rendered, {counts['cached']:,} already cached, "
+          f"{counts['failed']:,} failed in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
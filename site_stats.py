@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Materialized site statistics for the dashboards.
+
+When /xapi/totalCounts/reset fails, getTotalCounts falls back to full
+listings of /data/projects, /data/subjects and /data/experiments, and
+Dashboard/AnalyticsDashboard recompute their aggregates in the browser on
+every load. This job keeps those numbers precomputed instead:
+
+    crawl        one streamed experiments listing per run; only experiments
+                 that are new or whose last_modified/insert_date changed
+                 have their scans' files listed to (re)measure files and
+                 bytes. Results live in a small SQLite store.
+    materialize  per-project totals with modality and month breakdowns are
+                 written atomically to one JSON document
+    serve        xnat_proxy.py answers /_site/stats (and /_site/totalCounts
+                 in the /xapi/totalCounts shape) from that document,
+                 restricted to the projects the caller can see
+
+A dashboard load is then one small JSON read, whatever the size of the
+archive.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+from export_catalog import modality_from_xsi_type
+from find_small_scan import file_size, format_bytes, login, password, username, xnat_server
+from xnat_stream import iter_result_rows
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS subjects (
+    id TEXT PRIMARY KEY,
+    project TEXT
+);
+CREATE TABLE IF NOT EXISTS experiments (
+    id TEXT PRIMARY KEY,
+    project TEXT,
+    subject TEXT,
+    xsi_type TEXT,
+    modality TEXT,
+    month TEXT,
+    stamp TEXT,
+    files INTEGER,
+    bytes INTEGER,
+    measured_stamp TEXT,
+    measured_at REAL
+);
+CREATE INDEX IF NOT EXISTS experiments_project ON experiments (project);
+CREATE INDEX IF NOT EXISTS subjects_project ON subjects (project);
+"""
+
+DEFAULT_OUT = '.xnat-cache/site-stats.json'
+BATCH = 1000
+
+
+def open_store(db_path: Path) -> sqlite3.Connection:
+    """Open (creating if needed) a statistics store."""
+    conn = sqlite3.connect(str(db_path))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def iter_listing(session, url: str, **params):
+    """Stream a listing's rows, raising on failure (an empty result must mean an empty listing here)."""
+    with session.get(url, params={'format': 'json', **params}, stream=True, timeout=600) as response:
+        response.raise_for_status()
+        yield from iter_result_rows(response.iter_content(chunk_size=256 * 1024))
+
+
+def _replace_all(conn: sqlite3.Connection, table: str, rows):
+    """Replace a table's contents in one transaction; a failed listing leaves the old rows in place."""
+    with conn:
+        conn.execute(f'DELETE FROM {table}')
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH:
+                conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({', '.join('?' * len(row))})", batch)
+                batch = []
+        if batch:
+            conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({', '.join('?' * len(batch[0]))})", batch)
+
+
+class StatsCrawler:
+    """
+    Incrementally refreshes the statistics store from XNAT listings.
+
+    Args:
+        session: Authenticated session (an admin sees the whole site)
+        server: Base URL of the XNAT server
+        conn: Store opened with open_store
+        workers: Experiments measured concurrently
+    """
+
+    def __init__(self, session, server: str, conn: sqlite3.Connection, workers: int = 8):
+        self.session = session
+        self.server = server
+        self.conn = conn
+        self.workers = workers
+
+    def sync_projects_and_subjects(self):
+        _replace_all(self.conn, 'projects', ((p.get('ID'), p.get('name')) for p in
+                                             iter_listing(self.session, f'{self.server}/data/projects')))
+        _replace_all(self.conn, 'subjects', ((s.get('ID'), s.get('project')) for s in
+                                             iter_listing(self.session, f'{self.server}/data/subjects',
+                                                          columns='ID,project')))
+
+    def sync_experiments(self) -> list:
+        """
+        Upsert every experiment from one listing and drop vanished ones.
+
+        Returns:
+            (id, stamp) of experiments that need (re)measuring
+        """
+        known = {row[0]: row[1:] for row in self.conn.execute('SELECT id, stamp, measured_stamp FROM experiments')}
+        seen, stale, batch = set(), [], []
+
+        def flush():
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT INTO experiments (id, project, subject, xsi_type, modality, month, stamp) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET project = excluded.project, '
+                    'subject = excluded.subject, xsi_type = excluded.xsi_type, modality = excluded.modality, '
+                    'month = excluded.month, stamp = excluded.stamp', batch)
+            batch.clear()
+
+        for exp in iter_listing(self.session, f'{self.server}/data/experiments',
+                                columns='ID,project,subject_ID,xsiType,date,insert_date,last_modified'):
+            exp_id = exp.get('ID')
+            if not exp_id:
+                continue
+            seen.add(exp_id)
+            xsi_type = exp.get('xsiType') or ''
+            month = (exp.get('date') or exp.get('insert_date') or '')[:7] or None
+            stamp = exp.get('last_modified') or exp.get('insert_date') or ''
+            batch.append((exp_id, exp.get('project'), exp.get('subject_ID'), xsi_type,
+                          modality_from_xsi_type(xsi_type), month, stamp))
+            previous = known.get(exp_id)
+            if previous is None or previous[1] != stamp:
+                stale.append((exp_id, stamp))
+            if len(batch) >= BATCH:
+                flush()
+        flush()
+
+        gone = [(exp_id,) for exp_id in known if exp_id not in seen]
+        with self.conn:
+            self.conn.executemany('DELETE FROM experiments WHERE id = ?', gone)
+        return stale
+
+    def measure(self, experiment: str):
+        """Count files and bytes across an experiment's scans."""
+        files = total = 0
+        for scan in iter_listing(self.session, f'{self.server}/data/archive/experiments/{experiment}/scans'):
+            for row in iter_listing(self.session,
+                                    f"{self.server}/data/archive/experiments/{experiment}/scans/{scan.get('ID')}/files"):
+                files += 1
+                total += file_size(row)
+        return files, total
+
+    def _measure_job(self, job):
+        experiment, stamp = job
+        try:
+            return experiment, stamp, self.measure(experiment)
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠ {experiment}: {e}")
+            return experiment, stamp, None
+
+    def _store_measurements(self, batch: list):
+        with self.conn:
+            self.conn.executemany('UPDATE experiments SET files = ?, bytes = ?, measured_stamp = ?, measured_at = ? '
+                                  'WHERE id = ?', batch)
+        batch.clear()
+
+    def sync(self, remeasure_days: float = None) -> dict:
+        """
+        Run one incremental pass.
+
+        Args:
+            remeasure_days: Also re-measure experiments measured longer ago than this
+
+        Returns:
+            Counts of experiments listed, measured and failed
+        """
+        self.sync_projects_and_subjects()
+        stale = self.sync_experiments()
+        if remeasure_days is not None:
+            cutoff = time.time() - remeasure_days * 86400
+            stale += self.conn.execute('SELECT id, stamp FROM experiments WHERE measured_at < ?', (cutoff,)).fetchall()
+        stale = list(dict(stale).items())
+
+        measured = failed = 0
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # Workers only talk to XNAT; results are written from this thread
+            for experiment, stamp, result in pool.map(self._measure_job, stale):
+                if result is None:
+                    failed += 1
+                    continue
+                measured += 1
+                batch.append((*result, stamp, time.time(), experiment))
+                if len(batch) >= 100:
+                    self._store_measurements(batch)
+                if (measured + failed) % 1000 == 0:
+                    print(f"  {measured + failed:,}/{len(stale):,} experiments measured")
+        self._store_measurements(batch)
+        listed = self.conn.execute('SELECT COUNT(*) FROM experiments').fetchone()[0]
+        return {'experiments': listed, 'measured': measured, 'failed': failed}
+
+
+def materialize(conn: sqlite3.Connection) -> dict:
+    """Build the statistics document: per-project totals with modality and month breakdowns."""
+    projects = {pid: {'name': name, 'subjects': 0, 'experiments': 0, 'files': 0, 'bytes': 0,
+                      'modalities': {}, 'months': {}}
+                for pid, name in conn.execute('SELECT id, name FROM projects')}
+
+    def project(pid):
+        return projects.setdefault(pid, {'name': None, 'subjects': 0, 'experiments': 0, 'files': 0, 'bytes': 0,
+                                         'modalities': {}, 'months': {}})
+
+    for pid, count in conn.execute('SELECT project, COUNT(*) FROM subjects GROUP BY project'):
+        project(pid)['subjects'] = count
+    for pid, modality, month, count, files, total in conn.execute(
+            'SELECT project, modality, month, COUNT(*), COALESCE(SUM(files), 0), COALESCE(SUM(bytes), 0) '
+            'FROM experiments GROUP BY project, modality, month'):
+        entry = project(pid)
+        entry['experiments'] += count
+        entry['files'] += files
+        entry['bytes'] += total
+        for bucket, key in (('modalities', modality or 'OTHER'), ('months', month or 'unknown')):
+            slot = entry[bucket].setdefault(key, {'experiments': 0, 'files': 0, 'bytes': 0})
+            slot['experiments'] += count
+            slot['files'] += files
+            slot['bytes'] += total
+
+    unmeasured = conn.execute('SELECT COUNT(*) FROM experiments WHERE measured_at IS NULL').fetchone()[0]
+    return {'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'unmeasured_experiments': unmeasured, 'projects': projects}
+
+
+def write_document(doc: dict, path: Path):
+    """Write the document atomically, so readers never see a partial file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.site-stats-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(doc, f, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+
+class SiteStats:
+    """
+    Read side of the statistics document, reloaded when the file changes.
+
+    view() aggregates only the projects a caller may see, so one document
+    serves every user.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.doc = None
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """The current document, or None if the job has not written one yet."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            if mtime != self.mtime:
+                self.doc = json.loads(self.path.read_text())
+                self.mtime = mtime
+            return self.doc
+
+    def view(self, visible_projects=None) -> dict:
+        """
+        Totals, per-project rows and modality/month breakdowns over the visible projects.
+
+        Args:
+            visible_projects: Project IDs to include (None for all)
+        """
+        doc = self.load()
+        if doc is None:
+            return None
+        projects = {pid: entry for pid, entry in doc['projects'].items()
+                    if visible_projects is None or pid in visible_projects}
+
+        totals = {'projects': len(projects), 'subjects': 0, 'experiments': 0, 'files': 0, 'bytes': 0}
+        by_modality, by_month = {}, {}
+        for entry in projects.values():
+            for key in ('subjects', 'experiments', 'files', 'bytes'):
+                totals[key] += entry[key]
+            for source, target in ((entry['modalities'], by_modality), (entry['months'], by_month)):
+                for key, slot in source.items():
+                    merged = target.setdefault(key, {'experiments': 0, 'files': 0, 'bytes': 0})
+                    for field in merged:
+                        merged[field] += slot[field]
+
+        return {
+            'generated_at': doc['generated_at'],
+            'totals': totals,
+            'by_project': sorted(({'project': pid, 'name': e['name'], **{k: e[k] for k in
+                                   ('subjects', 'experiments', 'files', 'bytes')}} for pid, e in projects.items()),
+                                 key=lambda row: -row['bytes']),
+            'by_modality': [{'modality': k, **v} for k, v in sorted(by_modality.items())],
+            'by_month': [{'month': k, **v} for k, v in sorted(by_month.items())],
+        }
+
+    def total_counts(self, visible_projects=None) -> dict:
+        """The view's totals in the /xapi/totalCounts response shape getTotalCounts reads."""
+        view = self.view(visible_projects)
+        if view is None:
+            return None
+        totals = view['totals']
+        return {'xnat:projectData': totals['projects'], 'xnat:subjectData': totals['subjects'],
+                'xnat:imageSessionData': totals['experiments']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Maintain precomputed XNAT site statistics for the dashboards.')
+    parser.add_argument('--db', default='site-stats.sqlite', help='Incremental crawl state')
+    parser.add_argument('--out', default=DEFAULT_OUT, help='Statistics document served by xnat_proxy.py')
+    parser.add_argument('--workers', type=int, default=8, help='Experiments measured concurrently')
+    parser.add_argument('--remeasure-days', type=float, help='Re-measure experiments measured longer ago than this')
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help='Repeat at this interval')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    args = parser.parse_args(argv)
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    conn = open_store(Path(args.db))
+    crawler = StatsCrawler(session, args.server, conn, args.workers)
+    while True:
+        started = time.monotonic()
+        counts = crawler.sync(args.remeasure_days)
+        doc = materialize(conn)
+        write_document(doc, Path(args.out))
+        total_bytes = sum(p['bytes'] for p in doc['projects'].values())
+        print(f"✓ {counts['experiments']:,} experiments ({counts['measured']:,} measured, {counts['failed']:,} "
+              f"failed), {format_bytes(total_bytes)} in {time.monotonic() - started:.1f}s -> {args.out}")
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
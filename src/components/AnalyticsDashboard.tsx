@@ -108,25 +108,59 @@ const formatCount = (value?: number): string => {
 export function AnalyticsDashboard() {
   const { client, currentUser } = useXnat();
 
-  const { data: projects, isLoading: projectsLoading } = useQuery({
+  // Aggregates precomputed by site_stats.py behind xnat_proxy.py; the full listings are only fetched without them
+  const { data: siteStats, isFetched: siteStatsFetched } = useQuery({
+    queryKey: ['analytics-site-stats'],
+    queryFn: () => client?.getSiteStats() ?? null,
+    enabled: Boolean(client),
+  });
+  const computeInBrowser = siteStatsFetched && !siteStats;
+
+  const { data: projects, isLoading: projectsQueryLoading } = useQuery({
     queryKey: ['analytics-projects'],
     queryFn: () => client?.getProjects() ?? [],
-    enabled: Boolean(client),
+    enabled: Boolean(client) && computeInBrowser,
   });
 
-  const { data: subjects, isLoading: subjectsLoading } = useQuery({
+  const { data: subjects, isLoading: subjectsQueryLoading } = useQuery({
     queryKey: ['analytics-subjects'],
     queryFn: () => client?.getSubjects() ?? [],
-    enabled: Boolean(client),
+    enabled: Boolean(client) && computeInBrowser,
   });
 
-  const { data: experiments, isLoading: experimentsLoading } = useQuery({
+  const { data: experiments, isLoading: experimentsQueryLoading } = useQuery({
     queryKey: ['analytics-experiments'],
     queryFn: () => client?.getExperiments() ?? [],
-    enabled: Boolean(client),
+    enabled: Boolean(client) && computeInBrowser,
   });
 
+  const statsPending = !siteStatsFetched;
+  const projectsLoading = statsPending || projectsQueryLoading;
+  const subjectsLoading = statsPending || subjectsQueryLoading;
+  const experimentsLoading = statsPending || experimentsQueryLoading;
+
   const chartData = useMemo(() => {
+    if (siteStats) {
+      return {
+        projectDistribution: siteStats.by_project
+          .map((row) => ({
+            name: row.name || row.project || 'Unknown',
+            subjects: row.subjects,
+            experiments: row.experiments,
+            total: row.subjects + row.experiments,
+          }))
+          .sort((a, b) => b.total - a.total)
+          .slice(0, 10),
+        experimentTypes: siteStats.by_modality.map((row) => ({
+          name: row.modality || 'Unknown',
+          value: row.experiments,
+        })),
+        timeline: siteStats.by_month.slice(-30).map((row) => ({
+          date: row.month,
+          experiments: row.experiments,
+        })),
+      };
+    }
     if (!projects || !subjects || !experiments) {
       return null;
     }
@@ -175,12 +209,18 @@ export function AnalyticsDashboard() {
       experimentTypes,
       timeline,
     };
-  }, [projects, subjects, experiments]);
+  }, [siteStats, projects, subjects, experiments]);
+
+  const totals = siteStats?.totals ?? {
+    projects: projects?.length ?? 0,
+    subjects: subjects?.length ?? 0,
+    experiments: experiments?.length ?? 0,
+  };
 
   const stats = [
     {
       label: 'Projects',
-      value: projects?.length ?? 0,
+      value: totals.projects,
       icon: Folder,
       color: 'bg-blue-500',
       href: '/projects',
@@ -188,7 +228,7 @@ export function AnalyticsDashboard() {
     },
     {
       label: 'Subjects',
-      value: subjects?.length ?? 0,
+      value: totals.subjects,
       icon: Users,
       color: 'bg-green-500',
       href: '/subjects',
@@ -196,7 +236,7 @@ export function AnalyticsDashboard() {
     },
     {
       label: 'Experiments',
-      value: experiments?.length ?? 0,
+      value: totals.experiments,
       icon: FileImage,
       color: 'bg-purple-500',
       href: '/experiments',
@@ -204,10 +244,7 @@ export function AnalyticsDashboard() {
     },
     {
       label: 'Avg Experiments / Project',
-      value:
-        projects && experiments && projects.length > 0
-          ? experiments.length / projects.length
-          : 0,
+      value: totals.projects > 0 ? totals.experiments / totals.projects : 0,
       icon: Activity,
       color: 'bg-amber-500',
       href: '/experiments',
@@ -19,12 +19,17 @@ import {
   Camera
 } from 'lucide-react';
 import { Tooltip } from './Tooltip';
+import { markViewerMilestone, resetViewerReadiness } from '../utils/viewerReadiness';
 
 const { ViewportType } = Enums;
 
+// Slice downloads in flight at once after the first image is rendered
+const SLICE_FETCH_CONCURRENCY = 6;
+
 export function CornerstoneViewer() {
   const { client, config } = useXnat();
   const { experimentId, scanId } = useParams();
+  const readinessKey = `${experimentId}/${scanId}`;
 
   const axialRef = useRef<HTMLDivElement>(null);
   const sagittalRef = useRef<HTMLDivElement>(null);
@@ -61,6 +66,25 @@ export function CornerstoneViewer() {
 
   // Store loaded image data
   const imageDataCache = useRef<Map<string, ArrayBuffer>>(new Map());
+  // Fetches a slice of the current scan on demand, for slices the background download has not reached yet
+  const fetchSliceRef = useRef<((fileName: string) => Promise<void>) | null>(null);
+
+  // Readiness milestones for automation; declared first so the reset runs before any mark
+  useEffect(() => {
+    resetViewerReadiness(readinessKey);
+  }, [readinessKey]);
+
+  useEffect(() => {
+    if (client) {
+      markViewerMilestone(readinessKey, 'auth-ready');
+    }
+  }, [client, readinessKey]);
+
+  useEffect(() => {
+    if (error) {
+      markViewerMilestone(readinessKey, 'error', { message: error });
+    }
+  }, [error, readinessKey]);
 
   // Handle global mouse up for histogram dragging
   useEffect(() => {
@@ -88,13 +112,18 @@ export function CornerstoneViewer() {
         console.log('Cornerstone3D core initialized');
 
         // Register custom DICOM image loader
-        const customImageLoader = (imageId: string) => {
+        const customImageLoader = (imageId: string): { promise: Promise<any> } => {
           const loadImagePromise = new Promise<any>((resolve, reject) => {
             try {
               const fileName = imageId.replace('dicomfile:', '');
               const arrayBuffer = imageDataCache.current.get(fileName);
 
               if (!arrayBuffer) {
+                // Scrolled onto a slice the background download has not reached: fetch it first
+                if (fetchSliceRef.current) {
+                  fetchSliceRef.current(fileName).then(() => customImageLoader(imageId).promise).then(resolve, reject);
+                  return;
+                }
                 reject(new Error(`Image data not found for ${fileName}`));
                 return;
               }
@@ -290,6 +319,7 @@ export function CornerstoneViewer() {
 
         if (dicomFiles.length > 0) {
           console.log(`Loaded ${dicomFiles.length} DICOM files`);
+          markViewerMilestone(readinessKey, 'metadata-loaded', { files: dicomFiles.length });
           setAllFiles(dicomFiles);
         } else {
           setError('No DICOM files found in this scan');
@@ -303,7 +333,7 @@ export function CornerstoneViewer() {
     };
 
     fetchAllFiles();
-  }, [client, config, experimentId, scanId]);
+  }, [client, config, experimentId, scanId, readinessKey]);
 
   // Load volume when initialized and files are available
   useEffect(() => {
@@ -338,16 +368,15 @@ export function CornerstoneViewer() {
           coronal: coronalRef.current
         });
 
-        // Fetch DICOM files and cache them
-        const imageIds: string[] = [];
+        const sessionId = config?.jsessionid ?? localStorage.getItem(STORAGE_KEYS.JSESSIONID);
+        const headers: HeadersInit = sessionId ? { Cookie: `JSESSIONID=${sessionId}` } : {};
+        let totalBytes = 0;
+        // Slices are keyed by file name, which other scans reuse
+        imageDataCache.current.clear();
 
-        for (let i = 0; i < allFiles.length; i++) {
-          const fileName = allFiles[i];
+        // Fetch one DICOM file into the cache read by the custom image loader and histogram calculation
+        const downloadSlice = async (fileName: string) => {
           const url = `/api/xnat/data/archive/experiments/${experimentId}/scans/${scanId}/resources/DICOM/files/${fileName}`;
-
-          const sessionId = config?.jsessionid ?? localStorage.getItem(STORAGE_KEYS.JSESSIONID);
-          const headers: HeadersInit = sessionId ? { Cookie: `JSESSIONID=${sessionId}` } : {};
-
           const response = await fetch(url, {
             headers,
             credentials: 'include',
@@ -358,13 +387,30 @@ export function CornerstoneViewer() {
           }
 
           const arrayBuffer = await response.arrayBuffer();
-
-          // Store in cache for custom image loader and histogram calculation
+          totalBytes += arrayBuffer.byteLength;
           imageDataCache.current.set(fileName, arrayBuffer);
+        };
 
-          // Use custom 'dicomfile:' scheme
-          imageIds.push(`dicomfile:${fileName}`);
-        }
+        // Each slice is downloaded once, whether the background fetch or the image loader asks first
+        const downloads = new Map<string, Promise<void>>();
+        const fetchSlice = (fileName: string) => {
+          let download = downloads.get(fileName);
+          if (!download) {
+            download = downloadSlice(fileName);
+            downloads.set(fileName, download);
+          }
+          return download;
+        };
+        fetchSliceRef.current = fetchSlice;
+
+        // Use custom 'dicomfile:' scheme
+        const imageIds = allFiles.map(fileName => `dicomfile:${fileName}`);
+        const midIndex = Math.floor(imageIds.length / 2);
+
+        // The viewports open on the first (axial) and middle (sagittal, coronal) slices; fetch only
+        // those before rendering and the rest once the first image is on screen
+        const initialIndices = [...new Set([0, midIndex])];
+        await Promise.all(initialIndices.map(index => fetchSlice(allFiles[index])));
 
         addDebug(`Created ${imageIds.length} image IDs for custom loader`);
 
@@ -434,7 +480,6 @@ export function CornerstoneViewer() {
         addDebug('Axial viewport initialized, using DICOM window/level values');
 
         // For now, just load middle slice into other viewports
-        const midIndex = Math.floor(imageIds.length / 2);
         const sagittalViewport = renderingEngine.getViewport('SAGITTAL') as any;
         addDebug('Setting sagittal stack with middle slice');
         await sagittalViewport.setStack([imageIds[midIndex]]);
@@ -475,6 +520,7 @@ export function CornerstoneViewer() {
         // Render all viewports
         addDebug('Rendering viewports...');
         renderingEngine.render();
+        markViewerMilestone(readinessKey, 'first-image-rendered');
 
         // Check if images are actually displayed
         viewports.forEach(vp => {
@@ -529,8 +575,20 @@ export function CornerstoneViewer() {
           }
         }, 300);
 
+        // Fetch the remaining slices a few at a time (about the browser's per-host connection limit)
+        const remaining = allFiles.filter((_, index) => !initialIndices.includes(index));
+        let next = 0;
+        const fetchRemaining = async () => {
+          while (next < remaining.length) {
+            await fetchSlice(remaining[next++]);
+          }
+        };
+        await Promise.all(Array.from({ length: Math.min(SLICE_FETCH_CONCURRENCY, remaining.length) }, fetchRemaining));
+        addDebug(`Fetched all ${allFiles.length} slices`);
+
         setVolumeLoaded(true);
         setError('');
+        markViewerMilestone(readinessKey, 'volume-complete', { slices: imageIds.length, bytes: totalBytes });
 
         // Calculate initial histogram for middle slice
         updateHistogramForSlice(midIndex);
@@ -543,7 +601,7 @@ export function CornerstoneViewer() {
     };
 
     loadVolume();
-  }, [isInitialized, allFiles, experimentId, scanId, config]);
+  }, [isInitialized, allFiles, experimentId, scanId, config, readinessKey]);
 
   const toggleFullscreen = () => {
     setIsFullscreen(!isFullscreen);
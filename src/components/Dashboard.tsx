@@ -18,10 +18,16 @@ export function Dashboard() {
 
   const { data: counts, isLoading: countsLoading } = useQuery<XnatTotalCounts>({
     queryKey: ['dashboard-counts', baseUrl],
-    queryFn: () => {
+    queryFn: async () => {
       if (!client) {
         throw new Error('XNAT client is not initialized');
       }
+      // Precomputed totals from the proxy when available; otherwise XNAT's own counts
+      const siteStats = await client.getSiteStats();
+      if (siteStats) {
+        const { projects, subjects, experiments } = siteStats.totals;
+        return { projects, subjects, experiments };
+      }
       return client.getTotalCounts();
     },
     enabled: Boolean(client),
@@ -268,6 +268,21 @@ export interface XnatTotalCounts {
   experiments: number;
 }
 
+export interface XnatSiteStatsSlice {
+  experiments: number;
+  files: number;
+  bytes: number;
+}
+
+/** Precomputed by site_stats.py and served by xnat_proxy.py at /_site/stats, limited to the caller's projects. */
+export interface XnatSiteStats {
+  generated_at: string;
+  totals: XnatTotalCounts & { files: number; bytes: number };
+  by_project: Array<{ project: string; name: string; subjects: number } & XnatSiteStatsSlice>;
+  by_modality: Array<{ modality: string } & XnatSiteStatsSlice>;
+  by_month: Array<{ month: string } & XnatSiteStatsSlice>;
+}
+
 export interface XnatContainer {
   id?: string | number;
   status?: string;
@@ -1199,6 +1214,19 @@ export class XnatApiClient {
     };
   }
 
+  /** The proxy's precomputed site statistics, or null when not deployed behind xnat_proxy.py or not generated yet. */
+  async getSiteStats(): Promise<XnatSiteStats | null> {
+    try {
+      const response = await this.client.get('/_site/stats');
+      const data = response.data;
+      return data && typeof data === 'object' && data.totals && Array.isArray(data.by_project)
+        ? (data as XnatSiteStats)
+        : null;
+    } catch {
+      return null;
+    }
+  }
+
   async getTotalCounts(): Promise<XnatTotalCounts> {
     try {
       const response = await this.client.get('/xapi/totalCounts/reset');
@@ -1210,6 +1238,20 @@ export class XnatApiClient {
     } catch (error) {
       console.warn('Falling back to calculated counts', error);
 
+      // Precomputed by site_stats.py and served by xnat_proxy.py, when deployed behind it
+      try {
+        const response = await this.client.get('/_site/totalCounts');
+        if (response.data && typeof response.data === 'object' && 'xnat:projectData' in response.data) {
+          return {
+            projects: Number(response.data['xnat:projectData'] ?? 0),
+            subjects: Number(response.data['xnat:subjectData'] ?? 0),
+            experiments: Number(response.data['xnat:imageSessionData'] ?? 0),
+          };
+        }
+      } catch {
+        // Not behind the proxy, or no statistics document yet
+      }
+
       const fetchTotal = async (path: string): Promise<number> => {
         const res = await this.client.get(path, {
           params: { format: 'json', columns: 'ID' },
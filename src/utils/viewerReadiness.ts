@@ -0,0 +1,51 @@
+export type ViewerMilestone =
+  | 'auth-ready'
+  | 'metadata-loaded'
+  | 'first-image-rendered'
+  | 'volume-complete'
+  | 'error';
+
+export interface ViewerReadiness {
+  /** `${experimentId}/${scanId}` of the scan being loaded */
+  key: string;
+  /** performance.now() at which each milestone was first reached */
+  milestones: Partial<Record<ViewerMilestone, number>>;
+  detail: Record<string, unknown>;
+}
+
+declare global {
+  interface Window {
+    __morpheusViewer?: ViewerReadiness;
+  }
+}
+
+export const VIEWER_READINESS_EVENT = 'morpheus:viewer-readiness';
+
+/**
+ * Start a fresh milestone record for a scan. Automation reads it from
+ * window.__morpheusViewer, the `data-viewer-milestones` attribute on <html>,
+ * the VIEWER_READINESS_EVENT window event or `morpheus:<milestone>`
+ * performance marks, instead of sleeping for a fixed time.
+ */
+export const resetViewerReadiness = (key: string): void => {
+  window.__morpheusViewer = { key, milestones: {}, detail: {} };
+  document.documentElement.dataset.viewerScan = key;
+  document.documentElement.dataset.viewerMilestones = '';
+};
+
+export const markViewerMilestone = (
+  key: string,
+  milestone: ViewerMilestone,
+  detail: Record<string, unknown> = {},
+): void => {
+  const state = window.__morpheusViewer;
+  // Ignore late callbacks from a scan the viewer has already left
+  if (!state || state.key !== key || state.milestones[milestone] !== undefined) return;
+
+  const at = performance.now();
+  state.milestones[milestone] = at;
+  Object.assign(state.detail, detail);
+  performance.mark(`morpheus:${milestone}`, { detail: { key, ...detail } });
+  document.documentElement.dataset.viewerMilestones = Object.keys(state.milestones).join(' ');
+  window.dispatchEvent(new CustomEvent(VIEWER_READINESS_EVENT, { detail: { key, milestone, at, ...detail } }));
+};
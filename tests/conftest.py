@@ -0,0 +1,125 @@
+"""
+Fixtures for the viewer suite.
+
+Each pytest process (each xdist worker under `pytest -n <workers>`) keeps a
+session-wide BrowserPool of --browsers warm headless Chromes. The app is
+logged into once per run: the first worker signs in through the login form
+and writes the auth snapshot next to the run's temp directory, and every
+other worker replays it.
+
+The app (npm run dev) and the XNAT server behind it must already be running.
+"""
+import fcntl
+import json
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+
+import pytest
+
+from find_small_scan import password, username
+from viewer_browser import (DEFAULT_APP_URL, BrowserPool, apply_auth, capture_auth, login_through_ui,
+                            resolve_chromedriver, start_browser)
+
+# Scans the old standalone scripts were pointed at: a multi-slice MR and a single-file scan
+DEFAULT_SCANS = ('XNAT_E00041/2', 'XNAT_E02216/100')
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('viewer', 'Morpheus viewer suite')
+    group.addoption('--app-url', default=DEFAULT_APP_URL, help='Running Morpheus app')
+    group.addoption('--xnat-server', help="XNAT URL for the login form (default: the form's own default)")
+    group.addoption('--xnat-username', default=username)
+    group.addoption('--xnat-password', default=password)
+    group.addoption('--scan', action='append', metavar='EXPERIMENT/SCAN', help='Scan to load (repeatable)')
+    group.addoption('--browsers', type=int, default=2, help='Warm browsers per worker (one resets while another runs)')
+    group.addoption('--headed', action='store_true', help='Show the browser windows')
+    group.addoption('--chromedriver', help='chromedriver binary (default: $CHROMEDRIVER, PATH, driver caches)')
+    group.addoption('--viewer-timeout', type=float, default=60.0, help='Seconds to wait for a scan to render')
+    group.addoption('--artifacts-dir', default='/tmp/morpheus-tests', help='Screenshots and console logs of failures')
+
+
+def pytest_generate_tests(metafunc):
+    if 'scan' in metafunc.fixturenames:
+        scans = metafunc.config.getoption('scan') or DEFAULT_SCANS
+        metafunc.parametrize('scan', [tuple(s.split('/', 1)) for s in scans], ids=list(scans))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    setattr(item, f'rep_{report.when}', report)
+
+
+@contextmanager
+def _locked(path: Path):
+    with open(path, 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@pytest.fixture(scope='session')
+def app_url(pytestconfig):
+    return pytestconfig.getoption('app_url').rstrip('/')
+
+
+@pytest.fixture(scope='session')
+def viewer_timeout(pytestconfig):
+    return pytestconfig.getoption('viewer_timeout')
+
+
+@pytest.fixture(scope='session')
+def launch(pytestconfig):
+    """Callable starting a browser with the run's driver and headless setting."""
+    try:
+        driver_path = resolve_chromedriver(pytestconfig.getoption('chromedriver'))
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    return partial(start_browser, driver_path, not pytestconfig.getoption('headed'))
+
+
+@pytest.fixture(scope='session')
+def auth_state(pytestconfig, tmp_path_factory, launch, app_url):
+    """Logged-in storage and cookies, captured once per run and shared by all workers."""
+    root = tmp_path_factory.getbasetemp()
+    if hasattr(pytestconfig, 'workerinput'):
+        root = root.parent  # shared by every xdist worker of this run
+    snapshot = root / 'morpheus-auth.json'
+    with _locked(root / 'morpheus-auth.lock'):
+        if snapshot.exists():
+            return json.loads(snapshot.read_text())
+        driver = launch()
+        try:
+            login_through_ui(driver, app_url, pytestconfig.getoption('xnat_username'),
+                             pytestconfig.getoption('xnat_password'), pytestconfig.getoption('xnat_server'))
+            auth = capture_auth(driver)
+        finally:
+            driver.quit()
+        snapshot.write_text(json.dumps(auth))
+        return auth
+
+
+@pytest.fixture(scope='session')
+def browser_pool(pytestconfig, launch, auth_state, app_url):
+    pool = BrowserPool(launch, pytestconfig.getoption('browsers'),
+                       prepare=partial(apply_auth, app_url=app_url, auth=auth_state)).start()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def browser(request, browser_pool):
+    """An authenticated browser on about:blank; a failing test leaves a screenshot and its console log."""
+    with browser_pool.acquire() as driver:
+        yield driver
+        report = getattr(request.node, 'rep_call', None)
+        if report is not None and report.failed:
+            out = Path(request.config.getoption('artifacts_dir'))
+            out.mkdir(parents=True, exist_ok=True)
+            name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in request.node.name)
+            driver.save_screenshot(str(out / f'{name}.png'))
+            (out / f'{name}.console.json').write_text(json.dumps(driver.get_log('browser'), indent=2))
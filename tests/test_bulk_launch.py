@@ -0,0 +1,86 @@
+"""Bulk launch: catalog selection from a real export, refused batches and unlisted containers in the ledger."""
+import json
+
+import pytest
+import requests
+
+from bulk_launch import UNLISTED_STATUS, BulkLauncher, open_ledger
+
+SERVER = 'https://xnat.example.org'
+
+
+def response(status: int, body, url: str) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp.url = url
+    resp._content = (json.dumps(body) if not isinstance(body, str) else body).encode()
+    return resp
+
+
+class FakeSession:
+    """Lists the given containers and answers every bulklaunch with a fixed response."""
+
+    def __init__(self, status: int, body, containers: list = ()):
+        self.status = status
+        self.body = body
+        self.containers = list(containers)
+        self.posts = []
+
+    def get(self, url, **kwargs):
+        return response(200, self.containers, url)
+
+    def post(self, url, **kwargs):
+        self.posts.append(url)
+        return response(self.status, self.body, url)
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_catalog_sessions_from_export(tmp_path, file_format):
+    pytest.importorskip('pyarrow')
+    from bulk_launch import iter_catalog_sessions
+    from export_catalog import PartitionedWriter
+
+    writer = PartitionedWriter(tmp_path, file_format, batch_rows=2)
+    for project, experiment, modality, scan_type in [('PA', 'E1', 'MR', 'T1'), ('PA', 'E1', 'MR', 'T2'),
+                                                      ('PA', 'E2', 'CT', None), ('PB', 'E3', 'MR', 'T1')]:
+        writer.write({'project': project, 'experiment': experiment, 'modality': modality, 'scan_type': scan_type})
+    writer.close()
+
+    assert sorted(iter_catalog_sessions(tmp_path)) == [('PA', 'E1'), ('PA', 'E2'), ('PB', 'E3')]
+    assert sorted(iter_catalog_sessions(tmp_path, projects=['PA'], modality='ct')) == [('PA', 'E2')]
+    assert sorted(iter_catalog_sessions(tmp_path, scan_type='T1')) == [('PA', 'E1'), ('PB', 'E3')]
+
+
+def test_refused_batch_is_not_requeued(tmp_path):
+    conn = open_ledger(tmp_path / 'ledger.db', 7, 'session', {})
+    with conn:
+        conn.executemany('INSERT INTO targets (experiment, project) VALUES (?, ?)', [('E1', 'PA'), ('E2', 'PA')])
+    session = FakeSession(400, 'Wrapper 7 is not enabled on project PA')
+
+    counts = BulkLauncher(session, SERVER, conn, 7, batch_size=10, min_poll=0).run(wait=True)
+
+    assert len(session.posts) == 1
+    assert counts['launch_failed'] == 2 and counts['submitting'] == 0 and counts['pending'] == 0
+    messages = {message for message, in conn.execute('SELECT message FROM targets')}
+    assert messages == {'HTTP 400: Wrapper 7 is not enabled on project PA'}
+
+
+def test_only_this_wrappers_containers_count():
+    containers = [{'id': 1, 'wrapper-id': 7, 'status': 'Running'}, {'id': 2, 'wrapper-id': '7', 'status': 'Running'},
+                  {'id': 3, 'wrapper-id': 8, 'status': 'Running'}, {'id': 4, 'status': 'Running'}]
+    launcher = BulkLauncher(FakeSession(200, {}, containers), SERVER, None, 7)
+
+    assert [c['id'] for c in launcher.list_containers()] == [1, 2]
+
+
+def test_launch_that_never_lists_its_container_finishes_unknown(tmp_path):
+    conn = open_ledger(tmp_path / 'ledger.db', 7, 'session', {})
+    with conn:
+        conn.execute('INSERT INTO targets (experiment, project) VALUES (?, ?)', ('E1', 'PA'))
+    session = FakeSession(200, {'successes': [{'params': {'session': '/archive/experiments/E1'},
+                                               'container-id': 'c1'}]})
+
+    counts = BulkLauncher(session, SERVER, conn, 7, min_poll=0, grace=0).run(wait=True)
+
+    assert counts['finished'] == 1 and counts['failed'] == 1 and counts['launched'] == 0
+    assert conn.execute('SELECT container_id, status FROM targets').fetchone() == ('c1', UNLISTED_STATUS)
@@ -0,0 +1,70 @@
+"""Container logs: a restarted tailer resumes from its saved cursors, and one unwritable log stops only its stream."""
+import asyncio
+import json
+
+import requests
+
+from container_logs import LogTailer
+
+SERVER = 'https://xnat.example.org'
+
+
+def response(status: int, body) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body if isinstance(body, bytes) else json.dumps(body).encode()
+    return resp
+
+
+class FakeSession:
+    """Finished containers whose logs are served through logSince in two deltas."""
+
+    def __init__(self, keys: list):
+        self.keys = keys
+        self.since = []
+
+    def get(self, url, params=None, **kwargs):
+        if url.endswith('/xapi/containers'):
+            return response(200, [{'id': key, 'status': 'Complete'} for key in self.keys])
+        key, log_type = url.split('/xapi/containers/')[1].split('/logSince/')
+        cursor = params['timestamp']
+        self.since.append((key, log_type, cursor))
+        deltas = {'-1': (f'{log_type} one\n', '100'), '100': (f'{log_type} two', '200'), '200': ('', '200')}
+        content, timestamp = deltas[cursor]
+        return response(200, {'content': content, 'timestamp': timestamp})
+
+
+def run(tmp_path, session):
+    tailer = LogTailer(session, SERVER, tmp_path, min_interval=0, discover_interval=0)
+    return asyncio.run(tailer.run(session.keys, until_done=True, report_interval=3600))
+
+
+def test_restart_resumes_from_saved_cursor(tmp_path):
+    run(tmp_path, FakeSession(['5']))
+    assert (tmp_path / '5' / 'stdout.log').read_text() == 'stdout one\nstdout two'
+
+    session = FakeSession(['5'])
+    run(tmp_path, session)
+
+    assert (tmp_path / '5' / 'stdout.log').read_text() == 'stdout one\nstdout two'
+    assert sorted(session.since) == [('5', 'stderr', '200'), ('5', 'stdout', '200')]
+
+
+def test_log_without_cursor_is_rewritten_not_appended(tmp_path):
+    (tmp_path / '5').mkdir()
+    (tmp_path / '5' / 'stdout.log').write_text('stdout one\n')
+
+    run(tmp_path, FakeSession(['5']))
+
+    assert (tmp_path / '5' / 'stdout.log').read_text() == 'stdout one\nstdout two'
+
+
+def test_unwritable_log_does_not_stop_other_containers(tmp_path):
+    # A directory where the log file should be makes every write to it fail
+    (tmp_path / '6' / 'stdout.log').mkdir(parents=True)
+
+    stats = run(tmp_path, FakeSession(['5', '6']))
+
+    assert stats['finished'] == 2 and stats['errors'] >= 1
+    assert (tmp_path / '5' / 'stdout.log').read_text() == 'stdout one\nstdout two'
+    assert (tmp_path / '6' / 'stderr.log').read_text() == 'stderr one\nstderr two'
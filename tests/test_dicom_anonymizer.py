@@ -0,0 +1,114 @@
+"""DICOM anonymizer: header rules applied, pixel data copied through untouched, one manifest record per file."""
+import json
+
+import pytest
+
+pydicom = pytest.importorskip('pydicom')
+
+from pydicom.dataset import Dataset, FileMetaDataset  # noqa: E402
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid  # noqa: E402
+
+from dicom_anonymizer import DEFAULT_ANONYMIZATION_SCRIPT, anonymize_file, anonymize_tree  # noqa: E402
+from dicomedit import compile_script  # noqa: E402
+
+PIXELS = bytes(range(256)) * 32
+PIXEL_DATA_TAG = b'\xe0\x7f\x10\x00'
+
+
+def write_dicom(path, modality: str = 'MR'):
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.4'
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.PatientName = 'Doe^Jane'
+    ds.PatientID = 'MRN123'
+    ds.PatientBirthDate = '19700101'
+    ds.AccessionNumber = 'ACC1'
+    ds.InstitutionName = 'General Hospital'
+    ds.Modality = modality
+    ds.StudyDescription = 'Head'
+    ds.add_new(0x00191001, 'LO', 'vendor private')
+    ds.add_new(0x00191002, 'LO', 'more private')
+    ds.Rows, ds.Columns = 64, 64
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 16, 15
+    ds.SamplesPerPixel, ds.PixelRepresentation = 1, 0
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.PixelData = PIXELS
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ds.save_as(path, enforce_file_format=True)
+    return path
+
+
+def pixel_tail(path) -> bytes:
+    data = path.read_bytes()
+    return data[data.rindex(PIXEL_DATA_TAG):]
+
+
+def test_header_rewrite_keeps_pixel_data_identical(tmp_path):
+    source = write_dicom(tmp_path / 'in.dcm')
+    plan = compile_script(DEFAULT_ANONYMIZATION_SCRIPT)
+    assert plan.header_only
+
+    anonymize_file(source, tmp_path / 'out.dcm', plan, 'in.dcm')
+
+    assert pixel_tail(tmp_path / 'out.dcm') == pixel_tail(source)
+    out = pydicom.dcmread(tmp_path / 'out.dcm')
+    assert out.InstitutionName == '' and out.PatientBirthDate == ''
+    assert out.PixelData == PIXELS
+
+
+SCRIPT = '''
+version "6.3"
+-(0008,0050)
+-(0019,XXXX)
+(0010,0010) := "ANON"
+(0010,0020) := subject
+(0008,0060) = "MR" ? (0008,1030) := "brain"
+(0008,0060) = "CT" ? (0008,1030) := "never"
+'''
+
+
+@pytest.mark.parametrize('modality, description', [('MR', 'brain'), ('CT', 'never'), ('PT', 'Head')])
+def test_delete_assign_and_conditional_rules(tmp_path, modality, description):
+    source = write_dicom(tmp_path / 'in.dcm', modality)
+
+    record = anonymize_file(source, tmp_path / 'out.dcm', compile_script(SCRIPT), 'in.dcm',
+                            variables={'subject': 'SUBJ01'})
+
+    out = pydicom.dcmread(tmp_path / 'out.dcm')
+    assert 'AccessionNumber' not in out
+    assert 0x00191001 not in out and 0x00191002 not in out
+    assert out.PatientName == 'ANON' and out.PatientID == 'SUBJ01'
+    assert out.StudyDescription == description
+    changed = {change['tag'] for change in record['changes']}
+    assert {'(0008,0050)', '(0019,1001)', '(0019,1002)', '(0010,0010)', '(0010,0020)'} <= changed
+    assert ('(0008,1030)' in changed) == (description != 'Head')
+
+
+def test_manifest_records(tmp_path):
+    write_dicom(tmp_path / 'in' / 'a' / '1.dcm')
+    write_dicom(tmp_path / 'in' / 'b' / '2.dcm')
+    (tmp_path / 'in' / 'b' / 'notes.txt').write_text('not dicom')
+    manifest = tmp_path / 'manifest.jsonl'
+
+    counts = anonymize_tree(tmp_path / 'in', tmp_path / 'out', SCRIPT, manifest, workers=1,
+                            extract_basic_profile=True, variables={'subject': 'SUBJ01'}, chunksize=1, window=1)
+
+    records = {record['fileName']: record for record in map(json.loads, manifest.read_text().splitlines())}
+    assert counts['files'] == 3 and counts['failed'] == 1
+    assert set(records) == {'a/1.dcm', 'b/2.dcm', 'b/notes.txt'}
+    assert records['b/notes.txt']['warnings'][0].startswith('Failed to anonymize b/notes.txt')
+
+    record = records['a/1.dcm']
+    assert record['warnings'] == []
+    assert {'fileName': 'a/1.dcm', 'tag': '(0010,0010)', 'tagName': "Patient's Name",
+            'originalValue': 'Doe^Jane', 'newValue': 'ANON'} in record['changes']
+    assert {'tag': '(0008,0050)', 'tagName': 'Accession Number', 'value': 'ACC1', 'fileName': 'a/1.dcm'} in \
+        record['basicProfileTagValues']
+    assert counts['changes'] == sum(len(r['changes']) for r in records.values())
+    assert (tmp_path / 'out' / 'b' / '2.dcm').is_file()
@@ -0,0 +1,57 @@
+"""DICOM index: incremental header reads, and one copy per SOP instance in each series with that copy's own size."""
+import pytest
+
+from dicom_index import index_tree, iter_series, open_index
+
+
+def add_instance(conn, path: str, size: int, sop_uid: str, instance_number: int):
+    conn.execute('INSERT INTO instances (path, size, mtime_ns, sop_uid, series_uid, study_uid, instance_number) '
+                 'VALUES (?, ?, 0, ?, ?, ?, ?)', (path, size, sop_uid, '1.2.3.1', '1.2.3', instance_number))
+
+
+def test_duplicate_sop_uses_size_of_chosen_copy(tmp_path):
+    conn = open_index(tmp_path / 'index.sqlite')
+    conn.execute("INSERT INTO studies (study_uid, patient_id) VALUES ('1.2.3', 'P1')")
+    conn.execute("INSERT INTO series (series_uid, study_uid, series_number) VALUES ('1.2.3.1', '1.2.3', 1)")
+    # The first path of the duplicate is the larger file, so MIN(path) and MIN(size) come from different rows
+    add_instance(conn, '/a/2.dcm', 900, 'sop.2', 2)
+    add_instance(conn, '/b/2.dcm', 500, 'sop.2', 2)
+    add_instance(conn, '/a/1.dcm', 400, 'sop.1', 1)
+    add_instance(conn, '/a/3.dcm', 100, 'sop.3', 3)
+    # read_header stores a file without a SOP UID as an error, and series never list errors
+    conn.execute("INSERT INTO instances (path, size, mtime_ns, series_uid, error) "
+                 "VALUES ('/a/x.dcm', 100, 0, '1.2.3.1', 'No SOPInstanceUID')")
+
+    (series,) = iter_series(conn)
+
+    assert series['paths'] == ['/a/1.dcm', '/a/2.dcm', '/a/3.dcm']
+    assert series['bytes'] == 400 + 900 + 100
+
+
+def test_index_tree_reads_changed_files_in_chunks(tmp_path):
+    pytest.importorskip('pydicom')
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian
+
+    tree = tmp_path / 'tree'
+    tree.mkdir()
+    for number in range(1, 301):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.4'
+        meta.MediaStorageSOPInstanceUID = f'1.2.3.1.{number}'
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID, ds.SOPInstanceUID = meta.MediaStorageSOPClassUID, meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID, ds.SeriesInstanceUID, ds.InstanceNumber = '1.2.3', '1.2.3.1', number
+        ds.save_as(tree / f'{number:03}.dcm', enforce_file_format=True)
+    (tree / 'notes.txt').write_text('not dicom')
+    conn = open_index(tmp_path / 'index.sqlite')
+
+    first = index_tree(tree, conn, workers=2)
+    again = index_tree(tree, conn, workers=2)
+
+    assert (first['seen'], first['read'], first['unreadable']) == (301, 301, 1)
+    assert (again['read'], again['unchanged']) == (0, 301)
+    (series,) = iter_series(conn)
+    assert len(series['paths']) == 300 and series['paths'][0].endswith('001.dcm')
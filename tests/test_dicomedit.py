@@ -0,0 +1,98 @@
+"""DicomEdit compiler: statements parse into rules, plans are cached by script text, and rules apply in order."""
+import pytest
+
+pydicom = pytest.importorskip('pydicom')
+
+from pydicom.dataset import Dataset  # noqa: E402
+
+from dicomedit import compile_script, parse_script  # noqa: E402
+
+
+def dataset(**values) -> Dataset:
+    ds = Dataset()
+    ds.PatientName = 'Doe^Jane'
+    ds.Modality = 'MR'
+    ds.SeriesDescription = 'sag t1'
+    for keyword, value in values.items():
+        setattr(ds, keyword, value)
+    return ds
+
+
+def test_statements_compile_to_rules():
+    plan = parse_script('''
+        version "6.3"
+        describe anon "Anonymize"
+        -(0008,0050)                          // comment
+        -(0019,XXXX)                          # comment
+        (0010,0010) := "A // not a comment"
+        site := "S1"
+        (0008,0060) ~ "M." ? (0008,103E) := uppercase[(0008,103E)]
+    ''')
+
+    assert [(rule.action, rule.line) for rule in plan.rules] == \
+        [('delete', 4), ('delete', 5), ('set', 6), ('let', 7), ('set', 8)]
+    assert plan.rules[0].target == 0x00080050
+    assert plan.rules[1].target == (0xFFFF0000, 0x00190000)
+    assert plan.rules[4].condition is not None
+    assert set(plan.by_tag) == {0x00080050, 0x00100010, 0x0008103E}
+    assert plan.patterns == ((0xFFFF0000, 0x00190000),)
+    assert plan.header_only
+    assert not parse_script('-(7FE0,XXXX)').header_only
+
+
+@pytest.mark.parametrize('script, message', [
+    ('(0010,0010) = "A"', 'Line 1: expected'),
+    ('version "6.3"\n(0010,XXXX) := "A"', 'Line 2: wildcard tags can only be deleted'),
+    ('(0010,0010) := shout[(0010,0010)]', 'unsupported function: shout'),
+    ('(0010,0010) := "A" extra', 'unexpected extra'),
+])
+def test_unsupported_statements_name_their_line(script, message):
+    with pytest.raises(ValueError, match=message.replace('[', r'\[')):
+        parse_script(script)
+
+
+def test_plans_are_cached_by_script_text():
+    script = '(0010,0010) := "cached"\n-(0008,0050)\n'
+
+    plan = compile_script(script)
+
+    assert compile_script(script) is plan
+    assert compile_script(script.replace('\n', '\r\n')) is plan
+    assert compile_script(script + '-(0008,0090)\n') is not plan
+    with pytest.raises(AttributeError):
+        plan.rules = ()
+
+
+def test_rules_apply_in_order():
+    plan = compile_script('''
+        label := format["{0}_{1}", subject, (0008,0060)]
+        (0010,0010) := label
+        (0008,103E) := replace[uppercase[(0008,103E)], " ", "_"]
+        (0008,0060) != "MR" ? (0010,0020) := "never"
+        -(0008,0060)
+    ''')
+    ds = dataset()
+
+    changes = plan.apply(ds, 'f.dcm', {'subject': 'SUBJ01'})
+
+    assert ds.PatientName == 'SUBJ01_MR' and ds.SeriesDescription == 'SAG_T1'
+    assert 'PatientID' not in ds and 'Modality' not in ds
+    assert [(change['tag'], change['originalValue'], change['newValue']) for change in changes] == [
+        ('(0010,0010)', 'Doe^Jane', 'SUBJ01_MR'),
+        ('(0008,103E)', 'sag t1', 'SAG_T1'),
+        ('(0008,0060)', 'MR', ''),
+    ]
+
+
+def test_wildcard_deletion_sees_elements_added_earlier():
+    plan = compile_script('''
+        -(0019,XXXX)
+        (0019,1010) := "added after the first wildcard pass"
+        -(0019,XXXX)
+    ''')
+    ds = dataset()
+    ds.add_new(0x00191001, 'LO', 'private')
+
+    plan.apply(ds)
+
+    assert not [tag for tag in ds.keys() if tag >> 16 == 0x0019]
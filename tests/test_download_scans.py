@@ -0,0 +1,65 @@
+"""Downloads: archives without a size or digest are never resumed and must be valid zips."""
+import io
+import zipfile
+
+import pytest
+import requests
+
+from download_scans import DownloadError, download_file
+
+URL = 'https://xnat.example.org/data/archive/experiments/E1/scans/1/resources/DICOM/files'
+
+
+def archive_bytes() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('1/a.dcm', b'pixels' * 100)
+    return buffer.getvalue()
+
+
+class FakeSession:
+    """Serves one body, honouring Range requests the way XNAT does for a regenerated archive."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.ranges = []
+
+    def get(self, url, headers=None, **kwargs):
+        requested = (headers or {}).get('Range')
+        self.ranges.append(requested)
+        response = requests.Response()
+        offset = int(requested[6:-1]) if requested else 0
+        response.status_code = 206 if requested else 200
+        response.raw = io.BytesIO(self.body[offset:])
+        return response
+
+
+def test_partial_archive_is_fetched_again(tmp_path):
+    dest = tmp_path / 'E1.zip'
+    dest.with_name('E1.zip.part').write_bytes(b'bytes of an earlier, different archive')
+    session = FakeSession(archive_bytes())
+
+    download_file(session, URL, dest, params={'format': 'zip'})
+
+    assert session.ranges == [None]
+    assert dest.read_bytes() == session.body
+    assert not dest.with_name('E1.zip.part').exists()
+
+
+def test_truncated_archive_is_rejected(tmp_path):
+    dest = tmp_path / 'E1.zip'
+    session = FakeSession(archive_bytes()[:-30])
+
+    with pytest.raises(DownloadError, match='Corrupt archive'):
+        download_file(session, URL, dest, params={'format': 'zip'})
+    assert not dest.exists() and not dest.with_name('E1.zip.part').exists()
+
+
+def test_listed_file_still_resumes(tmp_path):
+    body = b'0123456789' * 10
+    dest = tmp_path / 'a.dcm'
+    dest.with_name('a.dcm.part').write_bytes(body[:40])
+    session = FakeSession(body)
+
+    assert download_file(session, URL + '/a.dcm', dest, expected_size=len(body)) == 60
+    assert session.ranges == ['bytes=40-'] and dest.read_bytes() == body
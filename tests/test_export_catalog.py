@@ -0,0 +1,92 @@
+"""Catalog export: files written in several batches and runs read back through hive partitioning."""
+from datetime import date, datetime, timezone
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+from export_catalog import PartitionedWriter, open_catalog  # noqa: E402
+
+CRAWLED_AT = datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def file_row(project: str, experiment: str, scan: str, modality: str, name: str) -> dict:
+    return {
+        'project': project,
+        'subject': f'{project}_S01',
+        'experiment': experiment,
+        'experiment_label': f'{experiment}_MR',
+        'experiment_date': date(2024, 2, 1),
+        'insert_date': datetime(2024, 2, 2, 9, 30),
+        'xsi_type': f'xnat:{modality.lower()}SessionData',
+        'modality': modality,
+        'scan': scan,
+        'scan_type': 'T1' if scan == '1' else None,
+        'series_description': 'sag t1',
+        'resource': 'DICOM',
+        'file_name': name,
+        'file_size': 1024,
+        'file_format': 'DICOM',
+        'digest': None,
+        'crawled_at': CRAWLED_AT,
+    }
+
+
+# Modalities change between batches, so each batch brings dictionary values the previous one did not have
+ROWS = ([file_row('PA', 'E1', '1', 'MR', f'{i}.dcm') for i in range(3)] +
+        [file_row('PA', 'E2', '2', 'CT', f'{i}.dcm') for i in range(2)] +
+        [file_row('PB', 'E3', '1', 'PET', '0.dcm')])
+
+
+def export(out_dir, file_format: str, rows: list = ROWS) -> int:
+    writer = PartitionedWriter(out_dir, file_format, batch_rows=2)
+    for row in rows:
+        writer.write(row)
+    writer.close()
+    return writer.rows_written
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_round_trip(tmp_path, file_format):
+    assert export(tmp_path, file_format) == len(ROWS)
+
+    table = open_catalog(tmp_path).to_table()
+    rows = sorted(table.to_pylist(), key=lambda row: (row['project'], row['experiment'], row['file_name']))
+    assert [(row['project'], row['experiment'], row['modality'], row['file_name']) for row in rows] == \
+        [(row['project'], row['experiment'], row['modality'], row['file_name']) for row in ROWS]
+    assert rows[0]['crawled_at'] == CRAWLED_AT and rows[0]['scan_type'] == 'T1'
+    assert pa.types.is_dictionary(table.schema.field('modality').type)
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_project_filter(tmp_path, file_format):
+    export(tmp_path, file_format)
+    import pyarrow.compute as pc
+
+    table = open_catalog(tmp_path).to_table(filter=pc.field('project') == 'PB')
+    assert table.column('experiment').to_pylist() == ['E3']
+
+
+def test_second_run_replaces_project(tmp_path):
+    export(tmp_path, 'parquet')
+    export(tmp_path, 'parquet', [file_row('PA', 'E4', '1', 'MR', 'new.dcm')])
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['project=PA', 'project=PB']
+    assert [path.name for path in (tmp_path / 'project=PA').iterdir()] == ['part-00000.parquet']
+    table = open_catalog(tmp_path).to_table()
+    assert sorted(zip(table.column('project').to_pylist(), table.column('experiment').to_pylist())) == \
+        [('PA', 'E4'), ('PB', 'E3')]
+
+
+def test_aborted_project_keeps_previous_partition(tmp_path):
+    export(tmp_path, 'parquet')
+    writer = PartitionedWriter(tmp_path, 'parquet', batch_rows=1)
+    writer.write(file_row('PA', 'E9', '1', 'MR', 'partial.dcm'))
+    writer.write(file_row('PA', 'E9', '1', 'MR', 'partial2.dcm'))
+
+    # Unfinished staging files are hidden from readers, and dropped on abort
+    assert open_catalog(tmp_path).count_rows() == len(ROWS)
+    writer.abort()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['project=PA', 'project=PB']
+    assert open_catalog(tmp_path).count_rows() == len(ROWS)
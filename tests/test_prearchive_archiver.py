@@ -0,0 +1,78 @@
+"""Prearchive archiver: a timed-out archive is waited on, not posted again."""
+import json
+
+import pytest
+import requests
+
+import prearchive_archiver
+from prearchive_archiver import PrearchiveArchiver
+
+SERVER = 'https://xnat.example.org'
+ENTRY = {'project': 'PA', 'timestamp': '20240301_120000', 'subject': 'S1', 'name': 'S1_MR', 'status': 'READY'}
+
+
+def status_response(status) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 404 if status is None else 200
+    response._content = json.dumps({'ResultSet': {'Result': [{'status': status}]}}).encode()
+    return response
+
+
+class FakeSession(requests.Session):
+    """Times out every archive POST and reports the given prearchive statuses in turn."""
+
+    def __init__(self, statuses: list):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.posts = 0
+
+    def get(self, url, **kwargs):
+        status = self.statuses.pop(0)
+        if isinstance(status, Exception):
+            raise status
+        return status_response(status)
+
+    def post(self, url, **kwargs):
+        self.posts += 1
+        raise requests.Timeout('read timed out')
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(prearchive_archiver.time, 'sleep', lambda seconds: None)
+
+
+def archiver_for(session: FakeSession) -> PrearchiveArchiver:
+    archiver = PrearchiveArchiver(session, SERVER, retries=3)
+    archiver.archive_session = session
+    return archiver
+
+
+def test_archiving_session_is_polled_until_it_leaves():
+    session = FakeSession(['ARCHIVING', 'ARCHIVING', 'QUEUED_ARCHIVING', None])
+
+    assert archiver_for(session).archive(ENTRY) == ('(archived by an earlier attempt)', 1)
+    assert session.posts == 1 and not session.statuses
+
+
+def test_ready_session_is_posted_again():
+    session = FakeSession(['ARCHIVING', 'READY', 'READY'])
+
+    with pytest.raises(prearchive_archiver.TransientError):
+        archiver_for(session).archive(ENTRY)
+    assert session.posts == 3
+
+
+def test_failed_status_lookup_is_retried_before_deciding():
+    session = FakeSession([requests.ConnectionError('reset'), None])
+
+    assert archiver_for(session).archive(ENTRY) == ('(archived by an earlier attempt)', 1)
+    assert session.posts == 1
+
+
+def test_unknown_status_is_never_posted_again():
+    session = FakeSession([requests.ConnectionError('reset')] * 3)
+
+    with pytest.raises(prearchive_archiver.TransientError, match='not archiving again'):
+        archiver_for(session).archive(ENTRY)
+    assert session.posts == 1 and not session.statuses
@@ -0,0 +1,67 @@
+"""Scan snapshots: a scan with nothing renderable is remembered briefly, an upstream failure is not."""
+import json
+
+import pytest
+import requests
+
+from scan_snapshots import SnapshotRenderer
+from xnat_proxy import DiskCache
+
+SERVER = 'https://xnat.example.org'
+FILE_URI = '/data/experiments/E1/scans/1/resources/DICOM/files/1.dcm'
+
+
+def response(status: int, body: bytes) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp.url = SERVER
+    resp._content = body
+    resp._content_consumed = True
+    return resp
+
+
+class FakeSession:
+    """Lists one instance whose bytes are not DICOM, or fails the listing with `listing_status`."""
+
+    def __init__(self, listing_status: int = 200):
+        self.listing_status = listing_status
+        self.gets = []
+
+    def get(self, url, **kwargs):
+        self.gets.append(url)
+        if url.endswith('/files'):
+            body = json.dumps({'ResultSet': {'Result': [{'Name': '1.dcm', 'URI': FILE_URI}]}}).encode()
+            return response(self.listing_status, body)
+        return response(200, b'not a DICOM file')
+
+
+def test_unrenderable_scan_is_not_fetched_again(tmp_path):
+    session = FakeSession()
+    renderer = SnapshotRenderer(DiskCache(tmp_path), failure_ttl=60)
+
+    assert renderer.get(session, SERVER, 'E1', '1') is None
+    assert renderer.get(session, SERVER, 'E1', '1', size=64, fmt='png') is None
+
+    assert session.gets == [f'{SERVER}/data/archive/experiments/E1/scans/1/resources/DICOM/files',
+                            f'{SERVER}{FILE_URI}']
+    assert renderer.stats()['failed'] == 1
+
+
+def test_failure_is_retried_after_ttl(tmp_path):
+    session = FakeSession()
+    renderer = SnapshotRenderer(DiskCache(tmp_path), failure_ttl=0)
+
+    renderer.get(session, SERVER, 'E1', '1')
+    renderer.get(session, SERVER, 'E1', '1')
+
+    assert len(session.gets) == 4
+
+
+def test_upstream_error_is_not_remembered(tmp_path):
+    session = FakeSession(listing_status=503)
+    renderer = SnapshotRenderer(DiskCache(tmp_path), failure_ttl=60)
+
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            renderer.get(session, SERVER, 'E1', '1')
+    assert len(session.gets) == 2
@@ -0,0 +1,118 @@
+"""Upload pipeline: parts are built concurrently and each study is finished exactly once."""
+import threading
+import time
+
+import requests
+from requests.cookies import RequestsCookieJar
+
+from upload_series import UploadPipeline
+
+
+def make_series(tmp_path, study_uid: str, series_number: int, files: int) -> dict:
+    paths = []
+    for index in range(files):
+        path = tmp_path / f'{study_uid}_{series_number}_{index}.dcm'
+        path.write_bytes(b'\0' * 128)
+        paths.append(str(path))
+    return {'study_uid': study_uid, 'series_uid': f'{study_uid}.{series_number}', 'series_number': series_number,
+            'patient_id': 'P1', 'study_date': '20240301', 'paths': paths}
+
+
+class RecordingPipeline(UploadPipeline):
+    """Fails the upload of one part name and counts concurrent builds instead of talking to XNAT."""
+
+    def __init__(self, *args, fail_part: str = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_part = fail_part
+        self.building = self.peak_builds = 0
+        self.imports = []
+        self.counter_lock = threading.Lock()
+
+    def _build(self, part_name, paths):
+        with self.counter_lock:
+            self.building += 1
+            self.peak_builds = max(self.peak_builds, self.building)
+        time.sleep(0.05)
+        try:
+            return super()._build(part_name, paths)
+        finally:
+            with self.counter_lock:
+                self.building -= 1
+
+    def _put(self, upload_id, zip_path):
+        return not (self.fail_part and self.fail_part in zip_path.name)
+
+    def _import(self, upload_id, part_name):
+        self.imports.append((upload_id, part_name))
+        return True
+
+
+def test_failed_part_fails_study_once(tmp_path):
+    series = [make_series(tmp_path, '1.2.3', number, files=2) for number in (1, 2, 3)]
+    series.append(make_series(tmp_path, '1.2.4', 1, files=2))
+    pipeline = RecordingPipeline(requests.Session(), 'https://xnat.example.org', 'PA', tmp_path / 'work',
+                                 fail_part='1.2.3.3')
+
+    stats = pipeline.run(series, max_part_bytes=1024)
+
+    assert stats['parts'] == 4 and stats['uploaded'] == 3 and stats['failed'] == 1
+    assert stats['imported'] == 1 and stats['import_failed'] == 1
+    assert len(pipeline.imports) == 1
+    assert pipeline.peak_builds == 2
+    assert not list((tmp_path / 'work').iterdir())
+
+
+class FakeXnat(requests.Session):
+    """Accepts every cache PUT and import, recording what was sent."""
+
+    def __init__(self):
+        super().__init__()
+        self.cookies = RequestsCookieJar()
+        self.cookies.set('XNAT_CSRF', 'token')
+        self.puts, self.imports, self.deletes = [], [], []
+
+    def _ok(self):
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+    def put(self, url, **kwargs):
+        self.puts.append(url)
+        return self._ok()
+
+    def post(self, url, data=None, **kwargs):
+        self.imports.append((url, data))
+        return self._ok()
+
+    def delete(self, url, **kwargs):
+        self.deletes.append(url)
+        return self._ok()
+
+
+def test_multi_part_study_imports_each_part(tmp_path):
+    series = [make_series(tmp_path, '1.2.3', number, files=1) for number in (1, 2)]
+    session = FakeXnat()
+    pipeline = UploadPipeline(session, 'https://xnat.example.org', 'PA', tmp_path / 'work')
+
+    stats = pipeline.run(series)
+
+    assert stats['imported'] == 1
+    upload_id = session.puts[0].split('/resources/')[1].split('/')[0]
+    expected = {
+        'threshhold': '51516279',
+        'project': 'PA',
+        'import-handler': 'DICOM-zip',
+        'prearchive_code': '0',
+        'auto-archive': 'false',
+        'quarantine': 'false',
+        'action': 'commit',
+        'http-session-listener': upload_id,
+        'Ignore-Unparsable': 'true',
+        'XNAT_CSRF': 'token',
+    }
+    assert session.imports == [
+        ('https://xnat.example.org/data/services/import',
+         {**expected, 'src': f'/user/cache/resources/{upload_id}/files/{part}'})
+        for part in ('0001_000_1.2.3.1.zip', '0002_001_1.2.3.2.zip')
+    ]
+    assert session.deletes == [f'https://xnat.example.org/data/user/cache/resources/{upload_id}']
@@ -0,0 +1,57 @@
+"""
+Cornerstone viewer end-to-end checks.
+
+Replaces the standalone test_viewer*.py, test_specific_scan.py and
+test_*_logs.py scripts: each scan is loaded in a warm, already
+authenticated browser and the test returns as soon as the viewer marks
+the readiness milestone it needs, instead of sleeping for a fixed time.
+"""
+import pytest
+
+pytest.importorskip('selenium')
+
+from selenium.webdriver.common.by import By  # noqa: E402
+from selenium.webdriver.support import expected_conditions as EC  # noqa: E402
+from selenium.webdriver.support.ui import WebDriverWait  # noqa: E402
+
+from viewer_browser import uncaught_errors, viewer_url, wait_for_milestone  # noqa: E402
+
+VIEWPORTS = ('Axial', 'Sagittal', 'Coronal')
+MILESTONES = ('auth-ready', 'metadata-loaded', 'first-image-rendered', 'volume-complete')
+
+
+def body_text(driver) -> str:
+    return driver.find_element(By.TAG_NAME, 'body').text
+
+
+def rendered_canvases(driver) -> list:
+    return [canvas for canvas in driver.find_elements(By.TAG_NAME, 'canvas')
+            if int(canvas.get_attribute('width') or 0) > 0]
+
+
+def test_snapshot_restores_session(browser, app_url):
+    browser.get(app_url)
+    shell = WebDriverWait(browser, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, 'header, #username')))
+    assert shell.tag_name == 'header', 'Auth snapshot was rejected; the app shows the login form'
+
+
+def test_viewer_renders_scan(browser, app_url, viewer_timeout, scan):
+    browser.get(viewer_url(app_url, *scan))
+    state = wait_for_milestone(browser, 'first-image-rendered', viewer_timeout)
+
+    assert state['key'] == '/'.join(scan)
+    assert len(rendered_canvases(browser)) >= len(VIEWPORTS)
+    text = body_text(browser)
+    assert 'MPR Viewer' in text
+    assert all(label in text for label in VIEWPORTS)
+    errors = uncaught_errors(browser.get_log('browser'))
+    assert not errors, '\n'.join(entry['message'][:200] for entry in errors[:5])
+
+
+def test_viewer_milestones_in_order(browser, app_url, viewer_timeout, scan):
+    browser.get(viewer_url(app_url, *scan))
+    state = wait_for_milestone(browser, 'volume-complete', viewer_timeout)
+
+    times = [state['milestones'][milestone] for milestone in MILESTONES]
+    assert times == sorted(times)
+    assert state['detail']['slices'] == state['detail']['files'] > 0
@@ -0,0 +1,35 @@
+"""Viewer benchmark: history comparisons and network summaries (no browser needed)."""
+from viewer_benchmark import network_metrics, previous_run
+
+
+def run(label: str, cache: str, *scans: str) -> dict:
+    return {'label': label, 'cache': cache, 'loads': {scan: [] for scan in scans}}
+
+
+def test_previous_run_matches_scans_and_cache():
+    runs = [run('cold-both', 'cold', 'E1/2', 'E2/100'), run('cold-one', 'cold', 'E1/2'),
+            run('warm-both', 'warm', 'E1/2', 'E2/100')]
+
+    assert previous_run(runs, run('now', 'cold', 'E2/100', 'E1/2'))['label'] == 'cold-both'
+    assert previous_run(runs, run('now', 'warm', 'E1/2', 'E2/100'))['label'] == 'warm-both'
+    assert previous_run(runs, run('now', 'warm', 'E1/2')) is None
+
+
+def request(request_id: str, url: str, start: float, end: float, size: int) -> list:
+    return [
+        {'method': 'Network.requestWillBeSent',
+         'params': {'requestId': request_id, 'wallTime': start, 'timestamp': start, 'request': {'url': url}}},
+        {'method': 'Network.loadingFinished',
+         'params': {'requestId': request_id, 'timestamp': end, 'encodedDataLength': size}},
+    ]
+
+
+def test_network_metrics_counts_overlap_before_cutoff():
+    files = 'http://app/api/xnat/data/archive/experiments/E1/scans/2/resources/DICOM/files/'
+    events = (request('1', files + '1.dcm', 1.0, 1.5, 100) + request('2', files + '2.dcm', 1.1, 1.4, 200) +
+              request('3', files + '3.dcm', 1.2, 1.3, 300) + request('4', 'http://app/late.js', 3.0, 3.1, 50))
+
+    metrics = network_metrics(events, time_origin=0, cutoff_ms=2000)
+
+    assert metrics == {'requests': 3, 'failed_requests': 0, 'dicom_requests': 3, 'dicom_bytes': 600,
+                       'peak_concurrency': 3}
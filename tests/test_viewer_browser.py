@@ -0,0 +1,71 @@
+"""Browser pool: a returned browser is reset in the background while the next user takes another."""
+import threading
+
+import pytest
+
+from viewer_browser import BrowserPool
+
+
+class FakeDriver:
+    log_types = ['browser']
+
+    def __init__(self):
+        self.resets = 0
+        self.crashed = False
+
+    def get(self, url):
+        if self.crashed:
+            raise RuntimeError('browser crashed')
+
+    def get_log(self, log_type):
+        return []
+
+    def quit(self):
+        pass
+
+
+def test_next_user_does_not_wait_for_reset():
+    reset_started = threading.Event()
+    reset_lock = threading.Lock()
+
+    def prepare(driver):
+        if driver.resets:
+            reset_started.set()
+            with reset_lock:
+                pass
+        driver.resets += 1
+
+    pool = BrowserPool(FakeDriver, size=2, prepare=prepare).start()
+    with reset_lock:
+        with pool.acquire() as first:
+            pass
+        assert reset_started.wait(timeout=5)
+        # The first browser's reset is still blocked on the lock
+        with pool.acquire(timeout=1) as second:
+            assert second is not first and first.resets == 1
+    pool.close()
+
+    assert first.resets == 2
+
+
+def test_failed_replacement_is_launched_by_next_acquire():
+    launches = {'allowed': 1, 'count': 0}
+
+    def launch():
+        launches['count'] += 1
+        if launches['count'] > launches['allowed']:
+            raise RuntimeError('no browser')
+        return FakeDriver()
+
+    pool = BrowserPool(launch, size=1).start()
+    with pool.acquire() as first:
+        first.crashed = True
+
+    # The replacement failed in the background; the slot stays and the next user retries the launch
+    with pytest.raises(RuntimeError, match='no browser'):
+        with pool.acquire(timeout=5):
+            pass
+    launches['allowed'] = launches['count'] + 1
+    with pool.acquire(timeout=5) as second:
+        assert second is not first and not second.crashed
+    pool.close()
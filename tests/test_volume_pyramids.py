@@ -0,0 +1,22 @@
+"""Volume pyramids: DICOM scans are selected from a catalog export, in either file format."""
+from datetime import datetime
+
+import pytest
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_catalog_scans_from_export(tmp_path, file_format):
+    pytest.importorskip('pyarrow')
+    from export_catalog import PartitionedWriter
+    from volume_pyramids import iter_catalog_scans
+
+    writer = PartitionedWriter(tmp_path, file_format, batch_rows=2)
+    for project, experiment, scan, resource, inserted in [
+            ('PA', 'E1', '1', 'DICOM', datetime(2024, 1, 5)), ('PA', 'E1', '1', 'DICOM', datetime(2024, 1, 5)),
+            ('PA', 'E1', '2', 'NIFTI', datetime(2024, 1, 5)), ('PB', 'E2', '1', 'DICOM', datetime(2024, 3, 1))]:
+        writer.write({'project': project, 'experiment': experiment, 'scan': scan, 'resource': resource,
+                      'insert_date': inserted})
+    writer.close()
+
+    assert sorted(iter_catalog_scans(tmp_path)) == [('E1', '1'), ('E2', '1')]
+    assert list(iter_catalog_scans(tmp_path, since=datetime(2024, 2, 1))) == [('E2', '1')]
@@ -0,0 +1,108 @@
+"""Workflow index: active workflows are refreshed across pages and dropped once the server stops listing them."""
+import json
+import sqlite3
+import time
+
+import pytest
+import requests
+
+from workflow_index import SCHEMA, WorkflowIndex
+
+DATA_TYPE = 'xnat:imageSessionData'
+
+
+def workflow(wfid: int, status: str, launched: int) -> dict:
+    return {'wfid': wfid, 'externalId': 'E1', 'status': status, 'pipelineName': 'dcm2nii', 'dataType': DATA_TYPE,
+            'launchTime': launched}
+
+
+class FakeSession:
+    """Pages POST /xapi/workflows over a fixed list of E1's workflows, newest first."""
+
+    def __init__(self, workflows: list):
+        self.workflows = workflows
+        self.pages = []
+
+    def post(self, url, **kwargs):
+        body = kwargs['json']
+        self.pages.append(body['page'])
+        start = (body['page'] - 1) * body['size']
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({'items': self.workflows[start:start + body['size']]}).encode()
+        return response
+
+
+def test_refresh_reads_every_page_and_expires_unlisted():
+    now = int(time.time() * 1000)
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(SCHEMA)
+    listed = [workflow(wfid, 'Complete', now - wfid * 1000) for wfid in range(1, 7)]
+    session = FakeSession(listed)
+    index = WorkflowIndex(session, 'https://xnat.example.org', conn, page_size=2)
+    # The store saw 5 and 6 (on page 3) and 99 (since deleted) running
+    index._store([workflow(5, 'Running', now - 5000), workflow(6, 'Queued', now - 6000),
+                  workflow(99, 'Running', now - 9000)], DATA_TYPE)
+
+    index.refresh_active(DATA_TYPE, synced_before=time.time() + 1)
+
+    assert session.pages == [1, 2, 3, 4]
+    assert dict(conn.execute('SELECT wfid, status FROM workflows WHERE wfid IN (5, 6, 99)')) == \
+        {5: 'Complete', 6: 'Complete'}
+    assert not conn.execute('SELECT COUNT(*) FROM workflows WHERE terminal = 0').fetchone()[0]
+
+
+class FlakySession(FakeSession):
+    """Fails the listed page numbers with a connection error."""
+
+    def __init__(self, workflows: list, failing_pages: set):
+        super().__init__(workflows)
+        self.failing_pages = failing_pages
+
+    def post(self, url, **kwargs):
+        if kwargs['json']['page'] in self.failing_pages:
+            self.pages.append(kwargs['json']['page'])
+            raise requests.ConnectionError('connection reset')
+        return super().post(url, **kwargs)
+
+
+def test_failed_page_keeps_cursor():
+    now = int(time.time() * 1000)
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(SCHEMA)
+    conn.execute('INSERT INTO sync_state VALUES (?, ?, ?)', (DATA_TYPE, now - 3_600_000, 0))
+    listed = [workflow(wfid, 'Complete', now - wfid * 1000) for wfid in range(1, 6)]
+    index = WorkflowIndex(FlakySession(listed, failing_pages={2}), 'https://xnat.example.org', conn, page_size=2)
+
+    assert index.sync_new(DATA_TYPE) == 2
+    assert conn.execute('SELECT cursor FROM sync_state').fetchone()[0] == now - 3_600_000
+
+    index.session = FlakySession(listed, failing_pages=set())
+    assert index.sync([DATA_TYPE])['new'] == 5
+    assert conn.execute('SELECT cursor FROM sync_state').fetchone()[0] == now - 1000
+
+
+def test_watch_survives_a_failed_pass(tmp_path, monkeypatch):
+    import workflow_index
+
+    class StopWatching(Exception):
+        pass
+
+    passes, sleeps = [], []
+
+    def sync(self, data_types, initial_days):
+        passes.append(1)
+        raise sqlite3.OperationalError('database is locked')
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            raise StopWatching
+
+    monkeypatch.setattr(workflow_index, 'login', lambda *args: requests.Session())
+    monkeypatch.setattr(WorkflowIndex, 'sync', sync)
+    monkeypatch.setattr(workflow_index.time, 'sleep', sleep)
+
+    with pytest.raises(StopWatching):
+        workflow_index.main(['--db', str(tmp_path / 'wf.sqlite'), '--watch', '60'])
+    assert len(passes) == 2
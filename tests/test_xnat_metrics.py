@@ -0,0 +1,79 @@
+"""Request metrics: streamed bodies, download time and failed connections."""
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from xnat_metrics import RequestMetrics, instrument
+from xnat_throttle import ThrottledSession
+
+CHUNKS = [b'x' * 1000] * 5
+CHUNK_DELAY = 0.05
+
+
+class ChunkedServer(BaseHTTPRequestHandler):
+    """Sends a chunked body (no Content-Length), pausing between chunks."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in CHUNKS:
+            time.sleep(CHUNK_DELAY)
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+
+@pytest.fixture(scope='module')
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ChunkedServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def endpoint(metrics: RequestMetrics) -> dict:
+    (row,) = metrics.to_dict()['endpoints']
+    return row
+
+
+@pytest.mark.parametrize('read', ['iter_content', 'raw.stream', 'content'])
+def test_body_bytes_and_download_time(server_url, read):
+    metrics = RequestMetrics()
+    session = instrument(ThrottledSession(), metrics)
+
+    with session.get(f'{server_url}/data/archive/experiments/E1/scans/1/files/a.dcm',
+                     stream=read != 'content') as response:
+        if read == 'iter_content':
+            body = b''.join(response.iter_content(256))
+        elif read == 'raw.stream':
+            body = b''.join(response.raw.stream(256, decode_content=False))
+        else:
+            body = response.content
+
+    row = endpoint(metrics)
+    assert body == b''.join(CHUNKS)
+    assert row['requests'] == 1 and row['statuses'] == {'200': 1}
+    assert row['bytes_in'] == len(body)
+    assert row['latency_seconds']['sum'] >= CHUNK_DELAY * len(CHUNKS) * 0.9
+
+
+def test_connection_error_is_recorded_as_status_zero():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]  # closed once the block exits, so nothing listens there
+    metrics = RequestMetrics()
+    session = instrument(ThrottledSession(), metrics)
+
+    with pytest.raises(requests.ConnectionError):
+        session.get(f'http://127.0.0.1:{port}/data/projects')
+
+    row = endpoint(metrics)
+    assert row['endpoint'] == '/data/projects' and row['statuses'] == {'0': 1} and row['bytes_in'] == 0
@@ -0,0 +1,154 @@
+"""Caching proxy: per-project separation of archived files, streamed request bodies and bounded caches."""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import xnat_proxy
+from xnat_proxy import ARCHIVED_FILE, DiskCache, ExpiringMap, cache_key, make_proxy
+
+# Two projects whose sessions share the label S1_MR; each user may only read their own project
+ACCESS = {'alice': 'PA', 'bob': 'PB'}
+FILE = '/data/projects/{project}/subjects/SUBJ/experiments/S1_MR/scans/1/resources/DICOM/files/a.dcm'
+
+
+class FakeXnat(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _answer(self, with_body: bool):
+        user = (self.headers.get('Cookie') or '').partition('JSESSIONID=')[2]
+        for project in ('PA', 'PB'):
+            if self.path == FILE.format(project=project):
+                if ACCESS.get(user) != project:
+                    body, status = b'forbidden', 403
+                else:
+                    body, status = f'pixels of {project}'.encode(), 200
+                break
+        else:
+            body, status = b'not found', 404
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/dicom' if status == 200 else 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/data/projects?'):
+            # A project listing slow enough to trip the lookup timeout
+            time.sleep(0.5)
+        self._answer(True)
+
+    def do_HEAD(self):
+        self._answer(False)
+
+    def do_POST(self):
+        """Echo how the body arrived: its framing and its size."""
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            framing, size = 'chunked', 0
+            while chunk := int(self.rfile.readline().split(b';')[0], 16):
+                size += len(self.rfile.read(chunk))
+                self.rfile.readline()
+            self.rfile.readline()
+        else:
+            framing, size = 'length', len(self.rfile.read(int(self.headers['Content-Length'])))
+        body = f'{framing} {size}'.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def proxy_url(tmp_path):
+    upstream = _serve(ThreadingHTTPServer(('127.0.0.1', 0), FakeXnat))
+    (tmp_path / 'dist').mkdir()
+    (tmp_path / 'dist' / 'index.html').write_text('app')
+    (tmp_path / 'dist-private').mkdir()
+    (tmp_path / 'dist-private' / 'secret.txt').write_text('secret')
+    proxy = _serve(make_proxy(f'http://127.0.0.1:{upstream.server_port}', DiskCache(tmp_path / 'cache'),
+                              static_root=tmp_path / 'dist', port=0, quiet=True, prefetch_after=0))
+    yield f'http://127.0.0.1:{proxy.server_port}'
+    proxy.shutdown()
+    upstream.shutdown()
+
+
+def test_cache_key_keeps_project_for_labels():
+    key_a = cache_key(ARCHIVED_FILE.match(FILE.format(project='PA')))
+    key_b = cache_key(ARCHIVED_FILE.match(FILE.format(project='PB')))
+    by_id = cache_key(ARCHIVED_FILE.match('/data/archive/experiments/XNAT_E1/scans/1/resources/DICOM/files/a.dcm'))
+    assert key_a != key_b
+    assert by_id == 'XNAT_E1/1/DICOM/a.dcm'
+
+
+def test_shared_label_is_not_served_across_projects(proxy_url):
+    alice = requests.get(proxy_url + FILE.format(project='PA'), cookies={'JSESSIONID': 'alice'})
+    assert alice.status_code == 200 and alice.content == b'pixels of PA'
+
+    bob = requests.get(proxy_url + FILE.format(project='PB'), cookies={'JSESSIONID': 'bob'})
+    assert bob.status_code == 200 and bob.content == b'pixels of PB'
+
+    # Both bodies are cached now; neither user may read the other project's file
+    assert requests.get(proxy_url + FILE.format(project='PA'), cookies={'JSESSIONID': 'bob'}).status_code == 403
+    assert requests.get(proxy_url + FILE.format(project='PB'), cookies={'JSESSIONID': 'alice'}).status_code == 403
+    again = requests.get(proxy_url + FILE.format(project='PA'), cookies={'JSESSIONID': 'alice'})
+    assert again.content == b'pixels of PA' and again.headers.get('X-Cache') == 'HIT'
+
+
+def test_request_bodies_are_streamed_upstream(proxy_url):
+    body = b'x' * (3 * 1024 * 1024 + 5)
+    sized = requests.post(proxy_url + '/data/services/import', data=body)
+    assert sized.text == f'length {len(body)}'
+
+    chunked = requests.post(proxy_url + '/data/services/import', data=iter([body[:1000], body[1000:]]))
+    assert chunked.text == f'chunked {len(body)}'
+
+
+def test_unsupported_transfer_encoding_is_refused(proxy_url):
+    response = requests.post(proxy_url + '/data/services/import', data=b'x',
+                             headers={'Transfer-Encoding': 'gzip', 'Content-Length': '1'})
+    assert response.status_code == 411
+
+
+def test_static_files_stay_inside_the_build(proxy_url):
+    assert requests.get(proxy_url + '/morpheus/%2e%2e/dist-private/secret.txt').text == 'app'
+
+
+def test_expiring_map_prunes_on_put():
+    entries = ExpiringMap(ttl=0.05, max_entries=3)
+    for key in range(5):
+        entries.put(key, key)
+    assert len(entries) == 3 and entries.get(0) is None and entries.get(4) == 4
+
+    time.sleep(0.06)
+    entries.put('new', 1)
+    assert len(entries) == 1 and entries.get(4) is None
+
+
+class FixedStats:
+    def view(self, visible):
+        return {'totals': {'projects': len(visible)}}
+
+
+def test_slow_project_listing_times_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(xnat_proxy, 'LOOKUP_TIMEOUT', (1, 0.1))
+    upstream = _serve(ThreadingHTTPServer(('127.0.0.1', 0), FakeXnat))
+    proxy = _serve(make_proxy(f'http://127.0.0.1:{upstream.server_port}', DiskCache(tmp_path / 'cache'),
+                              port=0, quiet=True, prefetch_after=0, site_stats=FixedStats()))
+    try:
+        started = time.monotonic()
+        response = requests.get(f'http://127.0.0.1:{proxy.server_port}/_site/stats')
+        assert response.status_code == 504 and time.monotonic() - started < 0.4
+    finally:
+        proxy.shutdown()
+        upstream.shutdown()
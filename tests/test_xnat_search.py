@@ -0,0 +1,117 @@
+"""Search executor: pages come back in order, ignored paging is caught before any row, and results are cached."""
+import json
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+from xnat_search import SearchCache, SearchExecutor, write_parquet
+
+SERVER = 'https://xnat.example.org'
+ROWS = [{'ID': f'E{i:02}', 'label': f'S{i}'} for i in range(11)]
+
+
+def response(payload) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = json.dumps(payload).encode()
+    resp._content_consumed = True
+    return resp
+
+
+class FakeSearch:
+    """Caches every search as 'c1' and serves pages of ROWS; earlier pages are the slowest to answer."""
+
+    def __init__(self, total: bool = True, paging: str = 'honored'):
+        self.total = total
+        self.paging = paging
+        self.offsets = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, params=None, **kwargs):
+        offset, limit = params['offset'], params['limit']
+        if method == 'POST':
+            result_set = {'ID': 'c1', 'Result': ROWS[:limit]}
+            if self.total:
+                result_set['totalRecords'] = str(len(ROWS))
+            return response({'ResultSet': result_set})
+        with self.lock:
+            self.offsets.append(offset)
+        time.sleep(0.01 * (len(ROWS) - offset) / limit)
+        if self.paging == 'ignored':
+            rows = ROWS
+        elif self.paging == 'offset ignored':
+            rows = ROWS[:limit]
+        else:
+            rows = ROWS[offset:offset + limit]
+        return response({'ResultSet': {'Result': rows}})
+
+
+@pytest.mark.parametrize('total', [True, False])
+def test_pages_are_yielded_in_order(total):
+    session = FakeSearch(total)
+    executor = SearchExecutor(session, SERVER, page_size=2, workers=3)
+
+    assert list(executor.run('<xdat:bundle/>')) == ROWS
+    assert sorted(session.offsets) == [2, 4, 6, 8, 10]
+    assert executor.stats == {'pages': 6, 'rows': len(ROWS), 'cache_hits': 0}
+
+
+def test_response_with_everything_is_used_once():
+    executor = SearchExecutor(FakeSearch(paging='ignored'), SERVER, page_size=2)
+
+    assert list(executor.run('<xdat:bundle/>')) == ROWS
+
+
+def test_ignored_offset_fails_before_any_row():
+    rows = SearchExecutor(FakeSearch(paging='offset ignored'), SERVER, page_size=2).run('<xdat:bundle/>')
+
+    with pytest.raises(RuntimeError, match='ignored the offset'):
+        next(rows)
+
+
+def test_complete_results_are_cached_for_ttl(tmp_path):
+    cache = SearchCache(tmp_path, ttl=60)
+    session = FakeSearch()
+
+    assert list(SearchExecutor(session, SERVER, page_size=2, cache=cache).run('<a/>')) == ROWS
+    requests_made = len(session.offsets)
+    again = SearchExecutor(session, SERVER, page_size=2, cache=cache)
+    assert list(again.run('<a/>')) == ROWS
+    assert again.stats['cache_hits'] == 1 and len(session.offsets) == requests_made
+
+    # Another user's run of the same definition does not share the entry
+    assert list(SearchExecutor(session, SERVER, page_size=2, cache=cache, scope='bob').run('<a/>')) == ROWS
+    assert len(session.offsets) == 2 * requests_made
+
+    entries = list(tmp_path.glob('*.jsonl.gz'))
+    old = time.time() - 120
+    for entry in entries:
+        os.utime(entry, (old, old))
+    assert len(entries) == 2 and cache.get(entries[0].name.split('.')[0]) is None
+    assert cache.purge() == 2 and not list(tmp_path.iterdir())
+
+
+def test_interrupted_run_leaves_no_entry(tmp_path):
+    cache = SearchCache(tmp_path, ttl=60)
+    rows = SearchExecutor(FakeSearch(), SERVER, page_size=2, cache=cache).run('<a/>')
+
+    assert next(rows) == ROWS[0]
+    rows.close()
+
+    assert not list(tmp_path.iterdir())
+
+
+def test_parquet_writer_batches_string_columns(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    rows = [{'ID': f'E{i}', 'size': i, 'note': None if i % 2 else 'x'} for i in range(5)]
+
+    assert write_parquet(iter(rows), tmp_path / 'out.parquet', batch_rows=2) == 5
+
+    table = pq.read_table(tmp_path / 'out.parquet')
+    assert table.column_names == ['ID', 'size', 'note']
+    assert table.column('size').to_pylist() == ['0', '1', '2', '3', '4']
+    assert table.column('note').to_pylist() == ['x', None, 'x', None, 'x']
+    assert pq.ParquetFile(tmp_path / 'out.parquet').metadata.num_row_groups >= 2
@@ -0,0 +1,46 @@
+"""Streaming ResultSet parser: rows decode the same however the body is chunked, wherever ResultSet sits."""
+import json
+
+import pytest
+
+from xnat_stream import iter_result_rows
+
+ROWS = [
+    {'ID': 'E1', 'label': 'plain'},
+    {'ID': 'E2', 'label': 'quote " and brace } inside', 'tags': ['[', ']']},
+    {'ID': 'E3', 'label': 'Zürich 東京', 'size': 12, 'nested': {'Result': [1, 2]}},
+]
+
+
+def chunked(body: bytes, size: int) -> list:
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 5, 64, 1 << 20])
+def test_rows_split_across_chunks(size):
+    body = json.dumps({'ResultSet': {'Result': ROWS, 'totalRecords': '3'}}, ensure_ascii=False).encode()
+
+    assert list(iter_result_rows(chunked(body, size))) == ROWS
+
+
+@pytest.mark.parametrize('size', [1, 7, 1 << 20])
+def test_result_set_after_other_keys(size):
+    body = json.dumps({
+        'Result': [{'ID': 'decoy'}],
+        'meta': {'ResultSet': {'Result': [{'ID': 'nested decoy'}]}, 'note': '"ResultSet": {"Result": ['},
+        'ResultSet': {'title': 'Experiments', 'Columns': [{'key': 'Result'}], 'Result': ROWS},
+    }).encode()
+
+    assert list(iter_result_rows(chunked(body, size))) == ROWS
+
+
+def test_body_without_result_set_yields_nothing():
+    assert list(iter_result_rows([b'{"items": [{"ID": "E1"}]}'])) == []
+
+
+def test_truncated_body_raises():
+    body = json.dumps({'ResultSet': {'Result': ROWS}}).encode()
+    rows = iter_result_rows(chunked(body[:-20], 16))
+
+    with pytest.raises(ValueError):
+        list(rows)
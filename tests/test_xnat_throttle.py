@@ -0,0 +1,106 @@
+"""Adaptive limiter: limits grow additively, are cut on 5xx or slow p95, and every request returns its slot."""
+import io
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from xnat_throttle import AdaptiveLimiter, ThrottledSession
+
+SERVER = 'https://xnat.example.org'
+
+
+def limiter(**kwargs) -> AdaptiveLimiter:
+    return AdaptiveLimiter(**{'target_p95': 1.0, 'min_limit': 1, 'max_limit': 8, 'initial_limit': 2, **kwargs})
+
+
+def test_healthy_responses_grow_limit_additively():
+    limits = limiter()
+
+    limits.acquire('listing')
+    limits.release('listing', 0.01, 200)
+    assert limits.snapshot()['listing']['limit'] == 2.5
+
+    for _ in range(100):
+        limits.acquire('listing')
+        limits.release('listing', 0.01, 200)
+    assert limits.snapshot()['listing']['limit'] == 8
+
+
+def test_distress_cuts_limit_once_per_interval():
+    limits = limiter(initial_limit=8)
+
+    for _ in range(2):
+        limits.acquire('file')
+    limits.release('file', 0.01, 503, retry_after=30)
+    # The second failure was already in flight when the limit was cut
+    limits.release('file', 0.01, 502)
+
+    state = limits.snapshot()['file']
+    assert state['limit'] == 4 and state['distress'] == 2 and state['inflight'] == 0
+    assert limits._states['file'].blocked_until > limits._states['file'].last_decrease + 29
+
+
+def test_slow_p95_cuts_limit():
+    limits = limiter(initial_limit=4, target_p95=0.1, window=10)
+
+    for _ in range(10):
+        limits.acquire('listing')
+        limits.release('listing', 0.5, 200)
+
+    # Nine slow responses still grow the limit; the tenth fills the window and cuts it in half
+    assert 2 < limits.snapshot()['listing']['limit'] < 3
+    assert limits.snapshot()['listing']['p95'] is None
+
+
+class FakeAdapter(BaseAdapter):
+    """Raises the given error, or answers with the given status."""
+
+    def __init__(self, error: Exception = None, status: int = 200):
+        super().__init__()
+        self.error = error
+        self.status = status
+
+    def send(self, request, **kwargs):
+        if self.error:
+            raise self.error
+        response = requests.Response()
+        response.status_code = self.status
+        response.raw = io.BytesIO(b'payload')
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def session(adapter: BaseAdapter) -> ThrottledSession:
+    throttled = ThrottledSession(limiter())
+    throttled.mount(SERVER, adapter)
+    return throttled
+
+
+@pytest.mark.parametrize('error', [requests.ConnectionError('refused'), RuntimeError('bug in a hook or adapter')])
+def test_failed_request_releases_slot(error):
+    throttled = session(FakeAdapter(error))
+    failures = []
+    throttled.failure_hooks.append(lambda method, url, seconds, error: failures.append(error))
+
+    with pytest.raises(type(error)):
+        throttled.get(f'{SERVER}/data/projects')
+
+    state = throttled.limiter.snapshot()['listing']
+    assert state['inflight'] == 0 and state['requests'] == 1
+    assert failures == ([error] if isinstance(error, requests.RequestException) else [])
+
+
+def test_streamed_file_holds_slot_until_closed():
+    throttled = session(FakeAdapter())
+
+    response = throttled.get(f'{SERVER}/data/experiments/E1/scans/1/resources/DICOM/files/1.dcm', stream=True)
+    assert throttled.limiter.snapshot()['file']['inflight'] == 1
+
+    response.close()
+    response.close()
+    assert throttled.limiter.snapshot()['file']['inflight'] == 0
+    assert throttled.limiter.snapshot()['file']['requests'] == 1
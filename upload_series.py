@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Parallel per-series upload pipeline for the compressed-archive import path.
+
+The browser path (uploadFileToCache -> importFromCache in
+src/services/xnat-api.ts) sends one whole archive in one request, so a
+dropped connection restarts a multi-GB upload from zero. Here each series
+becomes its own zip part (large series are split), and the stages overlap:
+
+    build    members are deflated on a thread pool and written in order,
+             so a part is produced at several cores' worth of throughput
+    upload   parts are PUT to the user cache concurrently over pooled
+             connections; a failed part is retried on its own
+    import   once every part of a study is in, each part is handed to
+             /data/services/import by its own src=<cache file>; the
+             shared session listener merges them in the prearchive
+
+The input is a dicom_index.py database, or a directory that is indexed
+first.
+"""
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from dicom_index import index_tree, iter_series, open_index
+from download_scans import configure_pool
+from find_small_scan import format_bytes, login, password, username, xnat_server
+
+DEFAULT_PART_BYTES = 1024 ** 3
+MAX_PART_MEMBERS = 65000  # stays below the classic zip entry limit, so no ZIP64 records are needed
+ZIP_LIMIT = 0xFFFFFFFF
+
+
+def _dos_time(timestamp: float):
+    t = time.localtime(max(timestamp, 315532800))  # zip dates start in 1980
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+def _compress_member(path: str, level: int):
+    """Read and raw-deflate one file; keep it stored if deflate does not help."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    crc = zlib.crc32(data)
+    if level:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        packed = compressor.compress(data) + compressor.flush()
+        if len(packed) < len(data):
+            return crc, len(data), 8, packed, os.path.getmtime(path)
+    return crc, len(data), 0, data, os.path.getmtime(path)
+
+
+def write_zip(members: list, out, pool: ThreadPoolExecutor, level: int = 6, window: int = 32) -> int:
+    """
+    Write a zip archive whose members are compressed in parallel.
+
+    Up to `window` members are in flight at once; they are written in
+    order as they complete, so memory stays bounded while every worker in
+    the pool is busy.
+
+    Args:
+        members: (archive name, file path) pairs
+        out: Binary file object to write to
+        pool: Executor that runs the compression (zlib releases the GIL)
+        level: Deflate level (0 stores every member)
+        window: Members compressed ahead of the writer
+
+    Returns:
+        Bytes written
+    """
+    central = []
+    offset = 0
+    pending = deque()
+    queue = iter(members)
+
+    def fill():
+        for name, path in queue:
+            pending.append((name, pool.submit(_compress_member, path, level)))
+            if len(pending) >= window:
+                break
+
+    fill()
+    while pending:
+        name, future = pending.popleft()
+        fill()
+        crc, size, method, payload, mtime = future.result()
+        encoded = name.encode('utf-8')
+        flags = 0x800 if not name.isascii() else 0
+        dos_time, dos_date = _dos_time(mtime)
+        if offset > ZIP_LIMIT or len(payload) > ZIP_LIMIT:
+            raise ValueError('zip part exceeds 4 GiB; lower the part size')
+
+        header = struct.pack('<IHHHHHIIIHH', 0x04034B50, 20, flags, method, dos_time, dos_date,
+                             crc, len(payload), size, len(encoded), 0)
+        out.write(header + encoded)
+        out.write(payload)
+        central.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014B50, 20, 20, flags, method, dos_time, dos_date,
+                                   crc, len(payload), size, len(encoded), 0, 0, 0, 0, 0, offset) + encoded)
+        offset += len(header) + len(encoded) + len(payload)
+
+    directory = b''.join(central)
+    out.write(directory)
+    out.write(struct.pack('<IHHHHIIH', 0x06054B50, 0, 0, len(central), len(central), len(directory), offset, 0))
+    return offset + len(directory) + 22
+
+
+def series_parts(series: dict, max_bytes: int = DEFAULT_PART_BYTES) -> list:
+    """Split a series' files into parts of at most max_bytes (uncompressed) and MAX_PART_MEMBERS files."""
+    parts, current, current_bytes = [], [], 0
+    for path in series['paths']:
+        size = os.path.getsize(path)
+        if current and (current_bytes + size > max_bytes or len(current) >= MAX_PART_MEMBERS):
+            parts.append(current)
+            current, current_bytes = [], 0
+        current.append(path)
+        current_bytes += size
+    if current:
+        parts.append(current)
+    return parts
+
+
+class UploadPipeline:
+    """
+    Builds, uploads and imports per-series zip parts, study by study.
+
+    Parts go to /data/user/cache/resources/<upload id>/files/<part>.zip,
+    one upload id per study; the study is imported when all of its parts
+    have been uploaded and skipped (with its parts left in the cache for
+    inspection) if any part fails after its retries.
+    """
+
+    def __init__(self, session, server: str, project: str, work_dir: Path, import_handler: str = 'DICOM-zip',
+                 archive: bool = False, ignore_unparsable: bool = True, uploads: int = 4,
+                 compressors: int = None, level: int = 6, retries: int = 5, max_pending: int = None):
+        self.session = session
+        self.server = server
+        self.project = project
+        self.work_dir = Path(work_dir)
+        self.import_handler = import_handler
+        self.archive = archive
+        self.ignore_unparsable = ignore_unparsable
+        self.level = level
+        self.retries = retries
+        self.compress_pool = ThreadPoolExecutor(max_workers=compressors or os.cpu_count(),
+                                                thread_name_prefix='deflate')
+        self.build_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='build')
+        self.upload_pool = ThreadPoolExecutor(max_workers=uploads, thread_name_prefix='upload')
+        # Built parts waiting for an upload slot are bounded so the work dir stays small
+        self.pending = threading.Semaphore(max_pending or uploads * 2)
+        self.lock = threading.Lock()
+        self.stats = {'parts': 0, 'uploaded': 0, 'retried': 0, 'failed': 0, 'bytes': 0,
+                      'studies': 0, 'imported': 0, 'import_failed': 0}
+        configure_pool(session, uploads + 2)
+
+    # Stages --------------------------------------------------------------
+
+    def _build(self, part_name: str, paths: list) -> Path:
+        zip_path = self.work_dir / part_name
+        members = [(f'{i:06d}_{os.path.basename(p)}', p) for i, p in enumerate(paths)]
+        with open(zip_path, 'wb') as out:
+            write_zip(members, out, self.compress_pool, self.level)
+        return zip_path
+
+    def _put(self, upload_id: str, zip_path: Path) -> bool:
+        url = f'{self.server}/data/user/cache/resources/{upload_id}/files/{zip_path.name}'
+        for attempt in range(self.retries):
+            try:
+                with open(zip_path, 'rb') as body:
+                    response = self.session.put(url, data=body, params={'inbody': 'true'},
+                                                headers={'Content-Type': 'application/zip'})
+                if 200 <= response.status_code < 300:
+                    return True
+                if response.status_code in (401, 403):
+                    return False
+            except requests.RequestException:
+                pass
+            with self.lock:
+                self.stats['retried'] += 1
+            time.sleep(min(60, 2 ** attempt))
+        return False
+
+    def _import(self, upload_id: str, part_name: str) -> bool:
+        # The import service takes one uploaded file per call; parts sharing the session listener are merged
+        # into one session in the prearchive
+        src = f'/user/cache/resources/{upload_id}/files/{part_name}'
+        data = {
+            'threshhold': '51516279',
+            'project': self.project,
+            'import-handler': self.import_handler,
+            'prearchive_code': '1' if self.archive else '0',
+            'auto-archive': str(self.archive).lower(),
+            'quarantine': 'false',
+            'action': 'commit',
+            'src': src,
+            'http-session-listener': upload_id,
+            'Ignore-Unparsable': str(self.ignore_unparsable).lower(),
+        }
+        csrf = self.session.cookies.get('XNAT_CSRF')
+        if csrf:
+            data['XNAT_CSRF'] = csrf
+        try:
+            response = self.session.post(f'{self.server}/data/services/import', data=data,
+                                         params={'XNAT_CSRF': csrf} if csrf else None,
+                                         headers={'X-Requested-With': 'XMLHttpRequest'})
+        except requests.RequestException:
+            return False
+        return 200 <= response.status_code < 300
+
+    def _build_part(self, study: dict, part_name: str, paths: list):
+        """Build one part and queue its upload; returns the upload future, or None if the build failed."""
+        try:
+            zip_path = self._build(part_name, paths)
+        except (OSError, ValueError) as e:
+            (self.work_dir / part_name).unlink(missing_ok=True)
+            self.pending.release()
+            print(f"✗ {part_name}: {e}")
+            self._part_done(study, False)
+            return None
+        return self.upload_pool.submit(self._upload_part, study, zip_path)
+
+    def _upload_part(self, study: dict, zip_path: Path):
+        try:
+            size = zip_path.stat().st_size
+            ok = self._put(study['upload_id'], zip_path)
+        finally:
+            zip_path.unlink(missing_ok=True)
+            self.pending.release()
+        self._part_done(study, ok, size, zip_path.name)
+
+    def _part_done(self, study: dict, ok: bool, size: int = 0, part_name: str = None):
+        # Exactly one caller sees remaining reach zero, so each study is finished once
+        with self.lock:
+            self.stats['uploaded' if ok else 'failed'] += 1
+            self.stats['bytes'] += size if ok else 0
+            if ok:
+                study['uploaded'].append(part_name)
+            study['remaining'] -= 1
+            study['failed'] += not ok
+            done = study['remaining'] == 0
+        if done:
+            self._finish_study(study)
+
+    def _finish_study(self, study: dict):
+        label = study['label']
+        if study['failed']:
+            print(f"✗ {label}: {study['failed']} part(s) failed; not imported "
+                  f"(uploaded parts kept in /user/cache/resources/{study['upload_id']})")
+            with self.lock:
+                self.stats['import_failed'] += 1
+            return
+        failed = [part for part in sorted(study['uploaded']) if not self._import(study['upload_id'], part)]
+        with self.lock:
+            self.stats['import_failed' if failed else 'imported'] += 1
+        if failed:
+            print(f"✗ {label}: import failed for {len(failed)} of {study['parts']} part(s) "
+                  f"(kept in /user/cache/resources/{study['upload_id']})")
+            return
+        try:
+            self.session.delete(f"{self.server}/data/user/cache/resources/{study['upload_id']}")
+        except requests.RequestException:
+            pass  # cleanup failure should not fail the import
+        print(f"✓ {label}: {study['parts']} part(s) imported")
+
+    # Driver --------------------------------------------------------------
+
+    def run(self, series_list, max_part_bytes: int = DEFAULT_PART_BYTES) -> dict:
+        """
+        Push every series through the pipeline, grouped by study.
+
+        Args:
+            series_list: Dicts as yielded by dicom_index.iter_series
+            max_part_bytes: Uncompressed bytes per zip part
+
+        Returns:
+            Pipeline counters
+        """
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        studies = {}
+        for series in series_list:
+            if not series['paths']:
+                continue
+            studies.setdefault(series['study_uid'], []).append(series)
+
+        builds = []
+        for study_uid, members in studies.items():
+            parts = [(s, chunk) for s in members for chunk in series_parts(s, max_part_bytes)]
+            first = members[0]
+            study = {'upload_id': f'{int(time.time() * 1000)}_{uuid.uuid4().hex[:9]}', 'parts': len(parts),
+                     'remaining': len(parts), 'failed': 0, 'uploaded': [],
+                     'label': f"{first['patient_id'] or '?'} {first['study_date'] or ''} {study_uid}"}
+            with self.lock:
+                self.stats['studies'] += 1
+                self.stats['parts'] += len(parts)
+
+            for index, (series, paths) in enumerate(parts):
+                part_name = f"{series['series_number'] or 0:04d}_{index:03d}_{series['series_uid']}.zip"
+                self.pending.acquire()
+                builds.append(self.build_pool.submit(self._build_part, study, part_name, paths))
+
+        for future in builds:
+            upload = future.result()
+            if upload is not None:
+                upload.result()
+        for pool in (self.upload_pool, self.build_pool, self.compress_pool):
+            pool.shutdown()
+        return self.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Upload DICOM series to XNAT as parallel per-series zip parts.')
+    parser.add_argument('source', help='Directory of DICOM files, or a dicom_index.py database (.sqlite)')
+    parser.add_argument('--project', required=True)
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    parser.add_argument('--db', default=None, help='Index database used when source is a directory')
+    parser.add_argument('--study', help='Only this StudyInstanceUID')
+    parser.add_argument('--archive', action='store_true', help='Archive directly instead of to the prearchive')
+    parser.add_argument('--import-handler', default='DICOM-zip')
+    parser.add_argument('--uploads', type=int, default=4, help='Concurrent part uploads')
+    parser.add_argument('--compressors', type=int, default=None, help='Deflate threads (default: CPU count)')
+    parser.add_argument('--level', type=int, default=6, help='Deflate level, 0 to store')
+    parser.add_argument('--part-mb', type=float, default=DEFAULT_PART_BYTES / 1024 ** 2)
+    parser.add_argument('--retries', type=int, default=5)
+    parser.add_argument('--work-dir', default=None, help='Where parts are staged (default: a temp directory)')
+    args = parser.parse_args(argv)
+
+    source = Path(args.source)
+    if source.is_dir():
+        db_path = Path(args.db) if args.db else Path(tempfile.mkdtemp()) / 'index.sqlite'
+        conn = open_index(db_path)
+        counts = index_tree(source, conn)
+        print(f"Indexed {counts['seen']:,} files ({counts['read']:,} read) into {db_path}")
+    elif source.is_file():
+        conn = open_index(source)
+    else:
+        print(f"Error: {source} does not exist")
+        sys.exit(1)
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix='xnat-upload-'))
+    pipeline = UploadPipeline(session, args.server, args.project, work_dir, args.import_handler, args.archive,
+                              uploads=args.uploads, compressors=args.compressors, level=args.level,
+                              retries=args.retries)
+    started = time.monotonic()
+    stats = pipeline.run(iter_series(conn, args.study), int(args.part_mb * 1024 ** 2))
+    elapsed = time.monotonic() - started
+    print(f"✓ {stats['imported']:,}/{stats['studies']:,} studies imported; {stats['uploaded']:,}/{stats['parts']:,} "
+          f"parts, {format_bytes(stats['bytes'])} in {elapsed:.1f}s "
+          f"({format_bytes(stats['bytes'] / max(elapsed, 1e-6))}/s), {stats['retried']:,} retries")
+    if stats['failed'] or stats['import_failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Benchmark how fast the Cornerstone viewer loads scans.
+
+Each scan is loaded repeatedly in headless Chrome with performance logging
+on. The measurement ends when the viewer marks volume-complete (see
+src/utils/viewerReadiness.ts), and every load records:
+
+    - time to first image and time to full volume, from the readiness
+      milestones (ms since navigation start); the viewer draws the first
+      image once its opening slices arrive and fetches the rest several
+      at a time, so the two differ by the bulk of the download
+    - DICOM requests and bytes on the wire, total request count, failed
+      requests and peak concurrent requests, from the DevTools Network
+      events in the performance log
+    - main-thread long tasks (count, total and longest), from a Long Tasks
+      API observer installed before the app's own scripts
+
+Loads are cold by default: the HTTP cache is disabled through DevTools so
+every run fetches the same bytes. Each invocation appends one entry to a
+JSON history file, with per-scan p50/p90/p95 summaries, and prints the
+change in medians against the latest earlier entry for the same scans and
+cache mode. Viewer and proxy changes can then be judged by numbers:
+
+    python viewer_benchmark.py XNAT_E00041/2 XNAT_E02216/100 --runs 10 --label proxy-cache
+
+Requires selenium and a local chromedriver (see viewer_browser.py).
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from find_small_scan import format_bytes, password, username
+from viewer_browser import (DEFAULT_APP_URL, ViewerError, drain_logs, login_through_ui, resolve_chromedriver,
+                            start_browser, viewer_url, wait_for_milestone)
+from xnat_throttle import percentile
+
+DEFAULT_HISTORY = 'viewer-benchmarks.json'
+DICOM_FILE = re.compile(r'/scans/[^/?]+/resources/[^/?]+/files/[^?]+')
+LONG_TASK_OBSERVER = """
+window.__longTasks = [];
+try {
+  new PerformanceObserver((list) => {
+    for (const entry of list.getEntries()) window.__longTasks.push([entry.startTime, entry.duration]);
+  }).observe({ type: 'longtask', buffered: true });
+} catch (e) {}
+"""
+METRICS = ('first_image_ms', 'full_volume_ms', 'dicom_bytes', 'dicom_requests', 'requests', 'peak_concurrency',
+           'long_tasks', 'long_task_ms')
+QUANTILES = (('p50', 0.5), ('p90', 0.9), ('p95', 0.95))
+
+
+def network_metrics(events: list, time_origin: float, cutoff_ms: float) -> dict:
+    """
+    Summarize DevTools Network events of one page load.
+
+    Args:
+        events: performance log messages ({'method': ..., 'params': ...})
+        time_origin: performance.timeOrigin of the page (epoch ms)
+        cutoff_ms: Milestone time (ms after time_origin) that ends the measurement
+
+    Returns:
+        Request, DICOM and concurrency counters for requests started before cutoff_ms
+    """
+    requests = {}
+    for event in events:
+        method, params = event.get('method'), event.get('params', {})
+        request_id = params.get('requestId')
+        if method == 'Network.requestWillBeSent':
+            wall_time = params.get('wallTime')
+            if wall_time is None or request_id in requests:
+                continue  # redirects reuse the id; the first hop marks the start
+            requests[request_id] = {
+                'url': params.get('request', {}).get('url', ''),
+                # Network timestamps are monotonic seconds; wallTime anchors them to the epoch
+                'offset': wall_time - params.get('timestamp', 0),
+                'start': wall_time * 1000 - time_origin,
+                'end': None,
+                'bytes': 0,
+                'failed': False,
+                'mime': '',
+            }
+        elif request_id in requests:
+            request = requests[request_id]
+            if method == 'Network.responseReceived':
+                request['mime'] = params.get('response', {}).get('mimeType', '')
+            elif method in ('Network.loadingFinished', 'Network.loadingFailed'):
+                request['end'] = (params.get('timestamp', 0) + request['offset']) * 1000 - time_origin
+                request['bytes'] = params.get('encodedDataLength', 0) or 0
+                request['failed'] = method == 'Network.loadingFailed'
+
+    started = [r for r in requests.values() if r['start'] <= cutoff_ms and r['url'].startswith('http')]
+    dicom = [r for r in started if DICOM_FILE.search(r['url']) or r['mime'] == 'application/dicom']
+
+    # Sweep start/end points; requests still open at the cutoff count as ending there
+    edges = sorted([(r['start'], 1) for r in started] +
+                   [(min(r['end'] if r['end'] is not None else cutoff_ms, cutoff_ms), -1) for r in started],
+                   key=lambda edge: (edge[0], edge[1]))
+    peak = active = 0
+    for _, step in edges:
+        active += step
+        peak = max(peak, active)
+
+    return {
+        'requests': len(started),
+        'failed_requests': sum(r['failed'] for r in started),
+        'dicom_requests': len(dicom),
+        'dicom_bytes': sum(r['bytes'] for r in dicom),
+        'peak_concurrency': peak,
+    }
+
+
+def measure_load(driver, app_url: str, experiment: str, scan: str, timeout: float) -> dict:
+    """Load one scan from a blank page and return its metrics."""
+    driver.get('about:blank')
+    drain_logs(driver)
+    driver.get(viewer_url(app_url, experiment, scan))
+    state = wait_for_milestone(driver, 'volume-complete', timeout)
+    page = driver.execute_script('return {timeOrigin: performance.timeOrigin, longTasks: window.__longTasks || []};')
+    events = [json.loads(entry['message'])['message'] for entry in driver.get_log('performance')]
+
+    milestones = state['milestones']
+    cutoff = milestones['volume-complete']
+    long_tasks = [duration for start, duration in page['longTasks'] if start <= cutoff]
+    return {
+        'first_image_ms': round(milestones['first-image-rendered'], 1),
+        'full_volume_ms': round(cutoff, 1),
+        'milestones': {name: round(at, 1) for name, at in milestones.items()},
+        'slices': state['detail'].get('slices'),
+        **network_metrics(events, page['timeOrigin'], cutoff),
+        'long_tasks': len(long_tasks),
+        'long_task_ms': round(sum(long_tasks), 1),
+        'longest_task_ms': round(max(long_tasks, default=0), 1),
+    }
+
+
+def summarize(loads: list) -> dict:
+    """Percentiles of every metric over the successful loads of one scan."""
+    ok = [load for load in loads if 'error' not in load]
+    summary = {'runs': len(loads), 'failures': len(loads) - len(ok)}
+    for metric in METRICS:
+        values = [load[metric] for load in ok if load.get(metric) is not None]
+        if values:
+            summary[metric] = {name: percentile(values, fraction) for name, fraction in QUANTILES}
+            summary[metric]['max'] = max(values)
+    return summary
+
+
+def load_history(path: Path) -> dict:
+    if path.exists():
+        return json.loads(path.read_text())
+    return {'runs': []}
+
+
+def write_history(history: dict, path: Path):
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(history, indent=2))
+    os.replace(tmp, path)
+
+
+def previous_run(runs: list, entry: dict):
+    """Latest run in the history that loaded the same scans with the same cache mode, or None."""
+    for run in reversed(runs):
+        if run.get('cache') == entry['cache'] and set(run.get('loads', {})) == set(entry['loads']):
+            return run
+    return None
+
+
+def print_report(entry: dict, previous: dict = None):
+    print(f"\n{'scan':<28} {'first image':>14} {'full volume':>14} {'DICOM':>10} {'reqs':>6} {'peak':>5} "
+          f"{'long tasks':>11}")
+    for key, summary in entry['summary'].items():
+        if 'first_image_ms' not in summary:
+            print(f"{key:<28} all {summary['runs']} runs failed")
+            continue
+        line = (f"{key:<28} {summary['first_image_ms']['p50']:>8.0f}/{summary['first_image_ms']['p95']:<5.0f}"
+                f" {summary['full_volume_ms']['p50']:>8.0f}/{summary['full_volume_ms']['p95']:<5.0f}"
+                f" {format_bytes(summary['dicom_bytes']['p50']):>10} {summary['requests']['p50']:>6}"
+                f" {summary['peak_concurrency']['p50']:>5} {summary['long_tasks']['p50']:>4}"
+                f" / {summary['long_task_ms']['p50']:>4.0f}ms")
+        before = (previous or {}).get('summary', {}).get(key, {})
+        if 'full_volume_ms' in before:
+            delta = summary['full_volume_ms']['p50'] - before['full_volume_ms']['p50']
+            line += f"   volume p50 {delta:+.0f}ms vs {previous.get('label') or previous['started_at']}"
+        if summary['failures']:
+            line += f"   ({summary['failures']} failed)"
+        print(line)
+    print("\n(ms p50/p95 after navigation start; DICOM bytes, requests, peak concurrency and long tasks are p50)")
+
+
+def parse_scans(values: list, scans_file: str = None) -> list:
+    scans = list(values)
+    if scans_file:
+        scans += [line.strip() for line in Path(scans_file).read_text().splitlines()
+                  if line.strip() and not line.lstrip().startswith('#')]
+    for value in scans:
+        if '/' not in value:
+            raise ValueError(f'Expected EXPERIMENT/SCAN, got {value!r}')
+    return [tuple(value.split('/', 1)) for value in scans]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Cornerstone viewer scan loads.')
+    parser.add_argument('scans', nargs='*', metavar='EXPERIMENT/SCAN')
+    parser.add_argument('--scans-file', help='File with one EXPERIMENT/SCAN per line')
+    parser.add_argument('--runs', type=int, default=5, help='Loads per scan')
+    parser.add_argument('--app-url', default=DEFAULT_APP_URL)
+    parser.add_argument('--xnat-server', help="XNAT URL for the login form (default: the form's own default)")
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON history the run is appended to')
+    parser.add_argument('--label', help='Name for this run in the history (e.g. a branch or proxy setting)')
+    parser.add_argument('--warm', action='store_true', help='Keep the browser HTTP cache between loads')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Seconds to wait for volume-complete')
+    parser.add_argument('--chromedriver')
+    parser.add_argument('--headed', action='store_true')
+    args = parser.parse_args(argv)
+
+    try:
+        scans = parse_scans(args.scans, args.scans_file)
+        driver_path = resolve_chromedriver(args.chromedriver)
+    except (ValueError, RuntimeError) as e:
+        print(e)
+        sys.exit(1)
+    if not scans:
+        parser.error('no scans given')
+
+    app_url = args.app_url.rstrip('/')
+    driver = start_browser(driver_path, not args.headed, performance=True)
+    loads = {f'{experiment}/{scan}': [] for experiment, scan in scans}
+    entry = {
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'label': args.label,
+        'app_url': app_url,
+        'cache': 'warm' if args.warm else 'cold',
+        'runs_per_scan': args.runs,
+    }
+    try:
+        login_through_ui(driver, app_url, args.username, args.password, args.xnat_server)
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': LONG_TASK_OBSERVER})
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setCacheDisabled', {'cacheDisabled': not args.warm})
+
+        # Interleave scans so drift on the server affects every scan alike
+        for run in range(1, args.runs + 1):
+            for experiment, scan in scans:
+                key = f'{experiment}/{scan}'
+                started = time.monotonic()
+                try:
+                    result = measure_load(driver, app_url, experiment, scan, args.timeout)
+                    print(f"  [{run}/{args.runs}] {key}: first image {result['first_image_ms']:.0f}ms, "
+                          f"volume {result['full_volume_ms']:.0f}ms, {format_bytes(result['dicom_bytes'])} "
+                          f"in {result['dicom_requests']} requests")
+                except ViewerError as e:
+                    result = {'error': str(e)}
+                    print(f"  [{run}/{args.runs}] {key}: ✗ {e}")
+                except Exception as e:  # a timeout or a crashed tab must not lose the other runs
+                    result = {'error': f'{type(e).__name__}: {e}'}
+                    print(f"  [{run}/{args.runs}] {key}: ✗ no volume-complete after "
+                          f"{time.monotonic() - started:.0f}s")
+                loads[key].append(result)
+    finally:
+        driver.quit()
+
+    entry['loads'] = loads
+    entry['summary'] = {key: summarize(results) for key, results in loads.items()}
+    history_path = Path(args.history)
+    history = load_history(history_path)
+    previous = previous_run(history['runs'], entry)
+    history['runs'].append(entry)
+    write_history(history, history_path)
+    print_report(entry, previous)
+    print(f"\n✓ Appended to {history_path}")
+
+
+if __name__ == '__main__':
+    main()
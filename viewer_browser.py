@@ -0,0 +1,272 @@
+"""
+Headless Chrome sessions for driving the Morpheus viewer.
+
+Shared by the pytest suite under tests/ and by scripts that load scans in
+the viewer. Three things make browser runs fast and repeatable:
+
+    - chromedriver is resolved from the local machine (--chromedriver,
+      $CHROMEDRIVER, PATH, or the Selenium / webdriver-manager caches), so
+      no run needs network access to fetch a driver
+    - the app is logged into once through its own login form and the
+      resulting localStorage and cookies are snapshotted; every other
+      browser is authenticated by replaying that snapshot
+    - BrowserPool starts its browsers concurrently and hands them out one
+      user at a time, restoring the snapshot between users instead of
+      relaunching Chrome; the restore runs in the background while the
+      next user takes another idle browser
+
+Requires selenium.
+"""
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_APP_URL = 'http://localhost:5173'
+JSESSION_KEY = 'xnat_jsessionid'  # STORAGE_KEYS.JSESSIONID in XnatContext.tsx
+ORIGIN_PAGE = '/vite.svg'  # any static file on the app's origin, so storage can be set without booting the app
+DRIVER_CACHES = ('~/.cache/selenium/chromedriver', '~/.wdm/drivers/chromedriver')
+
+
+def resolve_chromedriver(explicit: str = None) -> str:
+    """
+    Find a chromedriver binary without touching the network.
+
+    Raises:
+        RuntimeError: if no driver is installed locally
+    """
+    for candidate in (explicit, os.environ.get('CHROMEDRIVER'), shutil.which('chromedriver')):
+        if candidate and Path(candidate).is_file():
+            return str(candidate)
+    cached = [path for root in DRIVER_CACHES for path in Path(root).expanduser().glob('**/chromedriver*')
+              if path.is_file() and path.suffix in ('', '.exe') and os.access(path, os.X_OK)]
+    if cached:
+        return str(max(cached, key=lambda path: path.stat().st_mtime))
+    raise RuntimeError('No chromedriver found: put one on PATH, set CHROMEDRIVER or pass --chromedriver')
+
+
+def chrome_options(headless: bool = True, performance: bool = False):
+    """Chrome options shared by every viewer run; performance also records DevTools network/timeline events."""
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    if headless:
+        options.add_argument('--headless=new')
+    for argument in ('--no-sandbox', '--disable-dev-shm-usage', '--window-size=1920,1080', '--no-first-run',
+                     '--disable-extensions', '--disable-background-networking', '--mute-audio'):
+        options.add_argument(argument)
+    prefs = {'browser': 'ALL'}
+    if performance:
+        prefs['performance'] = 'ALL'
+    options.set_capability('goog:loggingPrefs', prefs)
+    return options
+
+
+def start_browser(driver_path: str, headless: bool = True, performance: bool = False):
+    """Launch one Chrome controlled through the given chromedriver."""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    return webdriver.Chrome(service=Service(executable_path=driver_path),
+                            options=chrome_options(headless, performance))
+
+
+def viewer_url(app_url: str, experiment: str, scan: str) -> str:
+    """Cornerstone viewer route for one scan (the app uses a HashRouter)."""
+    return f'{app_url.rstrip("/")}/#/experiments/{experiment}/scans/{scan}/cornerstone'
+
+
+def login_through_ui(driver, app_url: str, username: str, password: str, server: str = None,
+                     timeout: float = 30.0):
+    """
+    Sign in with the app's login form and wait until the session is stored.
+
+    Raises:
+        RuntimeError: if the app did not store a session within timeout
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    driver.get(app_url)
+    wait = WebDriverWait(driver, timeout)
+    user_input = wait.until(EC.element_to_be_clickable((By.ID, 'username')))
+    base_url = driver.find_elements(By.ID, 'baseURL')  # only rendered outside production builds
+    if server and base_url:
+        base_url[0].clear()
+        base_url[0].send_keys(server)
+    user_input.clear()
+    user_input.send_keys(username)
+    password_input = driver.find_element(By.ID, 'password')
+    password_input.clear()
+    password_input.send_keys(password)
+    driver.find_element(By.CSS_SELECTOR, 'button[type="submit"]').click()
+    try:
+        wait.until(lambda d: d.execute_script('return window.localStorage.getItem(arguments[0]);', JSESSION_KEY))
+    except TimeoutException:
+        body = driver.find_element(By.TAG_NAME, 'body').text
+        raise RuntimeError(f'Login did not complete within {timeout:.0f}s: {body[:200]!r}') from None
+
+
+class ViewerError(RuntimeError):
+    """The viewer reported its 'error' milestone."""
+
+
+def viewer_state(driver):
+    """The viewer's readiness record (see src/utils/viewerReadiness.ts), or None before it mounts."""
+    return driver.execute_script('return window.__morpheusViewer || null;')
+
+
+def wait_for_milestone(driver, milestone: str, timeout: float = 60.0) -> dict:
+    """
+    Wait until the viewer reaches a readiness milestone.
+
+    Milestones are auth-ready, metadata-loaded, first-image-rendered and
+    volume-complete; the wait returns as soon as the milestone is marked.
+
+    Returns:
+        The readiness record, milestone times in performance.now() ms
+
+    Raises:
+        ViewerError: as soon as the viewer marks 'error'
+        TimeoutException: if the milestone is not reached within timeout
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    def reached(d):
+        state = viewer_state(d)
+        if not state:
+            return False
+        if 'error' in state['milestones']:
+            raise ViewerError(f"Viewer failed on {state['key']}: {state['detail'].get('message')}")
+        return state if milestone in state['milestones'] else False
+
+    return WebDriverWait(driver, timeout, poll_frequency=0.05).until(reached)
+
+
+def capture_auth(driver) -> dict:
+    """Snapshot the logged-in state of the current origin."""
+    return {
+        'local_storage': driver.execute_script('return Object.fromEntries(Object.entries(window.localStorage));'),
+        'cookies': driver.get_cookies(),
+    }
+
+
+def apply_auth(driver, app_url: str, auth: dict):
+    """Replace the app origin's storage and cookies with a snapshot, leaving the browser on about:blank."""
+    driver.get(app_url.rstrip('/') + ORIGIN_PAGE)
+    driver.delete_all_cookies()
+    for cookie in auth.get('cookies', []):
+        driver.add_cookie({key: cookie[key] for key in ('name', 'value', 'path', 'secure', 'httpOnly', 'expiry')
+                           if key in cookie})
+    driver.execute_script('window.localStorage.clear();'
+                          'for (const [key, value] of Object.entries(arguments[0])) {'
+                          '  window.localStorage.setItem(key, value);'
+                          '}', auth.get('local_storage', {}))
+    driver.get('about:blank')
+
+
+def drain_logs(driver):
+    """Discard buffered console (and performance) entries so the next user starts clean."""
+    for log_type in driver.log_types:
+        driver.get_log(log_type)
+
+
+def uncaught_errors(entries: list) -> list:
+    """SEVERE console entries other than failed resource loads (aborted and optional requests are routine)."""
+    return [entry for entry in entries
+            if entry.get('level') == 'SEVERE' and 'Failed to load resource' not in entry.get('message', '')]
+
+
+class BrowserPool:
+    """
+    Browsers started ahead of time and lent to one user at a time.
+
+    Args:
+        launch: Callable returning a new driver
+        size: Browsers kept warm
+        prepare: Called with each driver after launch and after every use
+            (e.g. to restore the auth snapshot); after a use it runs in the
+            background, so a second browser lets the next user start at once
+    """
+
+    def __init__(self, launch, size: int = 2, prepare=None):
+        self.launch = launch
+        self.size = size
+        self.prepare = prepare
+        self._idle = queue.Queue()
+        self._drivers = []
+        self._lock = threading.Lock()
+        self._resets = ThreadPoolExecutor(max_workers=size, thread_name_prefix='browser-reset')
+
+    def _new(self):
+        driver = self.launch()
+        with self._lock:
+            self._drivers.append(driver)
+        if self.prepare:
+            try:
+                self.prepare(driver)
+            except Exception:
+                self._discard(driver)
+                raise
+        return driver
+
+    def start(self):
+        """Launch every browser concurrently; returns once all are ready."""
+        with ThreadPoolExecutor(max_workers=self.size) as pool:
+            for driver in pool.map(lambda _: self._new(), range(self.size)):
+                self._idle.put(driver)
+        return self
+
+    def _discard(self, driver):
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _reset(self, driver):
+        try:
+            driver.get('about:blank')
+            drain_logs(driver)
+            if self.prepare:
+                self.prepare(driver)
+        except Exception:
+            self._discard(driver)
+            try:
+                driver = self._new()
+            except Exception:
+                driver = None  # the next acquire() launches it, so the pool keeps its size
+        self._idle.put(driver)
+
+    @contextmanager
+    def acquire(self, timeout: float = None):
+        """Borrow a browser; it is reset (or replaced, if it died) in the background after the block exits."""
+        driver = self._idle.get(timeout=timeout)
+        if driver is None:
+            try:
+                driver = self._new()
+            except Exception:
+                self._idle.put(None)
+                raise
+        try:
+            drain_logs(driver)
+            yield driver
+        finally:
+            self._resets.submit(self._reset, driver)
+
+    def close(self):
+        self._resets.shutdown(wait=True)
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
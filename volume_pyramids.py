@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Build multi-resolution volume pyramids for the MPR viewer.
+
+Each scan's slices are sorted along the slice normal, stacked into a
+volume with the modality LUT applied, and stored as 2x and 4x downsampled
+levels in a Zarr v2 group:
+
+    <root>/<experiment>/<scan>/.zgroup
+                               .zattrs        multiscales + geometry
+                               1/.zarray      2x level
+                               1/0.0.0 ...    zlib-compressed 64^3 chunks
+                               2/...          4x level
+
+Zarr v2 with the zlib codec needs nothing beyond NumPy to write, opens in
+any Zarr reader, and its chunks inflate with the browser's built-in
+DecompressionStream('deflate'), so the viewer can paint the 4x level from a
+few hundred kilobytes while the full-resolution slices load. xnat_proxy.py
+serves the groups under /_pyramids/<experiment>/<scan>/.
+
+Levels average whole voxels (area averaging). In-plane resolution halves
+at each level; the through-plane factor is reduced for thick-slice series
+so the levels stay roughly isotropic.
+
+New scans are found in the Parquet/Arrow catalog written by
+export_catalog.py: every DICOM scan without a pyramid is built.
+
+Requires pydicom and NumPy (and pyarrow to read the catalog).
+"""
+import argparse
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from find_small_scan import list_dicom_files, login, password, username, xnat_server
+from scan_snapshots import first_value
+
+FACTORS = (2, 4)
+CHUNK = 64
+COMPRESSION_LEVEL = 6
+DEFAULT_ROOT = '.xnat-cache/pyramids'
+
+
+def _floats(value, count: int):
+    try:
+        values = [float(v) for v in value]
+    except (TypeError, ValueError):
+        return None
+    return values if len(values) == count else None
+
+
+def read_slice(data: bytes):
+    """
+    Decode one single-frame instance.
+
+    Returns:
+        (geometry dict, 2-D float32 pixels with the modality LUT applied),
+        or None for instances without usable pixel data
+    """
+    import numpy as np
+    import pydicom
+
+    ds = pydicom.dcmread(io.BytesIO(data))
+    if 'PixelData' not in ds or int(getattr(ds, 'NumberOfFrames', 1) or 1) > 1:
+        return None
+    pixels = ds.pixel_array
+    if pixels.ndim != 2:
+        return None
+
+    slope = float(getattr(ds, 'RescaleSlope', 1) or 1)
+    intercept = float(getattr(ds, 'RescaleIntercept', 0) or 0)
+    orientation = _floats(getattr(ds, 'ImageOrientationPatient', None), 6)
+    position = _floats(getattr(ds, 'ImagePositionPatient', None), 3)
+    spacing = _floats(getattr(ds, 'PixelSpacing', None), 2) or [1.0, 1.0]
+
+    geometry = {
+        'shape': pixels.shape,
+        'orientation': tuple(round(v, 4) for v in orientation) if orientation else None,
+        'position': position,
+        'spacing': spacing,
+        'instance': int(getattr(ds, 'InstanceNumber', 0) or 0),
+        'integral': slope.is_integer() and intercept.is_integer(),
+        'modality': str(getattr(ds, 'Modality', '')),
+        'series_uid': str(getattr(ds, 'SeriesInstanceUID', '')),
+        'window': {'center': first_value(getattr(ds, 'WindowCenter', None)),
+                   'width': first_value(getattr(ds, 'WindowWidth', None))},
+    }
+    return geometry, pixels.astype(np.float32) * slope + intercept
+
+
+def slice_normal(orientation):
+    """Unit normal of the image plane, from ImageOrientationPatient."""
+    if not orientation:
+        return None
+    row, col = orientation[:3], orientation[3:]
+    normal = (row[1] * col[2] - row[2] * col[1],
+              row[2] * col[0] - row[0] * col[2],
+              row[0] * col[1] - row[1] * col[0])
+    norm = math.sqrt(sum(v * v for v in normal))
+    return tuple(v / norm for v in normal) if norm else None
+
+
+def reduce_mean(array, factors):
+    """Average non-overlapping blocks of size `factors`, padding edges by replication."""
+    import numpy as np
+
+    if all(f == 1 for f in factors):
+        return array
+    pad = [(0, -n % f) for n, f in zip(array.shape, factors)]
+    if any(p for _, p in pad):
+        array = np.pad(array, pad, mode='edge')
+    shape = []
+    for n, f in zip(array.shape, factors):
+        shape += [n // f, f]
+    return array.reshape(shape).mean(axis=tuple(range(1, 2 * array.ndim, 2)), dtype=np.float32)
+
+
+def through_plane_factor(factor: int, pixel_spacing: float, slice_spacing: float) -> int:
+    """Power-of-two slice factor that keeps a level near isotropic, never above the in-plane factor."""
+    if not slice_spacing or slice_spacing <= 0:
+        return factor
+    ratio = factor * pixel_spacing / slice_spacing
+    if ratio < 1.5:
+        return 1
+    return min(factor, 2 ** round(math.log2(ratio)))
+
+
+def assemble_volume(session, server: str, experiment: str, scan: str, workers: int = 8):
+    """
+    Fetch and stack a scan's slices, keeping them at 2x in-plane resolution.
+
+    Slices are reduced as they arrive, so the stack is a quarter the size of
+    a full-resolution float volume. Instances whose size or orientation
+    differs from the majority (localizers, derived images) are dropped.
+
+    Returns:
+        (float32 array (z, y/2, x/2), geometry dict) or None if the scan has
+        fewer than two usable slices
+    """
+    import numpy as np
+
+    rows = list_dicom_files(session, server, experiment, scan)
+
+    def load(row):
+        response = session.get(f"{server}{row['URI']}")
+        if response.status_code != 200:
+            return None
+        try:
+            decoded = read_slice(response.content)
+        except Exception:
+            return None
+        if decoded is None:
+            return None
+        geometry, pixels = decoded
+        return geometry, reduce_mean(pixels, (2, 2))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        slices = [s for s in pool.map(load, rows) if s is not None]
+    if len(slices) < 2:
+        return None
+
+    common = Counter((g['shape'], g['orientation']) for g, _ in slices).most_common(1)[0][0]
+    slices = [s for s in slices if (s[0]['shape'], s[0]['orientation']) == common]
+    if len(slices) < 2:
+        return None
+
+    normal = slice_normal(common[1])
+    by_position = normal is not None and all(g['position'] for g, _ in slices)
+    if by_position:
+        def depth(item):
+            return sum(p * n for p, n in zip(item[0]['position'], normal))
+    else:
+        def depth(item):
+            return item[0]['instance']
+    slices.sort(key=depth)
+
+    depths = [depth(s) for s in slices]
+    gaps = sorted(abs(b - a) for a, b in zip(depths, depths[1:]))
+    first = slices[0][0]
+    middle = slices[len(slices) // 2][0]
+    geometry = {
+        'modality': first['modality'],
+        'series_uid': first['series_uid'],
+        'slices': len(slices),
+        'source_shape': [len(slices), *common[0]],
+        'pixel_spacing': first['spacing'],
+        'slice_spacing': gaps[len(gaps) // 2] if by_position else None,
+        'orientation': list(common[1]) if common[1] else None,
+        'origin': first['position'],
+        'integral': all(g['integral'] for g, _ in slices),
+        'window': middle['window'],
+    }
+    return np.stack([pixels for _, pixels in slices]), geometry
+
+
+def write_zarr_array(directory: Path, data, chunk: int = CHUNK, level: int = COMPRESSION_LEVEL):
+    """Write a 3-D array as a Zarr v2 array of zlib-compressed chunks."""
+    import numpy as np
+
+    directory.mkdir(parents=True)
+    chunks = [min(chunk, n) for n in data.shape]
+    (directory / '.zarray').write_text(json.dumps({
+        'zarr_format': 2,
+        'shape': list(data.shape),
+        'chunks': chunks,
+        'dtype': data.dtype.str,
+        'compressor': {'id': 'zlib', 'level': level},
+        'fill_value': 0,
+        'order': 'C',
+        'filters': None,
+        'dimension_separator': '.',
+    }))
+
+    counts = [math.ceil(n / c) for n, c in zip(data.shape, chunks)]
+    for z in range(counts[0]):
+        for y in range(counts[1]):
+            for x in range(counts[2]):
+                block = data[z * chunks[0]:(z + 1) * chunks[0],
+                             y * chunks[1]:(y + 1) * chunks[1],
+                             x * chunks[2]:(x + 1) * chunks[2]]
+                if block.shape != tuple(chunks):
+                    # Zarr stores edge chunks at full size
+                    padded = np.zeros(chunks, dtype=data.dtype)
+                    padded[tuple(slice(0, n) for n in block.shape)] = block
+                    block = padded
+                (directory / f'{z}.{y}.{x}').write_bytes(zlib.compress(np.ascontiguousarray(block).tobytes(), level))
+
+
+def build_pyramid(volume, geometry: dict, out_dir: Path, factors=FACTORS):
+    """
+    Write the downsampled levels of a volume held at 2x in-plane resolution.
+
+    The group is assembled in a temporary sibling directory and renamed into
+    place, so a reader never sees a partial pyramid.
+    """
+    import numpy as np
+
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    temp = Path(tempfile.mkdtemp(dir=out_dir.parent, prefix=f'.{out_dir.name}-'))
+    try:
+        pixel_spacing = min(geometry['pixel_spacing'])
+        dtype = np.dtype('<i2') if geometry['integral'] else np.dtype('<f4')
+        datasets = []
+        level, reduced = volume, (2, 1)  # (in-plane, through-plane) factors already applied
+
+        for index, factor in enumerate(factors, start=1):
+            z_factor = through_plane_factor(factor, pixel_spacing, geometry['slice_spacing'])
+            level = reduce_mean(level, (z_factor // reduced[1], factor // reduced[0], factor // reduced[0]))
+            reduced = (factor, z_factor)
+
+            if dtype.kind == 'i':
+                stored = np.clip(np.rint(level), -32768, 32767).astype(dtype)
+            else:
+                stored = level.astype(dtype)
+            write_zarr_array(temp / str(index), stored)
+
+            spacing = geometry['pixel_spacing']
+            datasets.append({
+                'path': str(index),
+                'coordinateTransformations': [{
+                    'type': 'scale',
+                    'scale': [(geometry['slice_spacing'] or 1.0) * z_factor, spacing[0] * factor, spacing[1] * factor],
+                }],
+            })
+
+        (temp / '.zgroup').write_text(json.dumps({'zarr_format': 2}))
+        (temp / '.zattrs').write_text(json.dumps({
+            'multiscales': [{
+                'version': '0.4',
+                'axes': [{'name': axis, 'type': 'space', 'unit': 'millimeter'} for axis in 'zyx'],
+                'datasets': datasets,
+            }],
+            'xnat': {**geometry, 'created': datetime.now().isoformat(timespec='seconds')},
+        }, indent=2))
+
+        if out_dir.exists():
+            shutil.rmtree(out_dir)
+        os.replace(temp, out_dir)
+    except BaseException:
+        shutil.rmtree(temp, ignore_errors=True)
+        raise
+
+
+def pyramid_path(root: Path, experiment: str, scan: str) -> Path:
+    return Path(root) / experiment / scan
+
+
+def iter_catalog_scans(catalog_dir: Path, since: datetime = None):
+    """
+    Yield (experiment, scan) for DICOM scans listed in an export_catalog.py catalog.
+
+    Args:
+        catalog_dir: Catalog root (project=<ID>/part-*.parquet or .arrow)
+        since: Only experiments inserted at or after this time (None for all)
+    """
+    import pyarrow.compute as pc
+
+    from export_catalog import open_catalog
+
+    dataset = open_catalog(catalog_dir)
+
+    condition = pc.field('resource') == 'DICOM'
+    if since is not None:
+        condition = condition & (pc.field('insert_date') >= since)
+    table = dataset.to_table(columns=['experiment', 'scan'], filter=condition)
+    pairs = table.group_by(['experiment', 'scan']).aggregate([])
+    yield from zip(pairs.column('experiment').to_pylist(), pairs.column('scan').to_pylist())
+
+
+def build_from_catalog(session, server: str, catalog_dir: Path, root: Path, since: datetime = None,
+                       rebuild: bool = False, workers: int = 8) -> dict:
+    """
+    Build pyramids for catalogued scans that do not have one yet.
+
+    Returns:
+        Counts of built, skipped (already present) and failed scans
+    """
+    counts = {'built': 0, 'skipped': 0, 'failed': 0}
+    for experiment, scan in iter_catalog_scans(catalog_dir, since):
+        out_dir = pyramid_path(root, experiment, scan)
+        if not rebuild and (out_dir / '.zattrs').exists():
+            counts['skipped'] += 1
+            continue
+
+        started = time.monotonic()
+        assembled = assemble_volume(session, server, experiment, scan, workers)
+        if assembled is None:
+            counts['failed'] += 1
+            print(f"✗ {experiment}/{scan}: no stackable slices")
+            continue
+        volume, geometry = assembled
+        build_pyramid(volume, geometry, out_dir)
+        counts['built'] += 1
+        print(f"✓ {experiment}/{scan}: {geometry['slices']} slices in {time.monotonic() - started:.1f}s")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build 2x/4x volume pyramids for new scans in the catalog.')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    parser.add_argument('--catalog', default='catalog', help='Catalog written by export_catalog.py')
+    parser.add_argument('--out', default=DEFAULT_ROOT, help="Pyramid root (the proxy's --pyramid-dir)")
+    parser.add_argument('--since-hours', type=float, default=0,
+                        help='Only experiments inserted within this many hours (0 = all without a pyramid)')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild existing pyramids')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent slice downloads per scan')
+    args = parser.parse_args(argv)
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    since = datetime.now() - timedelta(hours=args.since_hours) if args.since_hours else None
+    counts = build_from_catalog(session, args.server, Path(args.catalog), Path(args.out), since,
+                                args.rebuild, args.workers)
+    print(f"✓ {counts['built']:,} built, {counts['skipped']:,} already present, {counts['failed']:,} failed")
+
+
+if __name__ == '__main__':
+    main()
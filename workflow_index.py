@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Local, incrementally synced index of XNAT workflows.
+
+getWorkflows in src/services/xnat-api.ts pages through POST /xapi/workflows
+with days=7, size=50, and every dashboard and Processing view repeats that
+scan. This job keeps the same records in SQLite, indexed by status,
+pipeline, data type and launch time, and each sync pulls only:
+
+    - workflows launched since the cursor (newest first, stopping at the
+      first page that is entirely older than the cursor)
+    - workflows the index still holds in a non-terminal state, refreshed
+      one experiment at a time (dropped if the server no longer lists them)
+
+Polling therefore costs requests in proportion to what changed, not to the
+size of the window, and status questions are answered from the local
+store.
+"""
+import argparse
+import json
+import math
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+from container_logs import is_terminal
+from export_catalog import parse_timestamp
+from find_small_scan import login, password, username, xnat_server
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workflows (
+    wfid INTEGER PRIMARY KEY,
+    external_id TEXT,
+    label TEXT,
+    status TEXT,
+    terminal INTEGER NOT NULL DEFAULT 0,
+    pipeline TEXT,
+    data_type TEXT,
+    launch_time INTEGER,
+    mod_time INTEGER,
+    percent_complete REAL,
+    step_description TEXT,
+    create_user TEXT,
+    details TEXT,
+    sync_type TEXT,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS workflows_status ON workflows (status, launch_time);
+CREATE INDEX IF NOT EXISTS workflows_pipeline ON workflows (pipeline, launch_time);
+CREATE INDEX IF NOT EXISTS workflows_data_type ON workflows (data_type, launch_time);
+CREATE INDEX IF NOT EXISTS workflows_launch ON workflows (launch_time);
+CREATE INDEX IF NOT EXISTS workflows_active ON workflows (terminal, sync_type, external_id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    data_type TEXT PRIMARY KEY,
+    cursor INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+DEFAULT_DATA_TYPE = 'xnat:imageSessionData'
+PAGE_SIZE = 200
+DAY_MS = 86400 * 1000
+# Entries launched this close before the cursor are re-read, in case they were written late
+CURSOR_OVERLAP_MS = 5 * 60 * 1000
+
+
+def open_store(db_path: Path) -> sqlite3.Connection:
+    """Open (creating if needed) a workflow store."""
+    conn = sqlite3.connect(str(db_path))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _pick(item: dict, *keys):
+    for key in keys:
+        value = item.get(key)
+        if value is not None and value != '':
+            return value
+    return None
+
+
+def _millis(value):
+    """Workflow times arrive as epoch milliseconds, numeric strings or 'YYYY-MM-DD HH:MM:SS'."""
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        parsed = parse_timestamp(str(value))
+        return int(parsed.timestamp() * 1000) if parsed else None
+
+
+def normalize_workflow(item: dict) -> tuple:
+    """Map one workflow record (either the xapi or the /data shape) to a store row."""
+    wfid = _pick(item, 'wfid', 'id', 'ID', 'wrk_workflowData_id')
+    status = _pick(item, 'status')
+    details = item.get('details')
+    percent = _pick(item, 'percent_complete', 'percentageComplete', 'percent-complete', 'percentagecomplete')
+    try:
+        percent = float(percent) if percent is not None else None
+    except ValueError:
+        percent = None
+    return (
+        int(wfid),
+        _pick(item, 'externalId', 'external-id', 'id_ext', 'ID_ext'),
+        _pick(item, 'label'),
+        status,
+        int(is_terminal(status)),
+        _pick(item, 'pipelineName', 'pipeline-name', 'pipeline_name'),
+        _pick(item, 'dataType', 'data-type', 'data_type'),
+        _millis(_pick(item, 'launchTime', 'launch_time')),
+        _millis(_pick(item, 'modTime', 'mod_time')),
+        percent,
+        _pick(item, 'stepDescription', 'step-description', 'step_description'),
+        _pick(item, 'createUser', 'create-user', 'create_user'),
+        json.dumps(details) if isinstance(details, dict) else details,
+    )
+
+
+def _rows(data) -> list:
+    """Workflow records from any of the response shapes getWorkflows accepts."""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for key in ('items', 'workflows'):
+            if isinstance(data.get(key), list):
+                return data[key]
+        result = data.get('ResultSet', {}).get('Result')
+        if isinstance(result, list):
+            return result
+    return []
+
+
+class WorkflowIndex:
+    """Keeps a workflow store in step with /xapi/workflows."""
+
+    def __init__(self, session, server: str, conn: sqlite3.Connection, admin: bool = False,
+                 page_size: int = PAGE_SIZE):
+        self.session = session
+        self.server = server
+        self.conn = conn
+        self.admin = admin
+        self.page_size = page_size
+        self.requests = 0
+
+    def fetch_page(self, data_type: str, days: int, page: int, experiment: str = None) -> list:
+        """One POST /xapi/workflows page, newest first."""
+        body = {'data_type': data_type, 'days': days, 'page': page, 'size': self.page_size, 'sortable': True,
+                'sort_col': 'launch_time', 'sort_dir': 'desc'}
+        if experiment:
+            body['id'] = experiment
+        if self.admin:
+            body['admin_workflows'] = True
+        self.requests += 1
+        response = self.session.post(f'{self.server}/xapi/workflows', json=body, timeout=60)
+        response.raise_for_status()
+        return _rows(response.json())
+
+    def _store(self, items: list, data_type: str) -> int:
+        # sync_type records the data_type the entry was listed under (often a supertype of its own)
+        rows = []
+        for item in items:
+            try:
+                rows.append((*normalize_workflow(item), data_type, time.time()))
+            except (TypeError, ValueError):
+                continue  # no usable workflow ID
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO workflows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                  rows)
+        return len(rows)
+
+    def sync_new(self, data_type: str, initial_days: int = 7) -> int:
+        """
+        Pull workflows launched since the data type's cursor; returns rows stored.
+
+        The cursor only advances once every page has been read.
+        """
+        row = self.conn.execute('SELECT cursor FROM sync_state WHERE data_type = ?', (data_type,)).fetchone()
+        now = int(time.time() * 1000)
+        cursor = row[0] if row else now - initial_days * DAY_MS
+        floor = cursor - CURSOR_OVERLAP_MS
+        days = max(1, math.ceil((now - floor) / DAY_MS))
+
+        stored, newest, page = 0, cursor, 1
+        while True:
+            try:
+                items = self.fetch_page(data_type, days, page)
+            except (requests.RequestException, ValueError) as e:
+                # Pages read so far are stored; the cursor stays put so the next sync reads past them again
+                print(f"⚠ Syncing new {data_type} workflows failed on page {page}: {e}")
+                return stored
+            stored += self._store(items, data_type)
+            launches = [_millis(_pick(i, 'launchTime', 'launch_time')) for i in items]
+            launches = [t for t in launches if t is not None]
+            newest = max([newest, *launches])
+            descending = all(a >= b for a, b in zip(launches, launches[1:]))
+            # Sorted newest first: a page that ends before the cursor means the rest is already indexed
+            if len(items) < self.page_size or (descending and launches and launches[-1] < floor):
+                break
+            page += 1
+
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)', (data_type, newest, time.time()))
+        return stored
+
+    def refresh_active(self, data_type: str, synced_before: float = None) -> int:
+        """
+        Re-read workflows the store holds as non-terminal, experiment by experiment.
+
+        Entries synced at or after synced_before (by sync_new in the same
+        pass) are already current and skipped. An experiment's pages are
+        read until all of its active workflows have been seen; ones the
+        server no longer lists at all are dropped from the store.
+        """
+        active = {}
+        for wfid, experiment, launched in self.conn.execute(
+                'SELECT wfid, external_id, launch_time FROM workflows WHERE terminal = 0 AND sync_type = ? '
+                'AND synced_at < ?', (data_type, synced_before or time.time())).fetchall():
+            active.setdefault(experiment, []).append((wfid, launched))
+        now = int(time.time() * 1000)
+        refreshed = 0
+        for experiment, workflows in active.items():
+            if experiment is None:
+                refreshed += self._refresh_orphans(data_type)
+                continue
+            launched = min((t for _, t in workflows if t is not None), default=now)
+            days = max(1, math.ceil((now - launched) / DAY_MS) + 1)
+            try:
+                refreshed += self._refresh_experiment(data_type, experiment, days, {wfid for wfid, _ in workflows})
+            except (requests.RequestException, ValueError) as e:
+                print(f"⚠ Refreshing workflows of {experiment} failed: {e}")
+        return refreshed
+
+    def _refresh_experiment(self, data_type: str, experiment: str, days: int, wanted: set) -> int:
+        stored, seen, page = 0, set(), 1
+        while not wanted <= seen:
+            items = self.fetch_page(data_type, days, page, experiment)
+            stored += self._store(items, data_type)
+            listed = {str(_pick(i, 'wfid', 'id', 'ID', 'wrk_workflowData_id')) for i in items}
+            listed = {int(wfid) for wfid in listed if wfid.isdigit()}
+            new = listed - seen
+            seen |= listed
+            # A short page is the last one; a page with nothing new means the server ignores paging
+            if len(items) < self.page_size or not new:
+                break
+            page += 1
+
+        # Not listed over a window covering its launch: deleted upstream or no longer visible
+        missing = wanted - seen
+        if missing:
+            with self.conn:
+                self.conn.executemany('DELETE FROM workflows WHERE wfid = ?', [(wfid,) for wfid in missing])
+        return stored
+
+    def _refresh_orphans(self, data_type: str) -> int:
+        # Active workflows without an experiment ID can only be read one by one
+        refreshed = 0
+        for wfid, in self.conn.execute('SELECT wfid FROM workflows WHERE terminal = 0 AND external_id IS NULL '
+                                       'AND sync_type = ?', (data_type,)).fetchall():
+            self.requests += 1
+            try:
+                response = self.session.get(f'{self.server}/data/workflows/{wfid}', params={'format': 'json'},
+                                            timeout=30)
+                response.raise_for_status()
+                items = response.json().get('items', [])
+            except (requests.RequestException, ValueError):
+                continue
+            refreshed += self._store([{'wfid': wfid, **i.get('data_fields', i)} for i in items[:1]], data_type)
+        return refreshed
+
+    def sync(self, data_types=(DEFAULT_DATA_TYPE,), initial_days: int = 7) -> dict:
+        """Run one incremental sync; returns rows pulled and requests made."""
+        self.requests = 0
+        new = refreshed = 0
+        for data_type in data_types:
+            started = time.time()
+            new += self.sync_new(data_type, initial_days)
+            refreshed += self.refresh_active(data_type, started)
+        return {'new': new, 'refreshed': refreshed, 'requests': self.requests}
+
+
+def query(conn: sqlite3.Connection, status: str = None, pipeline: str = None, data_type: str = None,
+          experiment: str = None, since_ms: int = None, active: bool = False, limit: int = 50) -> list:
+    """
+    Answer a workflow status question from the store, newest first.
+
+    Returns:
+        Dicts with the store's columns
+    """
+    clauses, params = [], []
+    for column, value in (('status', status), ('pipeline', pipeline), ('data_type', data_type),
+                          ('external_id', experiment)):
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    if since_ms is not None:
+        clauses.append('launch_time >= ?')
+        params.append(since_ms)
+    if active:
+        clauses.append('terminal = 0')
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    cursor = conn.execute(f'SELECT * FROM workflows {where} ORDER BY launch_time DESC LIMIT ?', (*params, limit))
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+def status_counts(conn: sqlite3.Connection, since_ms: int = None) -> list:
+    """(pipeline, status, count) for workflows launched since since_ms."""
+    return conn.execute('SELECT pipeline, status, COUNT(*) FROM workflows WHERE launch_time >= ? '
+                        'GROUP BY pipeline, status ORDER BY pipeline, status', (since_ms or 0,)).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sync XNAT workflows into a local index and query it.')
+    parser.add_argument('--db', default='workflows.sqlite', help='Workflow store')
+    parser.add_argument('--data-type', action='append', dest='data_types',
+                        help=f'Workflow data type (repeatable; default {DEFAULT_DATA_TYPE})')
+    parser.add_argument('--initial-days', type=int, default=7, help='History pulled on the first sync')
+    parser.add_argument('--admin', action='store_true', help='Include every user\'s workflows (admin only)')
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help='Keep syncing at this interval')
+    parser.add_argument('--no-sync', action='store_true', help='Only query the local store')
+    parser.add_argument('--status', help='Query: workflows with this status')
+    parser.add_argument('--pipeline', help='Query: workflows of this pipeline')
+    parser.add_argument('--experiment', help='Query: workflows of this experiment')
+    parser.add_argument('--active', action='store_true', help='Query: non-terminal workflows only')
+    parser.add_argument('--hours', type=float, default=24 * 7, help='Query window (default: 7 days)')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    args = parser.parse_args(argv)
+
+    conn = open_store(Path(args.db))
+    data_types = args.data_types or [DEFAULT_DATA_TYPE]
+
+    if not args.no_sync:
+        try:
+            session = login(args.server, args.username, args.password)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+        index = WorkflowIndex(session, args.server, conn, args.admin)
+        while True:
+            started = time.monotonic()
+            try:
+                stats = index.sync(data_types, args.initial_days)
+                print(f"✓ {stats['new']:,} new/updated, {stats['refreshed']:,} refreshed in "
+                      f"{time.monotonic() - started:.1f}s ({stats['requests']:,} requests)")
+            except Exception as e:  # one failed pass must not stop the watcher
+                if not args.watch:
+                    raise
+                print(f"⚠ Sync failed: {e}")
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+
+    since_ms = int((time.time() - args.hours * 3600) * 1000)
+    if args.status or args.pipeline or args.experiment or args.active:
+        for wf in query(conn, args.status, args.pipeline, None, args.experiment, since_ms, args.active):
+            launched = time.strftime('%Y-%m-%d %H:%M', time.localtime(wf['launch_time'] / 1000)) \
+                if wf['launch_time'] else '?'
+            print(f"  {wf['wfid']:>8}  {launched}  {wf['status'] or '?':<14} {wf['pipeline'] or '?':<30} "
+                  f"{wf['external_id'] or ''}")
+    else:
+        for pipeline, status, count in status_counts(conn, since_ms):
+            print(f"  {pipeline or '?':<40} {status or '?':<16} {count:>7,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,355 @@
+"""
+Request-level instrumentation for Python XNAT traffic.
+
+instrument(session) attaches a response hook that records, per method and
+normalized endpoint template (e.g. /data/archive/experiments/{experiment}/scans/{scan}/resources/DICOM/files),
+the request count, status codes, bytes sent and received, and a latency
+histogram with log-linear (HDR-style) buckets. Latency runs until the
+response body has been read: streamed bodies are counted as the caller
+reads them and recorded when they are exhausted or closed. Requests that
+fail without a response (connection errors, timeouts) are recorded under
+status 0 when the session is a ThrottledSession. Metrics can be exported on
+demand or at process exit as JSON or Prometheus text format.
+
+Set XNAT_METRICS_JSON and/or XNAT_METRICS_PROM to file paths to have the
+default registry written automatically when the process exits.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlparse
+
+# Collection segment -> placeholder used for the identifier that follows it
+COLLECTIONS = {
+    'projects': '{project}',
+    'subjects': '{subject}',
+    'experiments': '{experiment}',
+    'scans': '{scan}',
+    'assessors': '{assessor}',
+    'reconstructions': '{reconstruction}',
+    'containers': '{container}',
+    'commands': '{command}',
+    'wrappers': '{wrapper}',
+    'users': '{user}',
+    'workflows': '{workflow}',
+}
+
+# Latency histogram: SUB_BUCKETS linear steps within each power of two from
+# 2^MIN_EXPONENT (~1 ms) to 2^MAX_EXPONENT (~65 s) seconds.
+MIN_EXPONENT = -10
+MAX_EXPONENT = 6
+SUB_BUCKETS = 4
+
+
+def _bucket_bounds() -> list:
+    bounds = []
+    for exponent in range(MIN_EXPONENT, MAX_EXPONENT):
+        base = 2.0 ** exponent
+        for step in range(SUB_BUCKETS):
+            bounds.append(base * (1 + step / SUB_BUCKETS))
+    bounds.append(2.0 ** MAX_EXPONENT)
+    return bounds
+
+
+BUCKET_BOUNDS = _bucket_bounds()
+
+
+def normalize_endpoint(url: str) -> str:
+    """
+    Reduce a request URL to a low-cardinality endpoint template.
+
+    Identifiers after known collection segments become placeholders, and
+    everything under /files/ collapses to {file}. Resource labels are kept
+    since they are what distinguishes DICOM listings from other resources.
+
+    Args:
+        url: Request URL
+
+    Returns:
+        Path template without query string
+    """
+    segments = [s for s in urlparse(url).path.split('/') if s]
+    template = []
+    placeholder = None
+
+    for segment in segments:
+        if placeholder:
+            template.append(placeholder)
+            placeholder = None
+        elif template and template[-1] == 'files':
+            template.append('{file}')
+            break
+        elif segment.isdigit():
+            template.append('{id}')
+        else:
+            template.append(segment)
+            placeholder = COLLECTIONS.get(segment)
+
+    return '/' + '/'.join(template)
+
+
+class Histogram:
+    """Fixed log-linear latency histogram."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def quantile(self, fraction: float) -> float:
+        """Return the upper bound of the bucket holding the given quantile."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+
+class EndpointStats:
+    """Counters for one method + endpoint template."""
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = Histogram()
+
+    def as_dict(self) -> dict:
+        return {
+            'requests': self.requests,
+            'statuses': {str(code): count for code, count in sorted(self.statuses.items())},
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'latency_seconds': {
+                'sum': round(self.latency.total, 6),
+                'max': round(self.latency.max, 6),
+                'p50': round(self.latency.quantile(0.50), 6),
+                'p95': round(self.latency.quantile(0.95), 6),
+                'p99': round(self.latency.quantile(0.99), 6),
+            },
+        }
+
+
+class RequestMetrics:
+    """Thread-safe registry of per-endpoint request statistics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, method: str, url: str, status: int, seconds: float, bytes_in: int = 0, bytes_out: int = 0):
+        """
+        Record one completed request.
+
+        Args:
+            method: HTTP method
+            url: Request URL
+            status: HTTP status code (0 for connection errors)
+            seconds: Time until the response body was read (or the request failed)
+            bytes_in: Response body bytes
+            bytes_out: Request body bytes
+        """
+        key = (method.upper(), normalize_endpoint(url))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats()
+            stats.requests += 1
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            stats.latency.record(seconds)
+
+    def to_dict(self) -> dict:
+        """Return all statistics, slowest endpoints (by total latency) first."""
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda kv: kv[1].latency.total, reverse=True)
+            return {
+                'endpoints': [
+                    {'method': method, 'endpoint': endpoint, **stats.as_dict()}
+                    for (method, endpoint), stats in items
+                ]
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Render the registry in Prometheus text exposition format."""
+        lines = [
+            '# HELP xnat_requests_total XNAT requests by endpoint and status.',
+            '# TYPE xnat_requests_total counter',
+        ]
+        with self._lock:
+            items = sorted(self._stats.items())
+
+            for (method, endpoint), stats in items:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'xnat_requests_total{{method="{method}",endpoint="{endpoint}",status="{status}"}} {count}')
+
+            for name, attr, help_text in (
+                ('xnat_response_bytes_total', 'bytes_in', 'Response body bytes received.'),
+                ('xnat_request_bytes_total', 'bytes_out', 'Request body bytes sent.'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (method, endpoint), stats in items:
+                    lines.append(f'{name}{{method="{method}",endpoint="{endpoint}"}} {getattr(stats, attr)}')
+
+            lines.append('# HELP xnat_request_duration_seconds Time until the response body was read.')
+            lines.append('# TYPE xnat_request_duration_seconds histogram')
+            for (method, endpoint), stats in items:
+                labels = f'method="{method}",endpoint="{endpoint}"'
+                cumulative = 0
+                for bound, count in zip(BUCKET_BOUNDS, stats.latency.counts):
+                    cumulative += count
+                    lines.append(f'xnat_request_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+                lines.append(f'xnat_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.latency.count}')
+                lines.append(f'xnat_request_duration_seconds_sum{{{labels}}} {stats.latency.total:.6f}')
+                lines.append(f'xnat_request_duration_seconds_count{{{labels}}} {stats.latency.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, json_path: str = None, prom_path: str = None):
+        """Write the registry to a JSON and/or Prometheus text file."""
+        if json_path:
+            with open(json_path, 'w') as f:
+                f.write(self.to_json())
+        if prom_path:
+            with open(prom_path, 'w') as f:
+                f.write(self.to_prometheus())
+
+    def print_summary(self, limit: int = 5):
+        """Print the endpoints that account for the most request time."""
+        endpoints = self.to_dict()['endpoints'][:limit]
+        if not endpoints:
+            return
+        print("Slowest endpoints (total request time):")
+        for row in endpoints:
+            latency = row['latency_seconds']
+            print(f"   {latency['sum']:8.2f}s  {row['requests']:6d} req  p95 {latency['p95'] * 1000:7.1f} ms  "
+                  f"{row['method']} {row['endpoint']}")
+
+
+_default_metrics = RequestMetrics()
+
+
+def default_metrics() -> RequestMetrics:
+    """Return the process-wide metrics registry."""
+    return _default_metrics
+
+
+def _record_when_consumed(response, record):
+    """Count a streamed body as it is read; record once it is exhausted or the response is closed."""
+    raw = response.raw
+    received = 0
+    recorded = threading.Lock()
+
+    def finish():
+        if recorded.acquire(blocking=False):
+            record(received)
+
+    # iter_content() and raw.stream() read through raw.read, or raw.read_chunked for chunked bodies
+    read = raw.read
+
+    def counting_read(*args, **kwargs):
+        nonlocal received
+        data = read(*args, **kwargs)
+        received += len(data)
+        if not data:
+            finish()
+        return data
+
+    raw.read = counting_read
+    if hasattr(raw, 'read_chunked'):
+        read_chunked = raw.read_chunked
+
+        def counting_read_chunked(*args, **kwargs):
+            nonlocal received
+            for chunk in read_chunked(*args, **kwargs):
+                received += len(chunk)
+                yield chunk
+            finish()
+
+        raw.read_chunked = counting_read_chunked
+
+    close = response.close
+
+    def close_and_record():
+        try:
+            close()
+        finally:
+            finish()
+
+    response.close = close_and_record
+
+
+def _response_hook(metrics: RequestMetrics):
+    def hook(response, *args, **kwargs):
+        request = response.request
+        body = request.body or b''
+        bytes_out = len(body) if isinstance(body, (bytes, str)) else int(request.headers.get('Content-Length') or 0)
+        # Hooks run once headers are in; the body is read after this point
+        headers_at = time.monotonic()
+
+        def record(bytes_in: int):
+            seconds = response.elapsed.total_seconds() + time.monotonic() - headers_at
+            metrics.record(request.method, request.url, response.status_code, seconds, bytes_in, bytes_out)
+
+        if kwargs.get('stream') and response.raw is not None:
+            _record_when_consumed(response, record)
+        else:
+            record(len(response.content or b''))
+        return response
+
+    return hook
+
+
+def _failure_hook(metrics: RequestMetrics):
+    def hook(method: str, url: str, seconds: float, error: Exception):
+        metrics.record(method, url, 0, seconds)
+
+    return hook
+
+
+def instrument(session, metrics: RequestMetrics = None):
+    """
+    Record every response of a requests session.
+
+    Args:
+        session: requests.Session to instrument
+        metrics: Registry to record into (default: the process-wide registry)
+
+    Returns:
+        The same session
+    """
+    metrics = metrics or _default_metrics
+    session.hooks['response'].append(_response_hook(metrics))
+    if hasattr(session, 'failure_hooks'):  # ThrottledSession reports requests that got no response
+        session.failure_hooks.append(_failure_hook(metrics))
+    return session
+
+
+def _export_at_exit():
+    json_path = os.environ.get('XNAT_METRICS_JSON')
+    prom_path = os.environ.get('XNAT_METRICS_PROM')
+    if json_path or prom_path:
+        _default_metrics.write(json_path, prom_path)
+
+
+atexit.register(_export_at_exit)
@@ -0,0 +1,1034 @@
+#!/usr/bin/env python3
+"""
+Caching reverse proxy for XNAT in front of the deployed /morpheus/ build.
+
+    /morpheus/...    served from the production build (dist/morpheus)
+    everything else  proxied to XNAT; an /api/xnat prefix is stripped, so
+                     dev-style and production-style URLs both work
+
+Archived file downloads (.../experiments/{e}/scans/{s}/resources/{r}/files/{name})
+are immutable once archived, so their bodies are kept in a disk cache with
+LRU eviction by total bytes and Range requests are answered from it.
+Prearchive paths and everything else are streamed through untouched.
+
+A cached body is only served to a user who has been shown to have access
+to its experiment: the first hit per (session, experiment) sends a HEAD for
+the file upstream with the user's own cookie/credentials, and the answer
+is remembered for --auth-ttl seconds. Files reached through project paths
+are cached and authorized per project, subject and experiment, because an
+experiment label there is only unique within its project.
+
+Concurrent misses for the same file share one upstream fetch (single
+flight): the body is written to a temp file that every waiter tails. Once
+a few files of a series have been requested, the remaining files of that
+series are prefetched on a small worker pool (--prefetch-after).
+
+The XAPI scan snapshot URL is answered with a thumbnail rendered from the
+scan's middle slice (see scan_snapshots.py) and cached under
+<cache-dir>/snapshots; ?size= and ?format=webp|png select the variant.
+
+Volume pyramids built by volume_pyramids.py are served read-only under
+/_pyramids/<experiment>/<scan>/ after the same access check.
+
+/_site/stats and /_site/totalCounts answer the dashboards from the
+document site_stats.py maintains, aggregated over the projects the
+caller's own /data/projects listing shows.
+"""
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from xnat_standin import parse_range
+from xnat_stream import iter_result_rows
+
+DEFAULT_UPSTREAM = os.environ.get('VITE_XNAT_PROXY_TARGET') or 'http://demo02.xnatworks.io'
+DEFAULT_CACHE_BYTES = 20 * 1024 ** 3
+CHUNK_SIZE = 256 * 1024
+# (connect, read) seconds for the access lookups a request waits on before it is answered
+LOOKUP_TIMEOUT = (5, 30)
+
+# Headers that describe a single hop and must not be forwarded
+HOP_BY_HOP = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+    'transfer-encoding', 'upgrade', 'host',
+}
+
+SNAPSHOT = re.compile(
+    r'^/xapi/projects/(?P<project>[^/]+)/experiments/(?P<experiment>[^/]+)/scan/(?P<scan>[^/]+)/snapshot$'
+)
+
+PYRAMID = re.compile(r'^/_pyramids/(?P<experiment>[^/]+)/(?P<scan>[^/]+)/(?P<path>[^?]+)$')
+
+ARCHIVED_FILE = re.compile(
+    r'^/data(?:/archive)?(?:/projects/(?P<project>[^/]+)/subjects/(?P<subject>[^/]+))?'
+    r'/experiments/(?P<experiment>[^/]+)/scans/(?P<scan>[^/]+)'
+    r'/resources/(?P<resource>[^/]+)/files/(?P<name>[^?]+)$'
+)
+
+
+def experiment_scope(match) -> str:
+    """
+    Identify the experiment a matched URL addresses.
+
+    Accession IDs are unique site-wide and stand alone; on project paths the
+    experiment may be a label, which is only unique within its project and
+    subject, so those are kept in the scope.
+    """
+    experiment = unquote(match.group('experiment'))
+    if match.group('project') is None:
+        return experiment
+    return '/'.join(('projects', unquote(match.group('project')), 'subjects', unquote(match.group('subject')),
+                     'experiments', experiment))
+
+
+def experiment_path(scope: str) -> str:
+    """REST path (below /data/archive/) of the experiment an experiment_scope names."""
+    return quote(scope if scope.startswith('projects/') else f'experiments/{scope}')
+
+
+def cache_key(match) -> str:
+    """Identify an archived file independently of the URL form used to reach it."""
+    return '/'.join([experiment_scope(match)] + [unquote(match.group(g)) for g in ('scan', 'resource', 'name')])
+
+
+class DiskCache:
+    """
+    Byte-bounded LRU cache of immutable response bodies on local disk.
+
+    Each entry is a body file plus a small JSON sidecar holding its key and
+    content type. The in-memory index is rebuilt from the sidecars on start,
+    oldest access time first.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _paths(self, key: str):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / digest, self.directory / f'{digest}.json'
+
+    def _load(self):
+        entries = []
+        for meta_path in self.directory.glob('*.json'):
+            body_path = meta_path.with_suffix('')
+            try:
+                meta = json.loads(meta_path.read_text())
+                stat = body_path.stat()
+            except (OSError, ValueError):
+                meta_path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_atime, meta['key'], {**meta, 'size': stat.st_size}))
+
+        for _, key, meta in sorted(entries, key=lambda entry: entry[0]):
+            self._entries[key] = meta
+            self.total_bytes += meta['size']
+        self._evict()
+
+    def get(self, key: str):
+        """Return (body path, metadata) for a cached key, or None."""
+        with self._lock:
+            meta = self._entries.get(key) or self._adopt(key)
+            if meta is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._paths(key)[0], meta
+
+    def _adopt(self, key: str):
+        # Entries committed by another process (e.g. snapshot pre-generation) are picked up on lookup
+        body_path, meta_path = self._paths(key)
+        try:
+            meta = {**json.loads(meta_path.read_text()), 'size': body_path.stat().st_size}
+        except (OSError, ValueError):
+            return None
+        self._entries[key] = meta
+        self.total_bytes += meta['size']
+        self._evict()
+        return self._entries.get(key)
+
+    def begin(self):
+        """Open a temporary file for a body being fetched."""
+        return tempfile.NamedTemporaryFile(dir=self.directory, prefix='.incoming-', delete=False)
+
+    def commit(self, key: str, temp_path: str, content_type: str):
+        """
+        Move a fully fetched body into the cache and evict to stay under the byte budget.
+
+        Returns:
+            The cached body path, or None if the body exceeds the whole budget
+            (the temp file is then left for the caller to discard)
+        """
+        body_path, meta_path = self._paths(key)
+        size = os.path.getsize(temp_path)
+        if size > self.max_bytes:
+            return None
+
+        meta = {'key': key, 'content_type': content_type, 'size': size}
+        with self._lock:
+            os.replace(temp_path, body_path)
+            meta_path.write_text(json.dumps(meta))
+            previous = self._entries.pop(key, None)
+            if previous:
+                self.total_bytes -= previous['size']
+            self._entries[key] = meta
+            self.total_bytes += size
+            self._evict()
+        return body_path
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def discard(self, temp_path: str):
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, meta = self._entries.popitem(last=False)
+            self.total_bytes -= meta['size']
+            for path in self._paths(key):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class ExpiringMap:
+    """
+    Thread-safe map whose entries expire `ttl` seconds after they were stored.
+
+    Entries are kept in storage order, so expired ones are dropped from the
+    front on every put, and the oldest go first once `max_entries` is reached.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 100_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def put(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, now + self.ttl)
+            while self._entries:
+                _, expires = next(iter(self._entries.values()))
+                if expires > now and len(self._entries) <= self.max_entries:
+                    break
+                self._entries.popitem(last=False)
+
+
+class AccessCache:
+    """Remembers which (credential, experiment) pairs XNAT has recently authorized."""
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 100_000):
+        self.ttl = ttl
+        self._decisions = ExpiringMap(ttl, max_entries)
+
+    def get(self, credential: str, experiment: str):
+        return self._decisions.get((credential, experiment))
+
+    def put(self, credential: str, experiment: str, allowed: bool):
+        self._decisions.put((credential, experiment), allowed)
+
+
+class ProjectListCache:
+    """Remembers, per credential, the set of project IDs XNAT listed as visible."""
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10_000):
+        self.ttl = ttl
+        self._projects = ExpiringMap(ttl, max_entries)
+
+    def get(self, credential: str):
+        return self._projects.get(credential)
+
+    def put(self, credential: str, projects: frozenset):
+        self._projects.put(credential, projects)
+
+
+class Flight:
+    """
+    One upstream fetch of an archived file, shared by every request for it.
+
+    The body is written to a temp file as it arrives; readers tail that file,
+    so each waiter streams at transfer speed rather than waiting for the end.
+    """
+
+    def __init__(self, key: str, path: str):
+        self.key = key
+        self.path = path
+        self.status = None
+        self.content_type = None
+        self.content_length = None
+        self.error_body = b''
+        self.written = 0
+        self.done = False
+        self.failed = False
+        self.cond = threading.Condition()
+
+    def open_reader(self):
+        """Open the body for reading at its current location (temp or cache)."""
+        with self.cond:
+            return open(self.path, 'rb')
+
+    def wait_started(self):
+        with self.cond:
+            while self.status is None and not self.failed:
+                self.cond.wait()
+
+    def read(self, reader, position: int, size: int = CHUNK_SIZE) -> bytes:
+        """Return the next bytes at position, blocking until they are written; b'' at the end."""
+        with self.cond:
+            while self.written <= position and not self.done:
+                self.cond.wait()
+            available = self.written - position
+        if available <= 0:
+            return b''
+        reader.seek(position)
+        return reader.read(min(size, available))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent GETs of the same archived file into one upstream fetch.
+
+    Each fetch runs in its own thread, independent of the client that
+    started it, and is committed to the disk cache when complete.
+    """
+
+    def __init__(self, session, cache: DiskCache):
+        self.session = session
+        self.cache = cache
+        self.coalesced = 0
+        self.fetches = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, url: str, headers: dict, wait: bool = False):
+        """
+        Join the flight for key, or start one.
+
+        Args:
+            key: Cache key of the file
+            url: Upstream URL
+            headers: Upstream request headers (the originator's credentials)
+            wait: Run a new fetch in the calling thread instead of a new one
+
+        Returns:
+            (flight, reader, started): flight is None if the body is already
+            cached; reader is an open file positioned at 0; started is True
+            if this call created the flight
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, flight.open_reader(), False
+            if self.cache.contains(key):
+                return None, None, False
+
+            temp = self.cache.begin()
+            temp.close()
+            flight = self._flights[key] = Flight(key, temp.name)
+            self.fetches += 1
+
+        reader = None if wait else flight.open_reader()
+        if wait:
+            self._fetch(flight, url, headers)
+        else:
+            threading.Thread(target=self._fetch, args=(flight, url, headers), daemon=True).start()
+        return flight, reader, True
+
+    def _fetch(self, flight: Flight, url: str, headers: dict):
+        committed = None
+        try:
+            response = self.session.get(url, headers=headers, stream=True)
+            with response:
+                with flight.cond:
+                    flight.status = response.status_code
+                    flight.content_type = response.headers.get('Content-Type', 'application/octet-stream')
+                    flight.content_length = response.headers.get('Content-Length')
+                    if response.status_code != 200:
+                        flight.error_body = response.content
+                    flight.cond.notify_all()
+
+                if response.status_code == 200:
+                    with open(flight.path, 'ab') as body:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            body.write(chunk)
+                            body.flush()
+                            with flight.cond:
+                                flight.written += len(chunk)
+                                flight.cond.notify_all()
+
+            with flight.cond:
+                if flight.status == 200:
+                    committed = self.cache.commit(flight.key, flight.path, flight.content_type)
+                    if committed:
+                        flight.path = str(committed)
+        except (requests.RequestException, OSError) as e:
+            with flight.cond:
+                flight.failed = True
+                flight.error_body = f'Upstream error: {e}'.encode()
+        finally:
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+            with self._lock:
+                self._flights.pop(flight.key, None)
+            if not committed:
+                # Readers that already opened the temp file keep their handle
+                self.cache.discard(flight.path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'in_flight': len(self._flights), 'fetches': self.fetches, 'coalesced': self.coalesced}
+
+
+_TRIGGERED = object()
+
+
+class Prefetcher:
+    """
+    Warms the cache with the rest of a series once a few of its instances are requested.
+
+    After `threshold` distinct files of one scan resource have been asked
+    for, the resource listing is fetched with the requesting user's
+    credentials and every uncached file is pulled through SingleFlight on a
+    small worker pool, so viewer requests that arrive later join or hit them.
+    """
+
+    def __init__(self, flights: SingleFlight, threshold: int = 3, workers: int = 4, ttl: float = 600.0):
+        self.flights = flights
+        self.threshold = threshold
+        self.ttl = ttl
+        self.prefetched = 0
+        # Per series: the file names requested so far, or _TRIGGERED until the ttl allows another prefetch
+        self._seen = ExpiringMap(ttl)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch') if threshold else None
+
+    def note(self, upstream: str, match, headers: dict):
+        """Record a request for one file of a series and trigger prefetch when warranted."""
+        if not self._pool:
+            return
+        scope = experiment_scope(match)
+        scan, resource = (unquote(match.group(g)) for g in ('scan', 'resource'))
+        series = (scope, scan, resource)
+
+        with self._lock:
+            names = self._seen.get(series)
+            if names is _TRIGGERED:
+                return
+            names = (names or frozenset()) | {match.group('name')}
+            if len(names) < self.threshold:
+                self._seen.put(series, names)
+                return
+            self._seen.put(series, _TRIGGERED)
+
+        listing = (f'{upstream}/data/archive/{experiment_path(scope)}/scans/{quote(scan)}'
+                   f'/resources/{quote(resource)}/files')
+        self._pool.submit(self._prefetch_series, listing, series, dict(headers))
+
+    def _prefetch_series(self, listing_url: str, series: tuple, headers: dict):
+        try:
+            response = self.flights.session.get(listing_url, params={'format': 'json'}, headers=headers, stream=True)
+        except requests.RequestException:
+            return
+        with response:
+            if response.status_code != 200:
+                return
+            rows = list(iter_result_rows(response.iter_content(CHUNK_SIZE)))
+
+        upstream = listing_url.split('/data/', 1)[0]
+        headers = {k: v for k, v in headers.items() if k.lower() not in ('range', 'accept-encoding')}
+        headers['Accept-Encoding'] = 'identity'
+        for row in rows:
+            name = row.get('URI', '').split('/files/', 1)[-1] or row.get('Name')
+            key = '/'.join(series + (unquote(name),))
+            if self.flights.cache.contains(key):
+                continue
+            self._pool.submit(self._prefetch_file, key, f"{upstream}{row['URI']}", headers)
+
+    def _prefetch_file(self, key: str, url: str, headers: dict):
+        _, _, started = self.flights.acquire(key, url, headers, wait=True)
+        if started:
+            with self._lock:
+                self.prefetched += 1
+
+
+class LengthRequired(Exception):
+    """A request body uses a transfer coding the proxy cannot forward."""
+
+
+class RequestBody:
+    """
+    A client request body of known length, read from the socket as requests sends it upstream.
+
+    Defining __len__ lets requests forward it with a Content-Length instead
+    of buffering it or switching to chunked encoding.
+    """
+
+    def __init__(self, stream, length: int):
+        self.stream = stream
+        self.length = self.remaining = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size) if size else b''
+        self.remaining -= len(data)
+        if size and not data:
+            self.remaining = 0
+            raise requests.exceptions.ChunkedEncodingError('Client closed the request body early')
+        return data
+
+    def __iter__(self):
+        while self.remaining:
+            yield self.read(CHUNK_SIZE)
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'XNATCachingProxy/1.0'
+
+    upstream = DEFAULT_UPSTREAM
+    session = None
+    cache = None
+    access = None
+    visible = None
+    flights = None
+    prefetcher = None
+    snapshots = None
+    pyramid_root = None
+    site_stats = None
+    static_root = None
+    quiet = False
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    # Routing -------------------------------------------------------------
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_HEAD(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def do_PUT(self):
+        self._dispatch()
+
+    def do_DELETE(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        parsed = urlparse(self.path)
+
+        if self.static_root and parsed.path.startswith('/morpheus'):
+            return self._serve_static(parsed.path)
+
+        if parsed.path == '/_proxy/stats':
+            return self._send_json({**self.cache.stats(), **self.flights.stats(),
+                                    'prefetched': self.prefetcher.prefetched,
+                                    'snapshots': self.snapshots.stats() if self.snapshots else None})
+
+        upstream_path = re.sub(r'^/api/xnat', '', self.path) or '/'
+
+        if urlparse(upstream_path).path in ('/_site/stats', '/_site/totalCounts') and self.site_stats:
+            return self._serve_site_stats(urlparse(upstream_path).path)
+
+        match = PYRAMID.match(urlparse(upstream_path).path)
+        if match and self.pyramid_root and self.command in ('GET', 'HEAD'):
+            return self._serve_pyramid(match)
+
+        match = SNAPSHOT.match(urlparse(upstream_path).path)
+        if self.command == 'GET' and match and self.snapshots:
+            return self._serve_snapshot(upstream_path, match)
+
+        match = ARCHIVED_FILE.match(urlparse(upstream_path).path)
+        if self.command == 'GET' and match and not urlparse(upstream_path).query:
+            return self._serve_archived(upstream_path, match)
+
+        self._pass_through(upstream_path)
+
+    # Upstream ------------------------------------------------------------
+
+    def _upstream_headers(self) -> dict:
+        return {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP}
+
+    def _request_body(self):
+        """The client's request body as a stream for requests, or None when there is none."""
+        encoding = self.headers.get('Transfer-Encoding', '').strip().lower()
+        if encoding == 'chunked':
+            return self._dechunked_body()
+        if encoding and encoding != 'identity':
+            raise LengthRequired(encoding)
+        length = int(self.headers.get('Content-Length') or 0)
+        return RequestBody(self.rfile, length) if length else None
+
+    def _dechunked_body(self):
+        """Yield a chunked request body's data; requests re-chunks it upstream."""
+        while True:
+            line = self.rfile.readline(65537)
+            try:
+                size = int(line.split(b';', 1)[0], 16)
+            except ValueError:
+                self.close_connection = True
+                raise requests.exceptions.ChunkedEncodingError(f'Malformed chunk size line: {line[:40]!r}')
+            if not size:
+                # Skip trailers up to the blank line that ends the body
+                while self.rfile.readline(65537).strip():
+                    pass
+                return
+            remaining = size
+            while remaining:
+                data = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    self.close_connection = True
+                    raise requests.exceptions.ChunkedEncodingError('Client closed a chunked body early')
+                remaining -= len(data)
+                yield data
+            self.rfile.readline()
+
+    def _credential(self) -> str:
+        cookie = self.headers.get('Cookie', '')
+        match = re.search(r'JSESSIONID=([^;]+)', cookie)
+        token = (match.group(1) if match else '') + '|' + self.headers.get('Authorization', '')
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _pass_through(self, upstream_path: str, headers: dict = None):
+        try:
+            body = self._request_body()
+        except LengthRequired as e:
+            self.close_connection = True
+            return self._send_error(411, f'Unsupported Transfer-Encoding: {e}')
+        try:
+            response = self.session.request(
+                self.command, self.upstream + upstream_path, headers=headers or self._upstream_headers(),
+                data=body, stream=True, allow_redirects=False,
+            )
+        except requests.RequestException as e:
+            self.close_connection = True
+            return self._send_error(502, f'Upstream error: {e}')
+        if isinstance(body, RequestBody) and body.remaining:
+            # Upstream answered before reading everything; the rest cannot be told apart from the next request
+            self.close_connection = True
+
+        with response:
+            self.send_response(response.status_code)
+            # iteritems keeps repeated headers such as Set-Cookie separate
+            raw_headers = response.raw.headers
+            for name, value in getattr(raw_headers, 'iteritems', raw_headers.items)():
+                if name.lower() not in HOP_BY_HOP:
+                    self.send_header(name, value)
+            chunked = 'content-length' not in response.headers and self.command != 'HEAD' \
+                and response.status_code not in (204, 304)
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            if self.command == 'HEAD':
+                return
+            for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                if chunked:
+                    self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+                else:
+                    self.wfile.write(chunk)
+            if chunked:
+                self.wfile.write(b'0\r\n\r\n')
+
+    def _authorized(self, upstream_path: str, scope: str) -> bool:
+        credential = self._credential()
+        allowed = self.access.get(credential, scope)
+        if allowed is None:
+            try:
+                response = self.session.head(self.upstream + upstream_path, headers=self._upstream_headers(),
+                                             allow_redirects=False, timeout=LOOKUP_TIMEOUT)
+                allowed = response.status_code == 200
+            except requests.RequestException:
+                return False
+            self.access.put(credential, scope, allowed)
+        return allowed
+
+    # Cached archived files -----------------------------------------------
+
+    def _serve_archived(self, upstream_path: str, match):
+        key = cache_key(match)
+        scope = experiment_scope(match)
+        cached = self.cache.get(key)
+
+        if cached is None and not self.headers.get('Range'):
+            # Cache identity bodies so Content-Length and Range offsets stay meaningful
+            headers = {k: v for k, v in self._upstream_headers().items() if k.lower() != 'accept-encoding'}
+            headers['Accept-Encoding'] = 'identity'
+            flight, reader, started = self.flights.acquire(key, self.upstream + upstream_path, headers)
+
+            if flight is not None:
+                with reader:
+                    if not started and not self._authorized(upstream_path, scope):
+                        return self._pass_through(upstream_path)
+                    self._send_flight(flight, reader, started, scope)
+                self.prefetcher.note(self.upstream, match, headers)
+                return
+            cached = self.cache.get(key)
+
+        if cached is None:
+            # Partial misses are not worth a full upstream fetch
+            return self._pass_through(upstream_path)
+
+        if not self._authorized(upstream_path, scope):
+            # Let XNAT produce the real 401/403 for this user
+            return self._pass_through(upstream_path)
+        self._send_cached(*cached)
+        self.prefetcher.note(self.upstream, match, self._upstream_headers())
+
+    def _send_flight(self, flight: Flight, reader, started: bool, scope: str):
+        flight.wait_started()
+
+        if flight.failed or flight.status != 200:
+            if started:
+                self.access.put(self._credential(), scope, False)
+            status = 502 if flight.failed else flight.status
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain' if flight.failed else flight.content_type)
+            self.send_header('Content-Length', str(len(flight.error_body)))
+            self.end_headers()
+            self.wfile.write(flight.error_body)
+            return
+
+        if started:
+            self.access.put(self._credential(), scope, True)
+
+        self.send_response(200)
+        self.send_header('Content-Type', flight.content_type)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('X-Cache', 'MISS' if started else 'COALESCED')
+        chunked = flight.content_length is None
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', flight.content_length)
+        self.end_headers()
+
+        position = 0
+        while True:
+            chunk = flight.read(reader, position)
+            if not chunk:
+                break
+            position += len(chunk)
+            self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n' if chunked else chunk)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+        if flight.failed:
+            # Upstream died mid-body; drop the connection so the client sees a short read
+            self.close_connection = True
+
+    def _send_cached(self, body_path: Path, meta: dict):
+        size = meta['size']
+        byte_range = parse_range(self.headers.get('Range'), size)
+        if byte_range == 'invalid':
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start, end = byte_range or (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', meta['content_type'])
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Cache-Control', 'private, max-age=31536000, immutable')
+        self.send_header('X-Cache', 'HIT')
+        self.send_header('Content-Length', str(end - start + 1))
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+
+        with open(body_path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    # Rendered snapshots --------------------------------------------------
+
+    def _serve_snapshot(self, upstream_path: str, match):
+        experiment, scan = unquote(match.group('experiment')), unquote(match.group('scan'))
+        if not self._authorized(f'/data/archive/experiments/{experiment}/scans', experiment):
+            return self._pass_through(upstream_path)
+
+        query = parse_qs(urlparse(upstream_path).query)
+        fmt = (query.get('format') or [''])[0].lower()
+        if fmt not in ('webp', 'png'):
+            fmt = 'webp' if 'image/webp' in self.headers.get('Accept', '') else 'png'
+        size = (query.get('size') or [None])[0]
+
+        try:
+            snapshot = self.snapshots.get(self.session, self.upstream, experiment, scan, size, fmt,
+                                          headers=self._upstream_headers())
+        except requests.RequestException:
+            snapshot = None
+        if snapshot is None:
+            # Nothing renderable here (non-DICOM scan, unsupported syntax); let XNAT try
+            return self._pass_through(upstream_path)
+
+        body_path, meta, rendered = snapshot
+        self.send_response(200)
+        self.send_header('Content-Type', meta['content_type'])
+        self.send_header('Content-Length', str(meta['size']))
+        self.send_header('Cache-Control', 'private, max-age=86400')
+        self.send_header('Vary', 'Accept')
+        self.send_header('X-Cache', 'MISS' if rendered else 'HIT')
+        self.end_headers()
+        self.wfile.write(body_path.read_bytes())
+
+    # Volume pyramids -----------------------------------------------------
+
+    def _serve_pyramid(self, match):
+        experiment, scan = unquote(match.group('experiment')), unquote(match.group('scan'))
+        if not self._authorized(f'/data/archive/experiments/{experiment}/scans', experiment):
+            return self._send_error(403, 'Access denied')
+
+        group = (self.pyramid_root / experiment / scan).resolve()
+        target = (group / unquote(match.group('path'))).resolve()
+        if not str(target).startswith(str(self.pyramid_root.resolve()) + os.sep) or not target.is_file():
+            return self._send_error(404, 'No pyramid for this scan')
+
+        body = target.read_bytes()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json' if target.name.startswith('.z') else 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'private, max-age=86400')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    # Site statistics -----------------------------------------------------
+
+    def _visible_projects(self):
+        """Project IDs the caller's own /data/projects listing shows, or None if XNAT refuses it."""
+        credential = self._credential()
+        visible = self.visible.get(credential)
+        if visible is None:
+            with self.session.get(self.upstream + '/data/projects', params={'format': 'json', 'columns': 'ID'},
+                                  headers=self._upstream_headers(), stream=True, timeout=LOOKUP_TIMEOUT) as response:
+                if response.status_code != 200:
+                    return None
+                visible = frozenset(row.get('ID') for row in iter_result_rows(response.iter_content(CHUNK_SIZE)))
+            self.visible.put(credential, visible)
+        return visible
+
+    def _serve_site_stats(self, path: str):
+        try:
+            visible = self._visible_projects()
+        except requests.RequestException as e:
+            return self._send_error(504, f'Project list lookup failed: {e}')
+        if visible is None:
+            return self._send_error(401, 'Not authenticated')
+        payload = self.site_stats.view(visible) if path == '/_site/stats' else self.site_stats.total_counts(visible)
+        if payload is None:
+            return self._send_error(503, 'Site statistics have not been generated yet (run site_stats.py)')
+        self._send_json(payload)
+
+    # Local responses -----------------------------------------------------
+
+    def _serve_static(self, path: str):
+        relative = unquote(path[len('/morpheus'):]).lstrip('/')
+        target = (self.static_root / relative).resolve()
+        root = self.static_root.resolve()
+        if not target.is_relative_to(root) or not target.is_file():
+            # Client-side routes fall back to the SPA entry point
+            target = root / 'index.html'
+
+        body = target.read_bytes()
+        self.send_response(200)
+        self.send_header('Content-Type', mimetypes.guess_type(str(target))[0] or 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_json(self, payload, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        body = message.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _NoCookies(DefaultCookiePolicy):
+    """Cookies belong to the browser; the proxy's upstream session never stores them."""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+def make_proxy(upstream: str, cache: DiskCache, static_root: Path = None, host: str = '127.0.0.1',
+               port: int = 8080, auth_ttl: float = 300.0, pool_size: int = 64, quiet: bool = False,
+               prefetch_after: int = 3, prefetch_workers: int = 4, snapshots=None, pyramid_root: Path = None,
+               site_stats=None):
+    """
+    Build the caching proxy server.
+
+    Args:
+        upstream: XNAT base URL
+        cache: DiskCache for archived files
+        static_root: Directory holding the /morpheus/ build (None to disable)
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        auth_ttl: Seconds an access decision (per user and experiment) or a user's project list is reused
+        pool_size: Upstream connection pool size
+        quiet: Suppress per-request logging
+        prefetch_after: Distinct files of a series requested before the rest is prefetched (0 disables)
+        prefetch_workers: Concurrent prefetch downloads
+        snapshots: scan_snapshots.SnapshotRenderer answering the XAPI snapshot URL (None to pass it through)
+        pyramid_root: Directory of volume_pyramids.py output served under /_pyramids/ (None to disable)
+        site_stats: site_stats.SiteStats answering /_site/stats and /_site/totalCounts (None to disable)
+
+    Returns:
+        A ThreadingHTTPServer
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.cookies.set_policy(_NoCookies())
+
+    flights = SingleFlight(session, cache)
+    handler = type('BoundProxyHandler', (ProxyHandler,), {
+        'upstream': upstream.rstrip('/'),
+        'session': session,
+        'cache': cache,
+        'access': AccessCache(auth_ttl),
+        'visible': ProjectListCache(auth_ttl),
+        'flights': flights,
+        'prefetcher': Prefetcher(flights, prefetch_after, prefetch_workers),
+        'snapshots': snapshots,
+        'pyramid_root': Path(pyramid_root) if pyramid_root else None,
+        'site_stats': site_stats,
+        'static_root': Path(static_root) if static_root else None,
+        'quiet': quiet,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caching reverse proxy for XNAT and the /morpheus/ build.')
+    parser.add_argument('--upstream', default=DEFAULT_UPSTREAM, help='XNAT base URL')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--static', default='dist/morpheus', help='Production build directory')
+    parser.add_argument('--cache-dir', default='.xnat-cache')
+    parser.add_argument('--cache-gb', type=float, default=DEFAULT_CACHE_BYTES / 1024 ** 3)
+    parser.add_argument('--auth-ttl', type=float, default=300.0, help='Seconds to reuse an access check')
+    parser.add_argument('--prefetch-after', type=int, default=3,
+                        help='Prefetch the rest of a series after this many of its files are requested (0 = off)')
+    parser.add_argument('--prefetch-workers', type=int, default=4)
+    parser.add_argument('--snapshot-cache-mb', type=float, default=1024.0,
+                        help='Render scan snapshots into <cache-dir>/snapshots with this budget (0 = pass through)')
+    parser.add_argument('--pyramid-dir', help='Volume pyramids from volume_pyramids.py (default: <cache-dir>/pyramids)')
+    parser.add_argument('--site-stats', help='Statistics document from site_stats.py '
+                                             '(default: <cache-dir>/site-stats.json)')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    cache = DiskCache(Path(args.cache_dir), int(args.cache_gb * 1024 ** 3))
+    snapshots = None
+    if args.snapshot_cache_mb:
+        from scan_snapshots import SnapshotRenderer
+        snapshot_cache = DiskCache(Path(args.cache_dir) / 'snapshots', int(args.snapshot_cache_mb * 1024 ** 2))
+        snapshots = SnapshotRenderer(snapshot_cache, file_cache=cache)
+    from site_stats import SiteStats
+    site_stats = SiteStats(Path(args.site_stats or Path(args.cache_dir) / 'site-stats.json'))
+    static_root = Path(args.static) if Path(args.static).is_dir() else None
+    server = make_proxy(args.upstream, cache, static_root, args.host, args.port, args.auth_ttl, quiet=args.quiet,
+                        prefetch_after=args.prefetch_after, prefetch_workers=args.prefetch_workers,
+                        snapshots=snapshots, pyramid_root=Path(args.pyramid_dir or Path(args.cache_dir) / 'pyramids'),
+                        site_stats=site_stats)
+
+    print("=" * 50)
+    print("XNAT Caching Proxy")
+    print("=" * 50)
+    print(f"Upstream: {args.upstream}")
+    print(f"Cache: {args.cache_dir} ({cache.total_bytes / 1024 ** 3:.1f} of {args.cache_gb:.1f} GB used)")
+    print(f"App: {'/morpheus/ from ' + args.static if static_root else 'not served (build missing)'}")
+    print(f"URL: http://{args.host}:{server.server_address[1]}/morpheus/")
+    print("=" * 50)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
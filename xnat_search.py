@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Run XNAT search XML or saved searches page by page.
+
+The web client's search() and savedSearch() take the whole result set in one
+response, which for site-wide searches means a huge body and, often, a
+timeout. This executor asks XNAT to cache the search server-side
+(POST /data/search?cache=true) and then reads the cached result in pages
+from /data/search/{id}?offset=...&limit=...:
+
+    - with totalRecords known, pages are fetched in parallel on the pooled
+      session and yielded in order, a bounded number ahead of the consumer
+    - without it, pages are read one after another until a short page
+    - a saved search is run from its stored definition, so editing the
+      search also changes its cache key
+    - rows can be consumed as a generator or written to CSV or Parquet
+    - complete results are kept as gzipped JSON lines under --cache-dir,
+      keyed by server, user and search definition, and reused for --ttl
+      seconds
+
+Servers that ignore the paging parameters return everything in the first
+response; that response is used as is. Paging of the cached search is
+checked on the second page, before any row is handed to the consumer: a
+response holding the whole result is used as is, and one that repeats the
+first page fails the run before anything has been written.
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import requests
+
+from download_scans import configure_pool
+from find_small_scan import login, password, username, xnat_server
+from xnat_stream import iter_result_rows
+from xnat_throttle import DISTRESS_STATUSES, TransientError, with_retries
+
+DEFAULT_CACHE_DIR = '.xnat-cache/searches'
+DEFAULT_TTL = 900.0
+PAGE_SIZE = 1000
+BATCH_ROWS = 50_000
+
+
+def search_key(server: str, definition: str, scope: str = '') -> str:
+    """Cache key for one search definition as run by one user against one server."""
+    return hashlib.sha256('\0'.join((server.rstrip('/'), scope or '', definition.strip())).encode()).hexdigest()
+
+
+class SearchCache:
+    """
+    Complete search results on disk, one gzipped JSON-lines file per key.
+
+    Results are only committed once fully read, so an interrupted run never
+    leaves a truncated entry behind.
+    """
+
+    def __init__(self, root: Path, ttl: float = DEFAULT_TTL):
+        self.root = Path(root)
+        self.ttl = ttl
+
+    def path(self, key: str) -> Path:
+        return self.root / f'{key}.jsonl.gz'
+
+    def get(self, key: str):
+        """Iterator over the cached rows, or None if there is no fresh entry."""
+        path = self.path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                return None
+        except FileNotFoundError:
+            return None
+        return self._read(path)
+
+    @staticmethod
+    def _read(path: Path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def store(self, key: str, rows):
+        """Yield rows unchanged while writing them through to the cache."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        os.close(fd)
+        committed = False
+        try:
+            with gzip.open(tmp, 'wt', encoding='utf-8', compresslevel=6) as f:
+                for row in rows:
+                    f.write(json.dumps(row, separators=(',', ':')) + '\n')
+                    yield row
+            os.replace(tmp, self.path(key))
+            committed = True
+        finally:
+            if not committed:
+                os.unlink(tmp)
+
+    def purge(self) -> int:
+        """Delete expired entries; return how many were removed."""
+        removed = 0
+        for path in self.root.glob('*.jsonl.gz'):
+            try:
+                if time.time() - path.stat().st_mtime > self.ttl:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+class SearchExecutor:
+    """
+    Runs searches against one XNAT server with server-side paging.
+
+    Args:
+        session: Authenticated session, sized with configure_pool for workers
+        server: Base URL of the XNAT server
+        page_size: Rows per page request
+        workers: Pages fetched concurrently when the total is known
+        cache: SearchCache for complete results (None to always query)
+        scope: Distinguishes cache entries of users with different access
+        retries: Attempts per page on connection errors, 429 and 5xx
+    """
+
+    def __init__(self, session, server: str, page_size: int = PAGE_SIZE, workers: int = 4,
+                 cache: SearchCache = None, scope: str = '', retries: int = 4):
+        self.session = session
+        self.server = server.rstrip('/')
+        self.page_size = page_size
+        self.workers = workers
+        self.cache = cache
+        self.scope = scope
+        self.retries = retries
+        self.stats = {'pages': 0, 'rows': 0, 'cache_hits': 0}
+
+    def _request(self, method: str, url: str, **kwargs):
+        def call():
+            try:
+                response = self.session.request(method, url, timeout=600, **kwargs)
+            except requests.RequestException as e:
+                raise TransientError(str(e)) from e
+            if response.status_code in DISTRESS_STATUSES:
+                response.close()
+                raise TransientError(f'HTTP {response.status_code}')
+            response.raise_for_status()
+            return response
+        return with_retries(call, self.retries)[0]
+
+    def saved_definition(self, search_id: str) -> str:
+        """The stored search XML of a saved search."""
+        response = self._request('GET', f'{self.server}/data/search/saved/{search_id}', params={'format': 'xml'})
+        if not response.text.lstrip().startswith('<'):
+            raise ValueError(f'Saved search {search_id} did not return its XML definition')
+        return response.text
+
+    def _first_page(self, definition: str):
+        response = self._request('POST', f'{self.server}/data/search', data=definition.encode('utf-8'),
+                                 headers={'Content-Type': 'application/xml'},
+                                 params={'format': 'json', 'cache': 'true', 'offset': 0, 'limit': self.page_size})
+        result_set = response.json().get('ResultSet', {})
+        rows = result_set.get('Result') or []
+        try:
+            total = int(result_set.get('totalRecords'))
+        except (TypeError, ValueError):
+            total = None
+        self.stats['pages'] += 1
+        return rows, result_set.get('ID'), total
+
+    def _page(self, cache_id: str, offset: int) -> list:
+        response = self._request('GET', f'{self.server}/data/search/{cache_id}', stream=True,
+                                 params={'format': 'json', 'offset': offset, 'limit': self.page_size})
+        with response:
+            rows = list(iter_result_rows(response.iter_content(chunk_size=256 * 1024)))
+        self.stats['pages'] += 1
+        return rows
+
+    def _checked_page(self, cache_id: str, offset: int) -> list:
+        rows = self._page(cache_id, offset)
+        if len(rows) > self.page_size:
+            raise RuntimeError(f'Server stopped paging cached search {cache_id} at offset {offset}')
+        return rows
+
+    def _pages(self, definition: str):
+        rows, cache_id, total = self._first_page(definition)
+        if not cache_id or len(rows) != self.page_size:
+            yield rows
+            return  # complete, or a server that does not page
+
+        # The second page is read before anything is yielded, so a server that ignores
+        # paging on cached searches is caught before the consumer has written any rows
+        second = self._page(cache_id, len(rows))
+        if len(second) > self.page_size:
+            yield second  # the whole result, from the start
+            return
+        if second == rows:
+            raise RuntimeError(f'Server ignored the offset for cached search {cache_id}')
+        yield rows
+        yield second
+        if len(second) < self.page_size:
+            return
+
+        if total is None:
+            offset = 2 * self.page_size
+            while True:
+                rows = self._checked_page(cache_id, offset)
+                yield rows
+                if len(rows) < self.page_size:
+                    return
+                offset += len(rows)
+
+        offsets = iter(range(2 * self.page_size, total, self.page_size))
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='search')
+        try:
+            # Keep a bounded window in flight; results are yielded in page order
+            pending = deque(pool.submit(self._checked_page, cache_id, offset)
+                            for offset in islice(offsets, self.workers * 2))
+            while pending:
+                rows = pending.popleft().result()
+                for offset in islice(offsets, 1):
+                    pending.append(pool.submit(self._checked_page, cache_id, offset))
+                yield rows
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _rows(self, definition: str):
+        for rows in self._pages(definition):
+            self.stats['rows'] += len(rows)
+            yield from rows
+
+    def run(self, definition: str):
+        """
+        Yield the rows of a search XML document.
+
+        Args:
+            definition: xdat:bundle / xdat:search XML
+
+        Yields:
+            One ResultSet row (dict) at a time
+        """
+        if self.cache is None:
+            yield from self._rows(definition)
+            return
+        key = search_key(self.server, definition, self.scope)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            yield from cached
+            return
+        yield from self.cache.store(key, self._rows(definition))
+
+    def run_saved(self, search_id: str):
+        """Yield the rows of a saved search, run from its stored definition."""
+        yield from self.run(self.saved_definition(search_id))
+
+
+def write_csv(rows, out) -> int:
+    """Write rows to a CSV file object; columns are those of the first row."""
+    writer = None
+    count = 0
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(out, fieldnames=list(row), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_parquet(rows, path: Path, batch_rows: int = BATCH_ROWS) -> int:
+    """Write rows to a Parquet file as string columns, one record batch at a time."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = schema = None
+    columns = {}
+    count = pending = 0
+
+    def flush():
+        writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    try:
+        for row in rows:
+            if writer is None:
+                schema = pa.schema([(str(name), pa.string()) for name in row])
+                columns = {name: [] for name in schema.names}
+                writer = pq.ParquetWriter(str(path), schema, compression='zstd')
+            for name in schema.names:
+                value = row.get(name)
+                columns[name].append(None if value is None else str(value))
+            count += 1
+            pending += 1
+            if pending >= batch_rows:
+                flush()
+                pending = 0
+        if writer is not None and pending:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run an XNAT search with server-side paging.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--xml', help='Search XML file')
+    source.add_argument('--saved', help='Saved search ID')
+    parser.add_argument('--out', default='-', help='Output .csv or .parquet file (default: CSV on stdout)')
+    parser.add_argument('--server', default=xnat_server)
+    parser.add_argument('--username', default=username)
+    parser.add_argument('--password', default=password)
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    parser.add_argument('--workers', type=int, default=4, help='Pages fetched concurrently')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL, help='Seconds to reuse a cached result')
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args(argv)
+
+    try:
+        session = login(args.server, args.username, args.password)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    configure_pool(session, args.workers)
+
+    cache = None
+    if not args.no_cache:
+        cache = SearchCache(Path(args.cache_dir), args.ttl)
+        cache.purge()
+    executor = SearchExecutor(session, args.server, args.page_size, args.workers, cache, scope=args.username)
+    rows = executor.run_saved(args.saved) if args.saved else executor.run(Path(args.xml).read_text())
+
+    start = time.monotonic()
+    if args.out == '-':
+        count = write_csv(rows, sys.stdout)
+    elif args.out.endswith('.parquet'):
+        count = write_parquet(rows, Path(args.out))
+    else:
+        with open(args.out, 'w', newline='', encoding='utf-8') as f:
+            count = write_csv(rows, f)
+    source = 'cache' if executor.stats['cache_hits'] else f"{executor.stats['pages']:,} pages"
+    print(f"✓ {count:,} rows from {source} in {time.monotonic() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
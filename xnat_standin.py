@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Local XNAT stand-in server for offline testing and benchmarking.
+
+Serves the subset of the XNAT REST API used by the Python tools and the
+viewer from an on-disk DICOM corpus laid out as
+
+    <root>/<project>/<subject>/<experiment>/<scan>/<file>.dcm
+
+Supported endpoints:
+    POST /data/JSESSION
+    GET  /data/archive/projects, /data/projects
+    GET  /data/subjects, /data/projects/{project}/subjects
+    GET  /data/archive/projects/{project}/experiments
+    GET  /data/projects/{project}/subjects/{subject}/experiments
+    GET  /data/archive/experiments[?project=...]
+    GET  /data/archive/experiments/{experiment}/scans
+    GET  /data/archive/experiments/{experiment}/scans/{scan}/files
+    GET  /data/archive/experiments/{experiment}/scans/{scan}/resources/DICOM/files[?format=zip]
+    GET  /data/archive/experiments/{experiment}/scans/{scan}/resources/DICOM/files/{name}
+
+The /data/experiments/... and /data/projects/{p}/subjects/{s}/experiments/...
+forms are accepted too, listings honour offset/limit, and an /api/xnat prefix is
+stripped, so the Vite proxy can point here with
+VITE_XNAT_PROXY_TARGET=http://localhost:8090.
+
+Latency, per-connection bandwidth and error injection are configurable and
+seeded, so crawler/downloader/proxy runs are repeatable.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 8090
+SEND_CHUNK = 64 * 1024
+
+_DATA = r'^/data(?:/archive)?'
+_EXPERIMENT = _DATA + r'(?:/projects/[^/]+/subjects/[^/]+)?/experiments/(?P<experiment>[^/]+)'
+_SCAN = _EXPERIMENT + r'/scans/(?P<scan>[^/]+)'
+
+ROUTES = [
+    ('auth', re.compile(r'^/data/JSESSION/?$')),
+    ('projects', re.compile(_DATA + r'/projects/?$')),
+    ('project_experiments', re.compile(_DATA + r'/projects/(?P<project>[^/]+)/experiments/?$')),
+    ('subjects', re.compile(_DATA + r'(?:/projects/(?P<project>[^/]+))?/subjects/?$')),
+    ('subject_experiments', re.compile(_DATA + r'/projects/(?P<project>[^/]+)/subjects/(?P<subject>[^/]+)/experiments/?$')),
+    ('experiments', re.compile(_DATA + r'/experiments/?$')),
+    ('scans', re.compile(_EXPERIMENT + r'/scans/?$')),
+    ('scan_files', re.compile(_SCAN + r'/files/?$')),
+    ('resource_files', re.compile(_SCAN + r'/resources/(?P<resource>[^/]+)/files/?$')),
+    ('file', re.compile(_SCAN + r'/resources/(?P<resource>[^/]+)/files/(?P<name>.+)$')),
+]
+
+
+class DiskSite:
+    """
+    Site hierarchy read from a directory tree.
+
+    Every site implementation exposes the same methods (projects, subjects,
+    experiments, scans, files, file_size, read), returning plain dicts, so
+    the handler does not care where the data comes from. Listing methods
+    may return generators; they are streamed to the client. Unknown parents
+    are reported as None.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._experiments = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._index()
+
+    def _index(self):
+        for project_dir in sorted(p for p in self.root.iterdir() if p.is_dir()):
+            for subject_dir in sorted(p for p in project_dir.iterdir() if p.is_dir()):
+                for exp_dir in sorted(p for p in subject_dir.iterdir() if p.is_dir()):
+                    self._experiments[exp_dir.name] = (project_dir.name, subject_dir.name, exp_dir)
+
+    def projects(self) -> list:
+        return [{'ID': p.name, 'name': p.name, 'secondary_ID': p.name}
+                for p in sorted(self.root.iterdir()) if p.is_dir()]
+
+    def subjects(self, project: str = None) -> list:
+        rows = []
+        for project_dir in sorted(p for p in self.root.iterdir() if p.is_dir()):
+            if project and project_dir.name != project:
+                continue
+            rows.extend({'ID': s.name, 'label': s.name, 'project': project_dir.name,
+                         'URI': f'/data/subjects/{s.name}'}
+                        for s in sorted(project_dir.iterdir()) if s.is_dir())
+        return rows
+
+    def experiments(self, project: str = None, subject: str = None) -> list:
+        rows = []
+        for exp_id, (proj, subj, exp_dir) in self._experiments.items():
+            if (project and proj != project) or (subject and subj != subject):
+                continue
+            rows.append({
+                'ID': exp_id, 'label': exp_id, 'project': proj, 'subject_ID': subj,
+                'xsiType': 'xnat:mrSessionData', 'date': '', 'insert_date': '',
+                'URI': f'/data/experiments/{exp_id}',
+            })
+        return rows
+
+    def scans(self, experiment: str) -> list:
+        entry = self._experiments.get(experiment)
+        if not entry:
+            return None
+        return [{'ID': s.name, 'type': s.name, 'series_description': s.name, 'xsiType': 'xnat:mrScanData',
+                 'URI': f'/data/experiments/{experiment}/scans/{s.name}'}
+                for s in sorted(entry[2].iterdir()) if s.is_dir()]
+
+    def _scan_dir(self, experiment: str, scan: str):
+        entry = self._experiments.get(experiment)
+        if not entry:
+            return None
+        scan_dir = entry[2] / scan
+        return scan_dir if scan_dir.is_dir() else None
+
+    def files(self, experiment: str, scan: str) -> list:
+        scan_dir = self._scan_dir(experiment, scan)
+        if scan_dir is None:
+            return None
+        return [{
+            'Name': f.name, 'Size': str(f.stat().st_size), 'collection': 'DICOM',
+            'file_format': 'DICOM', 'file_content': 'RAW', 'digest': self.digest(experiment, scan, f.name),
+            'URI': f'/data/experiments/{experiment}/scans/{scan}/resources/DICOM/files/{f.name}',
+        } for f in sorted(scan_dir.iterdir()) if f.is_file()]
+
+    def file_size(self, experiment: str, scan: str, name: str):
+        scan_dir = self._scan_dir(experiment, scan)
+        path = scan_dir / name if scan_dir else None
+        if path is None or not path.is_file() or path.resolve().parent != scan_dir.resolve():
+            return None
+        return path.stat().st_size
+
+    def read(self, experiment: str, scan: str, name: str, start: int, length: int) -> bytes:
+        with open(self._scan_dir(experiment, scan) / name, 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+    def digest(self, experiment: str, scan: str, name: str) -> str:
+        key = (experiment, scan, name)
+        with self._lock:
+            if key in self._digests:
+                return self._digests[key]
+        md5 = hashlib.md5()
+        with open(self._scan_dir(experiment, scan) / name, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(chunk)
+        with self._lock:
+            self._digests[key] = md5.hexdigest()
+        return self._digests[key]
+
+
+class Faults:
+    """Seeded latency, bandwidth and error injection shared by all handler threads."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, bandwidth: int = 0,
+                 error_rate: float = 0.0, error_status: int = 503, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            extra = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+    def should_fail(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+class _ThrottledWriter:
+    """File-like wrapper that paces writes to a bytes-per-second budget."""
+
+    def __init__(self, wfile, bandwidth: int):
+        self.wfile = wfile
+        self.bandwidth = bandwidth
+        self.written = 0
+        self.started = time.monotonic()
+
+    def write(self, data: bytes):
+        for offset in range(0, len(data), SEND_CHUNK):
+            chunk = data[offset:offset + SEND_CHUNK]
+            self.wfile.write(chunk)
+            self.written += len(chunk)
+            if self.bandwidth:
+                ahead = self.written / self.bandwidth - (time.monotonic() - self.started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+
+class _NullWriter:
+    """Discards body bytes so HEAD responses share the GET code paths."""
+
+    def write(self, data: bytes):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a single-range 'bytes=a-b' header.
+
+    Returns:
+        (start, end) inclusive, None if no usable range, or 'invalid' if unsatisfiable
+    """
+    match = re.match(r'^bytes=(\d*)-(\d*)$', (header or '').strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(0, size - int(last))
+        end = size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'XNATStandin/1.0'
+
+    site = None
+    faults = Faults()
+    sessions = set()
+    quiet = False
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _route(self):
+        parsed = urlparse(self.path)
+        path = re.sub(r'^/api/xnat', '', parsed.path)
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        for name, pattern in ROUTES:
+            match = pattern.match(path)
+            if match:
+                return name, match.groupdict(), query
+        return None, {}, query
+
+    def _send_json(self, payload, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self._write(body)
+
+    def _send_result_set(self, rows, query: dict = None):
+        if rows is None:
+            return self._send_error(404)
+
+        query = query or {}
+        offset = int(query.get('offset') or 0)
+        limit = int(query['limit']) if query.get('limit') else None
+        if offset or limit is not None:
+            rows = islice(rows, offset, offset + limit if limit is not None else None)
+
+        if isinstance(rows, list):
+            return self._send_json({'ResultSet': {'Result': rows, 'totalRecords': str(len(rows))}})
+
+        # Generated listings can be millions of rows; stream them and close
+        # the connection to delimit the body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        writer = self._body_writer()
+        writer.write(b'{"ResultSet":{"Result":[')
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(('' if count == 0 else ',') + json.dumps(row))
+            count += 1
+            if len(batch) >= 1000:
+                writer.write(''.join(batch).encode())
+                batch = []
+        batch.append(f'],"totalRecords":"{count}"}}}}')
+        writer.write(''.join(batch).encode())
+
+    def _send_error(self, status: int, message: str = ''):
+        body = (message or self.responses.get(status, ('',))[0]).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self._write(body)
+
+    def _body_writer(self):
+        """Return the writer for response bodies (a no-op for HEAD requests)."""
+        if self.command == 'HEAD':
+            return _NullWriter()
+        return _ThrottledWriter(self.wfile, self.faults.bandwidth)
+
+    def _write(self, data: bytes):
+        self._body_writer().write(data)
+
+    def _authenticated(self) -> bool:
+        cookie = self.headers.get('Cookie', '')
+        match = re.search(r'JSESSIONID=([^;]+)', cookie)
+        return bool(self.headers.get('Authorization')) or bool(match and match.group(1) in self.sessions)
+
+    def _begin(self):
+        """Apply injected latency and errors; return the route or None if the request was answered."""
+        self.faults.delay()
+        route, args, query = self._route()
+        if route is None:
+            self._send_error(404)
+            return None
+        if self.faults.should_fail():
+            self._send_error(self.faults.error_status)
+            return None
+        if route != 'auth' and not self._authenticated():
+            self._send_error(401)
+            return None
+        return route, args, query
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        routed = self._begin()
+        if not routed:
+            return
+        route, _, _ = routed
+        if route != 'auth':
+            return self._send_error(405)
+
+        session_id = uuid.uuid4().hex.upper()
+        self.sessions.add(session_id)
+        body = session_id.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Set-Cookie', f'JSESSIONID={session_id}; Path=/; HttpOnly')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self._write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        routed = self._begin()
+        if not routed:
+            return
+        route, args, query = routed
+        site = self.site
+
+        if route == 'projects':
+            self._send_result_set(site.projects(), query)
+        elif route == 'subjects':
+            self._send_result_set(site.subjects(args.get('project') or query.get('project')), query)
+        elif route == 'project_experiments':
+            self._send_result_set(site.experiments(args['project']), query)
+        elif route == 'subject_experiments':
+            self._send_result_set(site.experiments(args['project'], args['subject']), query)
+        elif route == 'experiments':
+            rows = site.experiments(query.get('project'))
+            if query.get('ID'):
+                rows = [r for r in rows if r['ID'] == query['ID']]
+            self._send_result_set(rows, query)
+        elif route == 'scans':
+            self._send_result_set(site.scans(args['experiment']), query)
+        elif route == 'scan_files':
+            self._send_result_set(site.files(args['experiment'], args['scan']), query)
+        elif route == 'resource_files':
+            if query.get('format') == 'zip':
+                self._send_zip(args['experiment'], args['scan'].split(','))
+            else:
+                self._send_result_set(site.files(args['experiment'], args['scan']), query)
+        elif route == 'file':
+            self._send_file(args['experiment'], args['scan'], args['name'])
+        else:
+            self._send_error(405)
+
+    def _send_file(self, experiment: str, scan: str, name: str):
+        size = self.site.file_size(experiment, scan, name)
+        if size is None:
+            return self._send_error(404)
+
+        byte_range = parse_range(self.headers.get('Range'), size)
+        if byte_range == 'invalid':
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start, end = byte_range or (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', 'application/dicom')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+
+        writer = self._body_writer()
+        offset = start
+        while offset <= end:
+            length = min(SEND_CHUNK * 16, end - offset + 1)
+            writer.write(self.site.read(experiment, scan, name, offset, length))
+            offset += length
+
+    def _send_zip(self, experiment: str, scans: list):
+        listings = {scan: self.site.files(experiment, scan) for scan in scans}
+        if any(rows is None for rows in listings.values()):
+            return self._send_error(404)
+
+        # Archive length is unknown up front; close the connection to delimit it
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        if self.command == 'HEAD':
+            return
+
+        writer = self._body_writer()
+        with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for scan, rows in listings.items():
+                for row in rows:
+                    arcname = f"{experiment}/scans/{scan}/resources/DICOM/files/{row['Name']}"
+                    with archive.open(arcname, 'w', force_zip64=True) as entry:
+                        size = int(row['Size'])
+                        offset = 0
+                        while offset < size:
+                            chunk = self.site.read(experiment, scan, row['Name'], offset, SEND_CHUNK * 16)
+                            entry.write(chunk)
+                            offset += len(chunk)
+
+
+def make_server(site, host: str = '127.0.0.1', port: int = DEFAULT_PORT, faults: Faults = None,
+                quiet: bool = False) -> ThreadingHTTPServer:
+    """
+    Build a stand-in server for a site.
+
+    Args:
+        site: DiskSite (or any object with the same methods)
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        faults: Latency/bandwidth/error injection settings
+        quiet: Suppress per-request logging
+
+    Returns:
+        A ThreadingHTTPServer; call serve_forever() or run it in a thread
+    """
+    handler = type('BoundStandinHandler', (StandinHandler,), {
+        'site': site,
+        'faults': faults or Faults(),
+        'sessions': set(),
+        'quiet': quiet,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    """Add the latency/bandwidth/error options shared by stand-in entry points."""
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra uniform random latency (seconds)')
+    parser.add_argument('--bandwidth', type=int, default=0, help='Bytes/second per connection (0 = unlimited)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quiet', action='store_true')
+
+
+def faults_from_args(args) -> Faults:
+    return Faults(args.latency, args.jitter, args.bandwidth, args.error_rate, args.error_status, args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a DICOM corpus through a minimal XNAT REST API.')
+    parser.add_argument('root', help='Corpus root: <project>/<subject>/<experiment>/<scan>/<files>')
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+
+    site = DiskSite(Path(args.root))
+    server = make_server(site, args.host, args.port, faults_from_args(args), args.quiet)
+
+    print("=" * 50)
+    print("XNAT Stand-in Server")
+    print("=" * 50)
+    print(f"Corpus: {args.root} ({len(site.projects())} projects, {len(site.experiments())} experiments)")
+    print(f"URL: http://{args.host}:{server.server_address[1]}")
+    print("=" * 50)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Incremental parsing of XNAT ResultSet listings.
+
+XNAT listings look like {"ResultSet": {"Result": [{...}, {...}], ...}}. For
+/data/experiments or large file listings the body runs to hundreds of MB, so
+rather than response.json() we scan the stream up to the Result array and
+then decode one row at a time as chunks arrive. Memory is bounded by the
+chunk size plus the largest single row, and callers can start processing
+rows while the rest of the body is still in transit.
+"""
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_SEPARATORS = ' \t\n\r,'
+
+
+class _ResultLocator:
+    """
+    Character-level scanner that finds the ResultSet.Result array.
+
+    Only the prefix before the array is scanned this way; rows are decoded
+    with JSONDecoder.raw_decode.
+    """
+
+    def __init__(self):
+        self.in_string = False
+        self.escape = False
+        self.token = []
+        self.last_string = None
+        self.path = []
+        self.awaiting_value_for = None
+
+    def feed(self, text: str, start: int = 0) -> int:
+        """Return the index just past the Result array's '[', or -1 if not seen yet."""
+        for i in range(start, len(text)):
+            ch = text[i]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    self.last_string = ''.join(self.token)
+                else:
+                    self.token.append(ch)
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.token = []
+            elif ch == ':':
+                self.awaiting_value_for = self.last_string
+            elif ch in '{[':
+                key = self.awaiting_value_for
+                if ch == '[' and key == 'Result' and self.path == [None, 'ResultSet']:
+                    return i + 1
+                self.path.append(key)
+                self.awaiting_value_for = None
+            elif ch in '}]':
+                self.path.pop()
+            elif ch == ',':
+                self.awaiting_value_for = None
+
+        return -1
+
+
+def iter_result_rows(chunks):
+    """
+    Yield ResultSet.Result rows from an iterable of raw byte chunks.
+
+    Args:
+        chunks: Iterable of bytes (e.g. response.iter_content())
+
+    Yields:
+        One decoded row (dict) at a time
+    """
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    locator = _ResultLocator()
+    buffer = ''
+    pos = 0
+    in_array = False
+    exhausted = False
+    chunks = iter(chunks)
+
+    while True:
+        if not in_array:
+            found = locator.feed(buffer, pos)
+            if found >= 0:
+                in_array = True
+                buffer = buffer[found:]
+            else:
+                # The locator carries its own state; the scanned prefix can go
+                buffer = ''
+            pos = 0
+
+        if in_array:
+            while True:
+                while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+                    pos += 1
+                if pos < len(buffer) and buffer[pos] == ']':
+                    return
+                if pos >= len(buffer):
+                    break
+                try:
+                    row, end = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if exhausted:
+                        raise
+                    break
+                yield row
+                pos = end
+
+            # Keep only the undecoded tail
+            buffer = buffer[pos:]
+            pos = 0
+
+        if exhausted:
+            if in_array:
+                raise ValueError('Truncated ResultSet: Result array was not closed')
+            return
+
+        try:
+            buffer += utf8.decode(next(chunks))
+        except StopIteration:
+            buffer += utf8.decode(b'', final=True)
+            exhausted = True
+
+
+def iter_results(session, url: str, chunk_size: int = CHUNK_SIZE, **params):
+    """
+    Stream the rows of an XNAT listing.
+
+    Args:
+        session: Authenticated session
+        url: Listing URL
+        chunk_size: Bytes read off the socket at a time
+        **params: Extra query parameters
+
+    Yields:
+        Result rows as they are decoded; nothing if the request failed
+    """
+    with session.get(url, params={'format': 'json', **params}, stream=True) as response:
+        if response.status_code != 200:
+            return
+        yield from iter_result_rows(response.iter_content(chunk_size=chunk_size))
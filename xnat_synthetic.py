@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Synthetic XNAT sites at production scale for the local stand-in server.
+
+SyntheticSite implements the same interface as xnat_standin.DiskSite, but
+nothing is stored: every node's children and every DICOM file are derived
+on demand from a seeded RNG keyed by the node ID. A 10,000-project site
+with millions of files costs a few megabytes of RAM, and repeated runs
+with the same seed see byte-identical data.
+
+Counts per level are drawn from a mean-preserving lognormal distribution;
+--skew controls how heavy the tail is (0 = every node gets the mean).
+DICOM files are minimal explicit-VR little-endian MR/CT/PT images whose
+headers parse with pydicom and whose pixel data is a cheap ramp pattern.
+
+    python xnat_synthetic.py --projects 10000 --files-per-scan 150 --skew 1.2
+"""
+import argparse
+import hashlib
+import math
+import random
+import re
+import struct
+from functools import lru_cache
+
+from xnat_standin import add_fault_arguments, faults_from_args, make_server
+
+EXPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2.1'
+IMPLEMENTATION_CLASS_UID = '2.25.1'
+
+MODALITIES = {
+    # modality: (session xsiType, scan xsiType, SOP class UID, weight)
+    'MR': ('xnat:mrSessionData', 'xnat:mrScanData', '1.2.840.10008.5.1.4.1.1.4', 6),
+    'CT': ('xnat:ctSessionData', 'xnat:ctScanData', '1.2.840.10008.5.1.4.1.1.2', 3),
+    'PT': ('xnat:petSessionData', 'xnat:petScanData', '1.2.840.10008.5.1.4.1.1.128', 1),
+}
+
+MATRIX_SIZES = [((128, 128), 2), ((256, 256), 5), ((512, 512), 3)]
+
+EXPERIMENT_ID = re.compile(r'^(?P<subject>(?P<project>SYN\d{5})_S\d{4})_E\d{2}$')
+
+_LONG_VRS = {'OB', 'OW', 'SQ', 'UN', 'UT'}
+
+
+def uid_for(key: str) -> str:
+    """Deterministic 2.25 UID derived from a key."""
+    return '2.25.' + str(int(hashlib.md5(key.encode()).hexdigest(), 16))
+
+
+def _element(group: int, element: int, vr: str, value) -> bytes:
+    """Encode one explicit-VR little-endian data element."""
+    if isinstance(value, str):
+        pad = b'\0' if vr == 'UI' else b' '
+        value = value.encode('ascii')
+        if len(value) % 2:
+            value += pad
+    header = struct.pack('<HH', group, element) + vr.encode('ascii')
+    if vr in _LONG_VRS:
+        return header + b'\0\0' + struct.pack('<I', len(value)) + value
+    return header + struct.pack('<H', len(value)) + value
+
+
+def _us(value: int) -> bytes:
+    return struct.pack('<H', value)
+
+
+class SyntheticSite:
+    """
+    Lazily generated site hierarchy.
+
+    Args:
+        projects: Number of projects
+        subjects: Mean subjects per project
+        experiments: Mean experiments per subject
+        scans: Mean scans per experiment
+        files: Mean files (instances) per scan
+        skew: Lognormal sigma for per-node counts
+        seed: RNG seed
+        max_files: Upper bound on files per scan
+    """
+
+    def __init__(self, projects: int = 100, subjects: float = 20, experiments: float = 2, scans: float = 5,
+                 files: float = 120, skew: float = 1.0, seed: int = 0, max_files: int = 5000):
+        self.project_count = projects
+        self.means = {'subjects': subjects, 'experiments': experiments, 'scans': scans, 'files': files}
+        self.skew = skew
+        self.seed = seed
+        self.max_files = max_files
+
+    def _rng(self, key: str) -> random.Random:
+        return random.Random(f'{self.seed}:{key}')
+
+    def _count(self, key: str, level: str, upper: int) -> int:
+        mean = self.means[level]
+        if self.skew <= 0:
+            return max(1, min(upper, round(mean)))
+        # mu chosen so the lognormal's mean equals the requested mean
+        mu = math.log(mean) - self.skew ** 2 / 2
+        return max(1, min(upper, round(self._rng(f'{key}:{level}').lognormvariate(mu, self.skew))))
+
+    # Hierarchy -----------------------------------------------------------
+
+    def _project_ids(self):
+        return (f'SYN{n:05d}' for n in range(1, self.project_count + 1))
+
+    def _valid_project(self, project: str) -> bool:
+        return bool(re.match(r'^SYN\d{5}$', project)) and 1 <= int(project[3:]) <= self.project_count
+
+    def _subject_ids(self, project: str):
+        return (f'{project}_S{n:04d}' for n in range(1, self._count(project, 'subjects', 9999) + 1))
+
+    def _experiment_ids(self, subject: str):
+        return (f'{subject}_E{n:02d}' for n in range(1, self._count(subject, 'experiments', 99) + 1))
+
+    def _experiment_info(self, experiment: str):
+        match = EXPERIMENT_ID.match(experiment or '')
+        if not match or not self._valid_project(match.group('project')):
+            return None
+        subject = match.group('subject')
+        if int(subject[-4:]) > self._count(match.group('project'), 'subjects', 9999):
+            return None
+        if int(experiment[-2:]) > self._count(subject, 'experiments', 99):
+            return None
+
+        rng = self._rng(experiment)
+        names = list(MODALITIES)
+        modality = rng.choices(names, weights=[MODALITIES[m][3] for m in names])[0]
+        day = rng.randrange(0, 365 * 10)
+        year, day_of_year = 2015 + day // 365, day % 365
+        month, mday = 1 + day_of_year // 31, 1 + day_of_year % 28
+        return {
+            'project': match.group('project'),
+            'subject': subject,
+            'modality': modality,
+            'date': f'{year:04d}-{month:02d}-{mday:02d}',
+        }
+
+    def _scan_info(self, experiment: str, scan: str):
+        info = self._experiment_info(experiment)
+        if info is None or not scan.isdigit() or not 1 <= int(scan) <= self._count(experiment, 'scans', 99):
+            return None
+        key = f'{experiment}/{scan}'
+        rng = self._rng(key)
+        sizes = [size for size, _ in MATRIX_SIZES]
+        rows, columns = rng.choices(sizes, weights=[w for _, w in MATRIX_SIZES])[0]
+        return {**info, 'key': key, 'rows': rows, 'columns': columns,
+                'files': self._count(key, 'files', self.max_files)}
+
+    # Listing interface ---------------------------------------------------
+
+    def projects(self):
+        return ({'ID': p, 'name': f'Synthetic project {p[3:]}', 'secondary_ID': p} for p in self._project_ids())
+
+    def subjects(self, project: str = None):
+        if project is not None and not self._valid_project(project):
+            return None
+        projects = [project] if project else self._project_ids()
+        return ({'ID': s, 'label': s, 'project': p, 'URI': f'/data/subjects/{s}'}
+                for p in projects for s in self._subject_ids(p))
+
+    def experiments(self, project: str = None, subject: str = None):
+        if project is not None and not self._valid_project(project):
+            return None
+        projects = [project] if project else self._project_ids()
+
+        def rows():
+            for p in projects:
+                subjects = [subject] if subject else self._subject_ids(p)
+                for s in subjects:
+                    for e in self._experiment_ids(s):
+                        info = self._experiment_info(e)
+                        if info is None:
+                            continue
+                        yield {
+                            'ID': e, 'label': e, 'project': p, 'subject_ID': s, 'subject_label': s,
+                            'xsiType': MODALITIES[info['modality']][0], 'date': info['date'],
+                            'insert_date': f"{info['date']} 00:00:00.0", 'URI': f'/data/experiments/{e}',
+                        }
+
+        return rows()
+
+    def scans(self, experiment: str):
+        info = self._experiment_info(experiment)
+        if info is None:
+            return None
+        scan_type = MODALITIES[info['modality']][1]
+        return [{'ID': str(n), 'type': f"{info['modality']} series {n}", 'series_description': f'Series {n}',
+                 'xsiType': scan_type, 'quality': 'usable', 'URI': f'/data/experiments/{experiment}/scans/{n}'}
+                for n in range(1, self._count(experiment, 'scans', 99) + 1)]
+
+    def files(self, experiment: str, scan: str):
+        info = self._scan_info(experiment, scan)
+        if info is None:
+            return None
+        pixel_bytes = info['rows'] * info['columns'] * 2
+        return ({
+            'Name': f'{n:06d}.dcm', 'Size': str(len(self._header(experiment, scan, n)) + pixel_bytes),
+            'collection': 'DICOM', 'file_format': 'DICOM', 'file_content': 'RAW', 'digest': '',
+            'URI': f'/data/experiments/{experiment}/scans/{scan}/resources/DICOM/files/{n:06d}.dcm',
+        } for n in range(1, info['files'] + 1))
+
+    # File content --------------------------------------------------------
+
+    def _instance(self, experiment: str, scan: str, name: str):
+        match = re.match(r'^(\d{6})\.dcm$', name)
+        info = self._scan_info(experiment, scan)
+        if not match or info is None or not 1 <= int(match.group(1)) <= info['files']:
+            return None, None
+        return info, int(match.group(1))
+
+    def file_size(self, experiment: str, scan: str, name: str):
+        info, instance = self._instance(experiment, scan, name)
+        if info is None:
+            return None
+        return len(self._header(experiment, scan, instance)) + info['rows'] * info['columns'] * 2
+
+    def read(self, experiment: str, scan: str, name: str, start: int, length: int) -> bytes:
+        _, instance = self._instance(experiment, scan, name)
+        return self._file_bytes(experiment, scan, instance)[start:start + length]
+
+    @lru_cache(maxsize=4096)
+    def _header(self, experiment: str, scan: str, instance: int) -> bytes:
+        info = self._scan_info(experiment, scan)
+        sop_class = MODALITIES[info['modality']][2]
+        sop_instance = uid_for(f"{info['key']}/{instance}")
+        pixel_length = info['rows'] * info['columns'] * 2
+
+        meta = b''.join([
+            _element(0x0002, 0x0001, 'OB', b'\x00\x01'),
+            _element(0x0002, 0x0002, 'UI', sop_class),
+            _element(0x0002, 0x0003, 'UI', sop_instance),
+            _element(0x0002, 0x0010, 'UI', EXPLICIT_VR_LITTLE_ENDIAN),
+            _element(0x0002, 0x0012, 'UI', IMPLEMENTATION_CLASS_UID),
+        ])
+        dataset = b''.join([
+            _element(0x0008, 0x0016, 'UI', sop_class),
+            _element(0x0008, 0x0018, 'UI', sop_instance),
+            _element(0x0008, 0x0020, 'DA', info['date'].replace('-', '')),
+            _element(0x0008, 0x0060, 'CS', info['modality']),
+            _element(0x0010, 0x0010, 'PN', info['subject']),
+            _element(0x0010, 0x0020, 'LO', info['subject']),
+            _element(0x0020, 0x000D, 'UI', uid_for(experiment)),
+            _element(0x0020, 0x000E, 'UI', uid_for(info['key'])),
+            _element(0x0020, 0x0010, 'SH', experiment[-16:]),
+            _element(0x0020, 0x0011, 'IS', scan),
+            _element(0x0020, 0x0013, 'IS', str(instance)),
+            _element(0x0020, 0x0032, 'DS', f'0\\0\\{instance}'),
+            _element(0x0020, 0x0037, 'DS', '1\\0\\0\\0\\1\\0'),
+            _element(0x0028, 0x0002, 'US', _us(1)),
+            _element(0x0028, 0x0004, 'CS', 'MONOCHROME2'),
+            _element(0x0028, 0x0010, 'US', _us(info['rows'])),
+            _element(0x0028, 0x0011, 'US', _us(info['columns'])),
+            _element(0x0028, 0x0030, 'DS', '1\\1'),
+            _element(0x0028, 0x0100, 'US', _us(16)),
+            _element(0x0028, 0x0101, 'US', _us(12)),
+            _element(0x0028, 0x0102, 'US', _us(11)),
+            _element(0x0028, 0x0103, 'US', _us(0)),
+            _element(0x0028, 0x1050, 'DS', '2048'),
+            _element(0x0028, 0x1051, 'DS', '4096'),
+            struct.pack('<HH', 0x7FE0, 0x0010) + b'OW\0\0' + struct.pack('<I', pixel_length),
+        ])
+        group_length = _element(0x0002, 0x0000, 'UL', struct.pack('<I', len(meta)))
+        return b'\0' * 128 + b'DICM' + group_length + meta + dataset
+
+    @lru_cache(maxsize=64)
+    def _file_bytes(self, experiment: str, scan: str, instance: int) -> bytes:
+        info = self._scan_info(experiment, scan)
+        columns = info['columns']
+        # One 12-bit ramp row, rotated per row and shifted per instance
+        ramp = b''.join(struct.pack('<H', (c * 4096 // columns) & 0x0FFF) for c in range(columns))
+        rows = []
+        for r in range(info['rows']):
+            shift = 2 * ((r + instance) % columns)
+            rows.append(ramp[shift:] + ramp[:shift])
+        return self._header(experiment, scan, instance) + b''.join(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a synthetic XNAT site through the stand-in server.')
+    parser.add_argument('--projects', type=int, default=100)
+    parser.add_argument('--subjects-per-project', type=float, default=20)
+    parser.add_argument('--experiments-per-subject', type=float, default=2)
+    parser.add_argument('--scans-per-experiment', type=float, default=5)
+    parser.add_argument('--files-per-scan', type=float, default=120)
+    parser.add_argument('--max-files-per-scan', type=int, default=5000)
+    parser.add_argument('--skew', type=float, default=1.0, help='Lognormal sigma of per-node counts')
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+
+    site = SyntheticSite(args.projects, args.subjects_per_project, args.experiments_per_subject,
+                         args.scans_per_experiment, args.files_per_scan, args.skew, args.seed,
+                         args.max_files_per_scan)
+    server = make_server(site, args.host, args.port, faults_from_args(args), args.quiet)
+
+    mean_files = (args.projects * args.subjects_per_project * args.experiments_per_subject
+                  * args.scans_per_experiment * args.files_per_scan)
+
+    print("=" * 50)
+    print("Synthetic XNAT Site")
+    print("=" * 50)
+    print(f"Projects: {args.projects:,} (seed {args.seed}, skew {args.skew})")
+    print(f"Expected files: ~{mean_files:,.0f}")
+    print(f"URL: http://{args.host}:{server.server_address[1]}")
+    print("=" * 50)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
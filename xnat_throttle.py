@@ -0,0 +1,287 @@
+"""
+Adaptive concurrency limiting for Python XNAT traffic.
+
+Every request made through a ThrottledSession takes a slot from a shared
+AdaptiveLimiter. Limits are kept per endpoint class (auth, listing, file,
+archive, xapi) and follow AIMD: each healthy response grows the class's limit
+by roughly one slot per round trip, while a 429/5xx response or a windowed p95
+latency above target cuts it multiplicatively. Crawlers and downloaders
+therefore back off before they degrade the server clinicians are using
+through the /api/xnat proxy. TransientError and with_retries are the retry
+helpers the batch jobs share for failures that are worth another attempt.
+
+Defaults can be overridden with environment variables:
+    XNAT_TARGET_P95       target p95 latency in seconds (default 1.0)
+    XNAT_MIN_CONCURRENCY  lowest limit per class (default 1)
+    XNAT_MAX_CONCURRENCY  highest limit per class (default 32)
+"""
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+
+DISTRESS_STATUSES = {429, 500, 502, 503, 504}
+
+# Streamed responses of these classes hold their slot until closed. Streamed
+# listings release at headers so nested crawls cannot deadlock on one class.
+BODY_BOUND_CLASSES = {'file', 'archive'}
+
+
+class TransientError(Exception):
+    """A failure worth retrying (connection error, 429 or 5xx)."""
+
+
+def with_retries(call, attempts: int, base_delay: float = 2.0, before_retry=None):
+    """
+    Run call(), retrying TransientError with exponential backoff.
+
+    before_retry, when given, runs ahead of each retry and may return a
+    result to stop retrying (e.g. the work turned out to be done already).
+
+    Returns:
+        (result, attempts used)
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return call(), attempt
+        except TransientError:
+            if attempt == attempts:
+                raise
+            time.sleep(min(120.0, base_delay * 2 ** (attempt - 1)))
+            if before_retry:
+                settled = before_retry()
+                if settled is not None:
+                    return settled, attempt
+
+
+def classify_endpoint(url: str, params: dict = None) -> str:
+    """
+    Map a request URL to the endpoint class whose limit it shares.
+
+    Args:
+        url: Absolute or relative request URL
+        params: Query parameters passed alongside the URL
+
+    Returns:
+        One of 'auth', 'archive', 'file', 'listing' or 'xapi'
+    """
+    parsed = urlparse(url)
+    path = parsed.path.rstrip('/')
+
+    if path.endswith('/JSESSION'):
+        return 'auth'
+    if 'format=zip' in parsed.query or (params or {}).get('format') == 'zip':
+        return 'archive'
+    if '/xapi/' in path:
+        return 'xapi'
+    if '/files/' in path:
+        return 'file'
+    return 'listing'
+
+
+def percentile(values, fraction: float) -> float:
+    """Return the nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+class _ClassState:
+    """Limit, in-flight count and recent latencies for one endpoint class."""
+
+    def __init__(self, initial: float, window: int):
+        self.limit = initial
+        self.inflight = 0
+        self.latencies = deque(maxlen=window)
+        self.last_decrease = 0.0
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.distress = 0
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter shared by all XNAT requests in a process.
+
+    Args:
+        target_p95: Latency (seconds) above which the limit is cut
+        min_limit: Lowest concurrency per endpoint class
+        max_limit: Highest concurrency per endpoint class
+        initial_limit: Starting concurrency per endpoint class
+        increase: Slots added per round trip while healthy
+        decrease: Factor applied to the limit on distress
+        window: Number of recent latencies used for the p95
+        limits: Optional {endpoint_class: max_limit} overrides
+    """
+
+    def __init__(self, target_p95: float = None, min_limit: int = None, max_limit: int = None,
+                 initial_limit: int = 4, increase: float = 1.0, decrease: float = 0.5,
+                 window: int = 50, limits: dict = None):
+        self.target_p95 = target_p95 if target_p95 is not None else float(os.environ.get('XNAT_TARGET_P95', 1.0))
+        self.min_limit = min_limit if min_limit is not None else int(os.environ.get('XNAT_MIN_CONCURRENCY', 1))
+        self.max_limit = max_limit if max_limit is not None else int(os.environ.get('XNAT_MAX_CONCURRENCY', 32))
+        self.initial_limit = max(self.min_limit, min(initial_limit, self.max_limit))
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.limits = limits or {}
+        self._states = {}
+        self._cond = threading.Condition()
+
+    def _state(self, endpoint_class: str) -> _ClassState:
+        state = self._states.get(endpoint_class)
+        if state is None:
+            initial = min(self.initial_limit, self._ceiling(endpoint_class))
+            state = self._states[endpoint_class] = _ClassState(initial, self.window)
+        return state
+
+    def _ceiling(self, endpoint_class: str) -> int:
+        return self.limits.get(endpoint_class, self.max_limit)
+
+    def acquire(self, endpoint_class: str):
+        """Block until a slot is free for the endpoint class."""
+        with self._cond:
+            while True:
+                state = self._state(endpoint_class)
+                wait = state.blocked_until - time.monotonic()
+                if wait <= 0 and state.inflight < int(state.limit):
+                    state.inflight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, endpoint_class: str, latency: float, status: int, retry_after: float = None):
+        """
+        Return a slot and adjust the limit from the request outcome.
+
+        Args:
+            endpoint_class: Class the slot was taken from
+            latency: Seconds until response headers arrived
+            status: HTTP status code (0 for connection errors)
+            retry_after: Seconds the server asked us to wait, if any
+        """
+        with self._cond:
+            state = self._state(endpoint_class)
+            state.inflight -= 1
+            state.requests += 1
+            now = time.monotonic()
+
+            if status in DISTRESS_STATUSES or status == 0:
+                state.distress += 1
+                self._cut(state, now)
+                if retry_after:
+                    state.blocked_until = max(state.blocked_until, now + retry_after)
+            else:
+                state.latencies.append(latency)
+                if len(state.latencies) >= min(10, self.window) and \
+                        percentile(state.latencies, 0.95) > self.target_p95:
+                    self._cut(state, now)
+                else:
+                    ceiling = self._ceiling(endpoint_class)
+                    state.limit = min(ceiling, state.limit + self.increase / max(state.limit, 1.0))
+
+            self._cond.notify_all()
+
+    def _cut(self, state: _ClassState, now: float):
+        # Requests already in flight when we cut will report the same distress;
+        # one cut per target-latency interval keeps them from collapsing the limit.
+        if now - state.last_decrease < max(self.target_p95, 0.1):
+            return
+        state.limit = max(float(self.min_limit), state.limit * self.decrease)
+        state.last_decrease = now
+        state.latencies.clear()
+
+    def snapshot(self) -> dict:
+        """Return the current limit and counters of every endpoint class."""
+        with self._cond:
+            return {
+                name: {
+                    'limit': round(state.limit, 2),
+                    'inflight': state.inflight,
+                    'requests': state.requests,
+                    'distress': state.distress,
+                    'p95': round(percentile(state.latencies, 0.95), 4) if state.latencies else None,
+                }
+                for name, state in self._states.items()
+            }
+
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+def default_limiter() -> AdaptiveLimiter:
+    """Return the process-wide limiter shared by every ThrottledSession."""
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = AdaptiveLimiter()
+        return _default_limiter
+
+
+def parse_retry_after(value: str):
+    """Return a Retry-After header in seconds (only the delta-seconds form is honoured)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class ThrottledSession(requests.Session):
+    """
+    requests.Session whose requests are admitted by an AdaptiveLimiter.
+
+    Latency is measured to response headers. Streamed file and archive
+    responses keep their slot until they are closed, so concurrent body
+    transfers are bounded too. Callables in failure_hooks are called with
+    (method, url, seconds, error) for requests that raise before a response
+    arrives.
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter = None):
+        super().__init__()
+        self.limiter = limiter or default_limiter()
+        self.failure_hooks = []
+
+    def request(self, method, url, *args, **kwargs):
+        params = kwargs.get('params')
+        endpoint_class = classify_endpoint(url, params if isinstance(params, dict) else None)
+        self.limiter.acquire(endpoint_class)
+        start = time.monotonic()
+        response = None
+
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.RequestException as error:
+            for hook in self.failure_hooks:
+                hook(method, url, time.monotonic() - start, error)
+            raise
+        finally:
+            # Whatever was raised, a request that never produced a response gives its slot back
+            if response is None:
+                self.limiter.release(endpoint_class, time.monotonic() - start, 0)
+
+        latency = time.monotonic() - start
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        released = threading.Lock()
+
+        def release():
+            if released.acquire(blocking=False):
+                self.limiter.release(endpoint_class, latency, response.status_code, retry_after)
+
+        if kwargs.get('stream') and endpoint_class in BODY_BOUND_CLASSES:
+            close = response.close
+
+            def close_and_release():
+                try:
+                    close()
+                finally:
+                    release()
+
+            response.close = close_and_release
+        else:
+            release()
+
+        return response